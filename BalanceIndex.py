@@ -0,0 +1,64 @@
+class BalanceIndex:
+    """ Balances of all addresses (public keys) in the chain, updated block by block, so a balance is looked up
+        without scanning the chain. Every transaction moves its amount from the sender to the recipient.
+        The sender also pays the fee, which nobody receives until miners are rewarded """
+    def __init__(self, balances=None):
+        self.balances = balances if balances is not None else {} # Address -> balance, addresses with zero balance aren't stored
+
+    @staticmethod
+    def address(public_key):
+        # Senders are stored as PEM bytes, recipients as PEM strings
+        return public_key.decode('utf-8') if isinstance(public_key, bytes) else public_key
+
+    def get_balance(self, public_key):
+        return self.balances.get(BalanceIndex.address(public_key), 0)
+
+    def connect_block(self, block):
+        for transaction in block.data:
+            self.add(BalanceIndex.address(transaction.sender_public_key_bytes), -(transaction.amount + transaction.fee))
+            self.add(BalanceIndex.address(transaction.recipient_public_key), transaction.amount)
+
+    def disconnect_block(self, block):
+        for transaction in reversed(block.data):
+            self.add(BalanceIndex.address(transaction.recipient_public_key), -transaction.amount)
+            self.add(BalanceIndex.address(transaction.sender_public_key_bytes), transaction.amount + transaction.fee)
+
+    def add(self, address, amount):
+        balance = self.balances.get(address, 0) + amount
+        if balance == 0:
+            self.balances.pop(address, None)
+        else:
+            self.balances[address] = balance
+
+    def can_apply(self, transactions, disconnected_blocks=()):
+        """ Checks that senders of the transactions have enough funds after the disconnected blocks are rolled back.
+            The index isn't modified """
+        changes = {}
+        for block in disconnected_blocks:
+            for transaction in block.data:
+                BalanceIndex.record(changes, transaction, reverse=True)
+
+        for transaction in transactions:
+            if not self.can_spend(transaction, changes):
+                return False
+            BalanceIndex.record(changes, transaction)
+        return True
+
+    def can_spend(self, transaction, pending_changes):
+        """ Checks that the sender of the transaction has enough funds after the pending changes of balances
+            (address -> amount) are applied. Takes constant time, so it can be run for every incoming transaction """
+        sender = BalanceIndex.address(transaction.sender_public_key_bytes)
+        return self.balances.get(sender, 0) + pending_changes.get(sender, 0) >= transaction.amount + transaction.fee
+
+    @staticmethod
+    def record(changes, transaction, reverse=False):
+        """ Adds the changes of balances made by the transaction (or by rolling it back) to changes """
+        amount = -transaction.amount if reverse else transaction.amount
+        fee = -transaction.fee if reverse else transaction.fee
+        for address, change in ((BalanceIndex.address(transaction.sender_public_key_bytes), -(amount + fee)),
+                                (BalanceIndex.address(transaction.recipient_public_key), amount)):
+            total = changes.get(address, 0) + change
+            if total == 0:
+                changes.pop(address, None)
+            else:
+                changes[address] = total
@@ -0,0 +1,85 @@
+import contextlib
+import io
+import json
+import sys
+import tracemalloc
+from Block import Block
+from Transaction import Transaction
+from Wallet import Wallet
+
+class LegacyTransaction:
+    """ Transaction as it was kept in memory before: fields in a __dict__ and its own copy of every key """
+    def __init__(self, sender_public_key_bytes, recipient_public_key, amount, signature, timestamp, fee):
+        self.sender_public_key_bytes = sender_public_key_bytes
+        self.recipient_public_key = recipient_public_key
+        self.amount = amount
+        self.signature = signature
+        self.timestamp = timestamp
+        self.fee = fee
+
+    @staticmethod
+    def from_json(transaction_json):
+        return LegacyTransaction(
+            transaction_json['sender_public_key'].encode('utf-8'),
+            transaction_json['recipient_public_key'],
+            transaction_json['amount'],
+            bytes.fromhex(transaction_json['signature']),
+            transaction_json['timestamp'],
+            transaction_json.get('fee', 0)
+        )
+
+class LegacyBlock:
+    """ Block as it was kept in memory before, with a __dict__ and the mining flag """
+    def __init__(self, block):
+        self.index = block.index
+        self.previous_hash = block.previous_hash
+        self.timestamp = block.timestamp
+        self.data = list(block.data)
+        self.stop_mining = False
+        self.hash = block.hash
+        self.nonce = block.nonce
+        self.merkle_root = block.merkle_root
+
+def received_transactions(count, senders=10):
+    """ Transactions between a few wallets, encoded as they arrive from peers (each message decodes its own keys).
+        Signatures aren't checked, so every wallet signs only once to keep the benchmark fast """
+    with contextlib.redirect_stdout(io.StringIO()): # Wallets print their new keys
+        wallets = [Wallet() for _ in range(senders)]
+    signatures = [wallet.sign_transaction(b"benchmark") for wallet in wallets]
+    messages = []
+    for i in range(count):
+        transaction = Transaction(wallets[i % senders].get_public_key(), wallets[(i + 1) % senders].get_public_key().decode('utf-8'), i, fee=i % 7)
+        transaction.signature = signatures[i % senders]
+        messages.append(json.dumps(transaction.to_json()))
+    return messages
+
+def measure(decode, messages):
+    """ Memory in bytes taken by the objects decoded from the messages """
+    tracemalloc.start()
+    objects = [decode(json.loads(message)) for message in messages]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size
+
+def benchmark(count=100000):
+    messages = received_transactions(count)
+    legacy_size = measure(LegacyTransaction.from_json, messages)
+    size = measure(Transaction.from_json, messages)
+
+    block = Block(1, "0", 0, [Transaction.from_json(json.loads(message)) for message in messages[:100]])
+    legacy_block = LegacyBlock(block)
+    legacy_block_size = sys.getsizeof(legacy_block) + sys.getsizeof(legacy_block.__dict__) + sys.getsizeof(legacy_block.data)
+    block.finalize()
+    block_size = sys.getsizeof(block) + sys.getsizeof(block.data)
+    return {'count': count, 'transactions_before': legacy_size, 'transactions_after': size,
+            'block_before': legacy_block_size, 'block_after': block_size}
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    results = benchmark(count)
+    print(f"Memory taken by {count} received transactions:")
+    print(f"  before (__dict__, a copy of the keys in each): {results['transactions_before'] / 1024 / 1024:.1f} MB")
+    print(f"  after (__slots__, interned keys): {results['transactions_after'] / 1024 / 1024:.1f} MB")
+    print(f"Memory taken by a block object with 100 transactions (without the transactions):")
+    print(f"  before: {results['block_before']} B, after (finalized): {results['block_after']} B")
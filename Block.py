@@ -2,9 +2,16 @@ import hashlib
 import json
 import time
 from Transaction import Transaction
+from Miner import Miner
+from Difficulty import Difficulty
+from Merkle import Merkle
 
 class Block:
-    def __init__(self, index, previous_hash, timestamp, data, hash = None, nonce = None):
+    MAX_FUTURE_TIME = 2 * 60 * 60 # Seconds a timestamp can be ahead of the local time, clocks of nodes aren't exactly in sync
+    __slots__ = ('index', 'previous_hash', 'timestamp', 'data', 'stop_mining', 'hash', 'nonce', 'merkle_root', 'target', 'finalized')
+
+    def __init__(self, index, previous_hash, timestamp, data, hash = None, nonce = None, target = None):
+        object.__setattr__(self, 'finalized', False)
         self.index = index
         self.previous_hash = previous_hash
         self.timestamp = timestamp
@@ -12,6 +19,8 @@ class Block:
         self.stop_mining = False
         self.hash = hash
         self.nonce = nonce
+        self.target = target # Hex of the difficulty target the block is mined at, set when mining if it's not known yet
+        self.merkle_root = self.calculate_merkle_root()
 
         if self.nonce is None:
             self.nonce = 0 # Proof of Work
@@ -19,21 +28,77 @@ class Block:
         if self.hash is None:
             self.hash = self.calculate_hash()
     
+    def __setattr__(self, name, value):
+        if getattr(self, 'finalized', False):
+            raise AttributeError("Block is finalized and can't be modified")
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if getattr(self, 'finalized', False):
+            raise AttributeError("Block is finalized and can't be modified")
+        object.__delattr__(self, name)
+
+    def __setstate__(self, state):
+        # Blocks are copied and sent to other processes with pickle, finalized blocks are restored as they were
+        slots = state[1] if isinstance(state, tuple) else state
+        for name, value in slots.items():
+            object.__setattr__(self, name, value)
+
+    def finalize(self):
+        """ Makes the block immutable once it's in the chain. Its transactions are stored in a tuple
+            and the mining flag is dropped """
+        if not self.finalized:
+            self.data = tuple(self.data)
+            del self.stop_mining
+            object.__setattr__(self, 'finalized', True)
+        return self
+
+    def hash_prefix(self):
+        """ Part of the hashed value that does not depend on the nonce. Transactions are included through the Merkle root,
+            so the hashed header has the same size however many transactions there are """
+        return self.header_prefix(self.index, self.previous_hash, self.timestamp, self.merkle_root, self.target)
+
+    @staticmethod
+    def header_prefix(index, previous_hash, timestamp, merkle_root, target):
+        return str(index) + str(previous_hash) + str(timestamp) + merkle_root + (target or "")
+
     def calculate_hash(self):
-        data_str = ''.join(map(str, self.data))
-        value = (str(self.index) + str(self.previous_hash) +
-                 str(self.timestamp) + data_str + str(self.nonce))
+        value = self.hash_prefix() + str(self.nonce)
         return hashlib.sha256(value.encode()).hexdigest()
 
-    def mine_block(self, difficulty):
-        target = "0" * difficulty
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
+    @staticmethod
+    def calculate_header_hash(header):
+        value = Block.header_prefix(header['index'], header['previous_hash'], header['timestamp'], header['merkle_root'], header.get('target')) + str(header['nonce'])
+        return hashlib.sha256(value.encode()).hexdigest()
+
+    def calculate_merkle_root(self):
+        return Merkle.root([transaction.get_id() for transaction in self.data])
+
+    def get_merkle_proof(self, transaction_id):
+        """ Proof that the transaction is in the block (see Merkle.proof) or None if it isn't """
+        transaction_ids = [transaction.get_id() for transaction in self.data]
+        if transaction_id not in transaction_ids:
+            return None
+        return Merkle.proof(transaction_ids, transaction_ids.index(transaction_id))
+
+    def get_difficulty(self):
+        """ Difficulty the block is mined at, None if the block has no target """
+        return Difficulty.from_hex(self.target) if self.target is not None else None
+
+    def mine_block(self, difficulty, miner=None):
+        """ Mines the block with the miner, whose worker processes are kept between blocks. Without a miner the block
+            is mined in the calling process. Difficulty is either a Difficulty or a legacy number of leading hex zeros.
+            It's stored in the header """
+        difficulty = Difficulty.of(difficulty)
+        if self.target != difficulty.to_hex():
+            self.target = difficulty.to_hex()
             self.hash = self.calculate_hash()
-            if self.stop_mining:
-                print("Mining stopped.")
-                return False
-            time.sleep(0)
+        miner = miner if miner is not None else Miner(workers=1)
+        result = miner.mine(self, difficulty)
+        if result is None:
+            print("Mining stopped.")
+            return False
+        self.nonce, self.hash = result
         print("Mining finished.")
         return True
 
@@ -44,11 +109,25 @@ class Block:
             'timestamp': self.timestamp,
             'data': [transaction.to_json() for transaction in self.data],
             'hash': self.hash,
-            'nonce': self.nonce
+            'nonce': self.nonce,
+            'target': self.target
+        }
+
+    def get_header(self):
+        """ Block without its transactions """
+        return {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'merkle_root': self.merkle_root,
+            'hash': self.hash,
+            'nonce': self.nonce,
+            'target': self.target
         }
 
     def __str__(self):
         block_str = f" Index: {self.index} | Previous hash: {self.previous_hash} | Ts: {self.timestamp}\n | PoW: {self.nonce} | Hash: {self.hash}\n"
+        block_str += f" Merkle root: {self.merkle_root} | Target: {self.target}\n"
         block_str += " Transactions:\n"
         for i in range(0, len(self.data)):
             block_str += f"  Transaction #{i}:\n"
@@ -67,18 +146,57 @@ class Block:
             timestamp = block_json['timestamp'],
             data = transactions,
             hash = hash,
-            nonce = nonce
+            nonce = nonce,
+            target = block_json.get('target')
         )
 
-    def validate_block(self, previous_block, difficulty):
-        if self.previous_hash != previous_block.hash:
+    @staticmethod
+    def is_timestamp_valid(timestamp, median_time):
+        """ Timestamps decide the difficulty of later blocks, so a block's timestamp has to be later than the median
+            timestamp of the blocks before it (median_time) and at most MAX_FUTURE_TIME ahead of the local time """
+        if not isinstance(timestamp, (int, float)):
+            return False
+        return median_time < timestamp <= time.time() + Block.MAX_FUTURE_TIME
+
+    def validate_block(self, previous_block, difficulty, median_time):
+        """ Checks the block against the previous one. Difficulty is the one expected at the height of the block,
+            the block has to be mined at exactly that difficulty. Median time is the median timestamp of the blocks before """
+        if self.index != previous_block.index + 1 or self.previous_hash != previous_block.hash:
+            return False
+
+        if not Block.is_timestamp_valid(self.timestamp, median_time):
+            return False
+
+        difficulty = Difficulty.of(difficulty)
+        if self.target != difficulty.to_hex() or not difficulty.is_met_by_hex(self.hash):
             return False
 
-        target = "0" * difficulty
-        if self.hash[:difficulty] != target:
+        # Transactions could have been changed after the root was calculated
+        if self.merkle_root != self.calculate_merkle_root():
             return False
 
         if self.hash != self.calculate_hash():
             return False
 
         return True
+
+    @staticmethod
+    def validate_header(header, previous_header, difficulty, median_time):
+        """ Checks that the header follows the previous one, its hash is calculated correctly, that it's mined at the difficulty
+            and that its timestamp is later than the median time (see validate_block). Whether the transactions match
+            the Merkle root can only be checked once the whole block is received """
+        if header['hash'] != Block.calculate_header_hash(header):
+            return False
+
+        if previous_header is None:
+            # Genesis block isn't mined, but the difficulty of the next blocks is taken from its target
+            return header['index'] == 0 and header.get('target') == Difficulty.of(difficulty).to_hex()
+
+        if header['index'] != previous_header['index'] + 1 or header['previous_hash'] != previous_header['hash']:
+            return False
+
+        if not Block.is_timestamp_valid(header['timestamp'], median_time):
+            return False
+
+        difficulty = Difficulty.of(difficulty)
+        return header.get('target') == difficulty.to_hex() and difficulty.is_met_by_hex(header['hash'])
@@ -0,0 +1,196 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from Block import Block
+from Protocol import Protocol, MessageReader
+
+class BlockStore:
+    """ Blocks of the chain stored on disk in append-only segment files. Every record holds the block's hash
+        and the block in the binary wire encoding, with its length and checksum in front of it.
+        A record that was only partially written before a crash is detected by the checksum and cut off on startup """
+    SEGMENT_SIZE = 64 * 1024 * 1024 # A new segment file is started once the current one is larger
+    RECORD_HEADER = struct.Struct('!II') # Length and CRC32 of the content of the record
+    SEGMENT_SUFFIX = '.blk'
+
+    # When written blocks are flushed from the OS cache to the disk
+    SYNC_ALWAYS = 'always' # After every block, nothing is lost on power failure
+    SYNC_BATCH = 'batch' # After every SYNC_BATCH_SIZE blocks and on close
+    SYNC_NEVER = 'never' # Left to the OS, blocks survive a crash of the program, but not of the system
+    SYNC_BATCH_SIZE = 100
+
+    def __init__(self, directory, sync=SYNC_BATCH, segment_size=SEGMENT_SIZE):
+        if sync not in (BlockStore.SYNC_ALWAYS, BlockStore.SYNC_BATCH, BlockStore.SYNC_NEVER):
+            raise ValueError(f"Unknown sync policy {sync}")
+        self.directory = directory
+        self.sync_policy = sync
+        self.segment_size = segment_size
+        self.locations = [] # Height -> (segment number, offset of the record, length of the record)
+        self.hashes = [] # Height -> block hash
+        self.heights = {} # Block hash -> height
+        self.unsynced = 0
+        self.file = None
+        self.maps = {} # Segment number -> read-only memory map of the segment file
+        self.lock = threading.RLock() # Blocks are read by many threads, maps must not be closed while they are used
+
+        os.makedirs(directory, exist_ok=True)
+        self.recover()
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f"{segment:08d}{BlockStore.SEGMENT_SUFFIX}")
+
+    def segments(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(BlockStore.SEGMENT_SUFFIX))
+        return [int(name[:-len(BlockStore.SEGMENT_SUFFIX)]) for name in names]
+
+    def recover(self):
+        """ Builds the index by scanning the segments. Everything after the first damaged record is removed """
+        segments = self.segments()
+        for i, segment in enumerate(segments):
+            data = self.map_segment(segment, 0) or b''
+
+            offset = 0
+            while offset < len(data):
+                record = self.parse_record(data, offset)
+                if record is None:
+                    break
+                block_hash, length = record
+                self.add_location(block_hash, segment, offset, length)
+                offset += length
+
+            if offset < len(data) or (i + 1 < len(segments) and segments[i + 1] != segment + 1):
+                print(f"Block store is damaged at segment {segment}, offset {offset}. Later blocks are removed")
+                self.cut(segment, offset, segments[i + 1:])
+                break
+
+        current_segment = self.locations[-1][0] if self.locations else 0
+        self.file = open(self.segment_path(current_segment), 'ab')
+
+    def parse_record(self, data, offset):
+        """ (hash of the block, length of the record) or None if the record is incomplete or damaged """
+        end = offset + BlockStore.RECORD_HEADER.size
+        if end > len(data):
+            return None
+        length, checksum = BlockStore.RECORD_HEADER.unpack_from(data, offset)
+        if end + length > len(data) or zlib.crc32(data[end:end + length]) != checksum:
+            return None
+        try:
+            return Protocol.read_hash(MessageReader(data, end)), BlockStore.RECORD_HEADER.size + length
+        except ValueError:
+            return None
+
+    def cut(self, segment, offset, later_segments):
+        """ Removes everything from the offset in the segment on """
+        # Mapped parts of files must not be accessed after they are truncated
+        for mapped_segment in [segment] + later_segments:
+            if mapped_segment in self.maps:
+                self.maps.pop(mapped_segment).close()
+        for later_segment in later_segments:
+            os.remove(self.segment_path(later_segment))
+        with open(self.segment_path(segment), 'r+b') as segment_file:
+            segment_file.truncate(offset)
+            if self.sync_policy != BlockStore.SYNC_NEVER:
+                os.fsync(segment_file.fileno())
+
+    def add_location(self, block_hash, segment, offset, length):
+        self.heights[block_hash] = len(self.locations)
+        self.hashes.append(block_hash)
+        self.locations.append((segment, offset, length))
+
+    def __len__(self):
+        return len(self.locations)
+
+    def append(self, block):
+        content = bytearray()
+        Protocol.write_hash(content, block.hash)
+        Protocol.write_block(content, block.to_json())
+        with self.lock:
+            self.append_record(block.hash, content)
+
+    def append_record(self, block_hash, content):
+        segment = self.locations[-1][0] if self.locations else 0
+        offset = self.file.tell()
+        if offset >= self.segment_size:
+            self.sync()
+            self.file.close()
+            segment += 1
+            offset = 0
+            self.file = open(self.segment_path(segment), 'ab')
+
+        record = BlockStore.RECORD_HEADER.pack(len(content), zlib.crc32(content)) + content
+        self.file.write(record)
+        self.add_location(block_hash, segment, offset, len(record))
+
+        self.unsynced += 1
+        if self.sync_policy == BlockStore.SYNC_ALWAYS or (self.sync_policy == BlockStore.SYNC_BATCH and self.unsynced >= BlockStore.SYNC_BATCH_SIZE):
+            self.sync()
+        else:
+            self.file.flush()
+
+    def truncate(self, height):
+        """ Removes blocks from the height on (when the chain is replaced after a fork) """
+        with self.lock:
+            self.truncate_records(height)
+
+    def truncate_records(self, height):
+        if height >= len(self.locations):
+            return
+        segment, offset, length = self.locations[height]
+        self.file.close()
+        self.cut(segment, offset, [later_segment for later_segment in self.segments() if later_segment > segment])
+
+        for block_hash in self.hashes[height:]:
+            del self.heights[block_hash]
+        del self.hashes[height:]
+        del self.locations[height:]
+        self.file = open(self.segment_path(segment), 'ab')
+
+    def map_segment(self, segment, end):
+        """ Memory map of the segment that covers at least end bytes (None for an empty segment) """
+        segment_map = self.maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            # Segment grew since it was mapped
+            if segment_map is not None:
+                segment_map.close()
+            if self.file is not None:
+                self.file.flush()
+            with open(self.segment_path(segment), 'rb') as segment_file:
+                if os.fstat(segment_file.fileno()).st_size == 0:
+                    return None
+                segment_map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment] = segment_map
+        return segment_map
+
+    def read_block(self, height):
+        with self.lock:
+            segment, offset, length = self.locations[height]
+            record = self.map_segment(segment, offset + length)[offset:offset + length]
+        reader = MessageReader(record, BlockStore.RECORD_HEADER.size)
+        Protocol.read_hash(reader)
+        return Block.from_json(Protocol.read_block(reader))
+
+    def get_hash(self, height):
+        return self.hashes[height]
+
+    def get_height(self, block_hash):
+        return self.heights.get(block_hash)
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        with self.lock:
+            self.close_files()
+
+    def close_files(self):
+        if self.file is not None:
+            if self.sync_policy != BlockStore.SYNC_NEVER:
+                self.sync()
+            self.file.close()
+            self.file = None
+        for segment_map in self.maps.values():
+            segment_map.close()
+        self.maps.clear()
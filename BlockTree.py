@@ -0,0 +1,90 @@
+import collections
+from Difficulty import Difficulty
+
+class BlockTree:
+    """ Blocks around the main chain: cumulative work of every block of the main chain, side branches that forked off it
+        and orphans - blocks whose parent hasn't been received yet. Side branches are kept, so switching to one of them
+        when it gets more work than the main chain only connects the blocks after the fork. Side and orphan blocks
+        are kept in memory only, the oldest ones are evicted when there are too many """
+    MAX_SIDE_BLOCKS = 1000
+    MAX_ORPHANS = 100
+
+    def __init__(self, max_side_blocks=MAX_SIDE_BLOCKS, max_orphans=MAX_ORPHANS, chain_work=None):
+        self.max_side_blocks = max_side_blocks
+        self.max_orphans = max_orphans
+        self.chain_work = chain_work if chain_work is not None else [] # Cumulative work of the main chain at every height
+        self.side_blocks = collections.OrderedDict() # Hash -> (block, cumulative work), oldest first
+        self.orphans = collections.OrderedDict() # Hash -> block, oldest first
+        self.orphans_by_parent = {} # Previous hash -> hashes of the orphans
+
+    @staticmethod
+    def get_block_work(block, difficulty):
+        """ Expected number of hashes needed to mine the block. Difficulty is used for blocks without a target """
+        block_difficulty = block.get_difficulty()
+        return (block_difficulty if block_difficulty is not None else Difficulty.of(difficulty)).get_work()
+
+    @staticmethod
+    def get_header_work(header, difficulty):
+        """ Same as get_block_work for a header (a dict) """
+        target = header.get('target')
+        return (Difficulty.from_hex(target) if target is not None else Difficulty.of(difficulty)).get_work()
+
+    def get_tip_work(self):
+        return self.chain_work[-1] if self.chain_work else 0
+
+    def connect(self, block, difficulty):
+        """ Block was added to the end of the main chain """
+        self.chain_work.append(self.get_tip_work() + BlockTree.get_block_work(block, difficulty))
+        self.side_blocks.pop(block.hash, None)
+
+    def truncate(self, height):
+        """ Blocks from the height on were removed from the main chain """
+        del self.chain_work[height:]
+
+    def add_side_block(self, block, work):
+        self.side_blocks[block.hash] = (block, work)
+        self.side_blocks.move_to_end(block.hash)
+        while len(self.side_blocks) > self.max_side_blocks:
+            self.side_blocks.popitem(last=False)
+
+    def get_side_block(self, block_hash):
+        """ (block, cumulative work) or None """
+        return self.side_blocks.get(block_hash)
+
+    def get_branch(self, block_hash, get_height):
+        """ Side blocks from the fork with the main chain up to the block and the height of the fork.
+            get_height(hash) returns the height of a block of the main chain or None.
+            Returns (None, []) if a block of the branch was evicted """
+        branch = []
+        while block_hash in self.side_blocks:
+            block = self.side_blocks[block_hash][0]
+            branch.append(block)
+            if block.index == 0:
+                return -1, branch[::-1]
+            block_hash = block.previous_hash
+        fork_height = get_height(block_hash)
+        if fork_height is None:
+            return None, []
+        return fork_height, branch[::-1]
+
+    def add_orphan(self, block):
+        if block.hash in self.orphans:
+            return
+        self.orphans[block.hash] = block
+        self.orphans_by_parent.setdefault(block.previous_hash, []).append(block.hash)
+        while len(self.orphans) > self.max_orphans:
+            self.remove_orphan(next(iter(self.orphans)))
+
+    def remove_orphan(self, block_hash):
+        block = self.orphans.pop(block_hash)
+        children = self.orphans_by_parent[block.previous_hash]
+        children.remove(block_hash)
+        if not children:
+            del self.orphans_by_parent[block.previous_hash]
+
+    def take_orphans(self, parent_hash):
+        """ Removes and returns orphans whose parent is the block """
+        orphans = [self.orphans[block_hash] for block_hash in self.orphans_by_parent.get(parent_hash, [])]
+        for orphan in orphans:
+            self.remove_orphan(orphan.hash)
+        return orphans
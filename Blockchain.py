@@ -1,96 +1,463 @@
 from Block import Block
+from Difficulty import Difficulty
+from Mempool import Mempool
+from MinerController import MinerController
+from ChainView import ChainView
+from BalanceIndex import BalanceIndex
+from BlockTree import BlockTree
+from ChainIndex import ChainIndex
+from Retarget import Retarget
+from Transaction import Transaction
 import time
 import threading
 
 class Blockchain:
-    def __init__(self, difficulty, broadcast_cb):
-        self.difficulty = difficulty
-        self.chain = [self.create_genesis_block()]
-        self.mempool = [] # Memory pool for transactions that aren't in any block yet
+    MIN_BLOCK_TRANSACTIONS = 5 # Mining starts when there are this many transactions in the mempool
+    MAX_BLOCK_SIZE = 1024 * 1024 # Bytes of encoded transactions in a mined block
+    MAX_BLOCK_TRANSACTIONS = 2000
+
+    def __init__(self, difficulty, broadcast_cb, block_store=None, enforce_balances=False, chain_index=None,
+                 max_block_size=MAX_BLOCK_SIZE, max_block_transactions=MAX_BLOCK_TRANSACTIONS, block_interval=None):
+        self.difficulty = difficulty # Difficulty of the genesis block
+        # Difficulty of the later blocks is adjusted to keep the block interval (in seconds), if it's set
+        self.retarget = Retarget(difficulty, block_interval)
+        self.max_block_size = max_block_size
+        self.max_block_transactions = max_block_transactions
+        self.block_store = block_store # Blocks are kept on disk instead of memory if it's set
+        self.restored = block_store is not None and len(block_store) > 0 # Chain was loaded from the disk
+        if block_store is not None:
+            # Blocks are read from the disk when they are accessed
+            self.chain = ChainView(block_store)
+            if not self.restored:
+                block_store.append(self.create_genesis_block())
+        else:
+            self.chain = [self.create_genesis_block()]
+        # Indexes of blocks, transactions and addresses. Persistent index is rebuilt only if it doesn't match the chain
+        self.chain_index = chain_index if chain_index is not None else ChainIndex()
+        # Balances and cumulative work up to the indexed height are loaded from the index, only later blocks are replayed
+        indexed_height = self.chain_index.sync_with(self.chain)
+        self.balances = BalanceIndex(self.chain_index.get_balances())
+        # Cumulative work of the chain, side branches and orphans
+        self.block_tree = BlockTree(chain_work=self.chain_index.get_chain_work(indexed_height))
+        for block in self.chain[indexed_height + 1:]:
+            self.connect_block_state(block)
+        # Nothing creates new coins yet, so transactions can only be checked for funds if the network is set up for it
+        self.enforce_balances = enforce_balances
+        self.mempool = Mempool() # Memory pool for transactions that aren't in any block yet
         self.lock = threading.Lock()
-        self.currently_mined_block = None
+        self.miner = MinerController(self) # Started when the first transaction arrives
         self.broadcast_cb = broadcast_cb
 
     def create_genesis_block(self):
-        genesis_block = Block(0, "0", time.time(), [])
-        return genesis_block
+        genesis_block = Block(0, "0", time.time(), [], target=Difficulty.of(self.difficulty).to_hex())
+        return genesis_block.finalize()
 
     def compare_replace(self, new_chain_json):
-        if len(self.chain) < len(new_chain_json):
-            new_chain = [Block.from_json(block_json) for block_json in new_chain_json]
+        """ Adds a whole chain sent by a peer to the block tree. Only blocks after the last common block
+            have to be deserialized and validated """
+        chain = self.chain
+        fork_index = Blockchain.find_fork_index(chain, new_chain_json)
+        if fork_index + 1 < len(new_chain_json):
+            parent = chain[fork_index] if fork_index >= 0 else None
+            self.add_branch(parent, [Block.from_json(block_json) for block_json in new_chain_json[fork_index + 1:]])
 
-            if Blockchain.is_chain_valid(new_chain, self.difficulty):
+    def add_blocks(self, blocks_json):
+        """ Connects consecutive blocks received from a peer. The first of them has to follow a block of the chain
+            or of a side branch. Returns False if it doesn't (blocks between are missing), the blocks are kept
+            as orphans until their parent arrives """
+        if not blocks_json:
+            return True
+        new_blocks = [Block.from_json(block_json) for block_json in blocks_json]
+        if new_blocks[0].index == 0:
+            parent = None # Peer sent its whole chain
+        else:
+            parent = self.get_known_block(new_blocks[0].previous_hash)
+            if parent is None:
+                print("Received blocks don't connect to the chain")
                 with self.lock:
-                    if len(self.chain) >= len(new_chain): # self.chain could have been modified by another thread
-                        return
+                    for block in new_blocks:
+                        self.block_tree.add_orphan(block)
+                return False
 
-                    if self.currently_mined_block is not None:
-                        self.currently_mined_block.stop_mining = True
-                        self.currently_mined_block = None
-                        print("Mining stopped due to chain replacement.")
+        self.add_branch(parent, new_blocks)
+        return True
 
-                    self.chain = new_chain
-                    for block in self.chain:
-                        for tx in block.data:
-                            if tx in self.mempool:
-                                self.mempool.remove(tx)
+    def get_known_block(self, block_hash):
+        """ Block of the main chain or of a side branch, None if it isn't known """
+        chain = self.chain
+        height = self.get_height(block_hash, chain)
+        if height is not None:
+            return chain[height]
+        side_block = self.block_tree.get_side_block(block_hash)
+        return side_block[0] if side_block is not None else None
 
-                    print(f"New blockchain:\n {str(self)}")
-            else:
+    def add_branch(self, parent, new_blocks):
+        """ Validates the blocks following the parent block (None if they start with a genesis block) and adds them
+            to the block tree. Orphans that were waiting for any of them are connected afterwards """
+        pending = [(parent, new_blocks)]
+        while pending:
+            parent, new_blocks = pending.pop()
+            fork_blocks = [parent] if parent is not None else []
+            ancestors = self.get_ancestors(parent, self.retarget.history) if parent is not None else []
+            if not Blockchain.is_chain_valid(fork_blocks + new_blocks, self.retarget, ancestors):
                 print(f"Chain is invalid")
+                continue
+            with self.lock:
+                if not self.connect_branch(parent, new_blocks):
+                    continue
+                for block in new_blocks:
+                    pending.extend((block, [orphan]) for orphan in self.block_tree.take_orphans(block.hash))
+
+    def get_ancestors(self, block, count):
+        """ Up to count blocks before the block on its branch (the main chain or a side branch), oldest first """
+        chain = self.chain
+        ancestors = [] # Newest first
+        while len(ancestors) < count and block.index > 0:
+            height = self.get_height(block.previous_hash, chain)
+            if height is not None:
+                # Rest of them are in the main chain
+                start = max(0, height + 1 - (count - len(ancestors)))
+                return list(chain[start:height + 1]) + ancestors[::-1]
+            side_block = self.block_tree.get_side_block(block.previous_hash)
+            if side_block is None:
+                break
+            block = side_block[0]
+            ancestors.append(block)
+        return ancestors[::-1]
+
+    def get_next_difficulty(self):
+        """ Difficulty of the block that follows the last block of the chain """
+        chain = self.chain
+        return self.retarget.get_difficulty(len(chain), chain[-1].target, lambda height: chain[height].timestamp)
+
+    def get_next_median_time(self):
+        """ Median timestamp of the last blocks, the block that follows the chain has to be later """
+        chain = self.chain
+        return self.retarget.get_median_time(len(chain), lambda height: chain[height].timestamp)
+
+    def connect_branch(self, parent, new_blocks):
+        """ Switches the chain to the validated blocks if it gets more cumulative work, otherwise keeps them in a side branch.
+            Returns False if the parent isn't known anymore. Has to be called with the lock held """
+        if parent is None:
+            fork_height, branch, work = -1, [], 0
+        else:
+            fork_height = self.get_height(parent.hash)
+            if fork_height is not None:
+                branch, work = [], self.block_tree.chain_work[fork_height]
+            else:
+                # Parent is in a side branch, the whole branch is connected if it gets more work
+                side_block = self.block_tree.get_side_block(parent.hash)
+                fork_height, branch = self.block_tree.get_branch(parent.hash, self.get_height) if side_block is not None else (None, [])
+                if fork_height is None:
+                    print("Received blocks don't connect to the chain anymore")
+                    return False
+                work = side_block[1]
+
+        if not branch:
+            # Blocks that are already in the chain don't have to be connected again
+            while new_blocks and fork_height + 1 < len(self.chain) and self.chain[fork_height + 1].hash == new_blocks[0].hash:
+                fork_height += 1
+                work = self.block_tree.chain_work[fork_height]
+                new_blocks = new_blocks[1:]
+            if not new_blocks:
+                return True
+
+        works = []
+        for block in new_blocks:
+            work += BlockTree.get_block_work(block, self.difficulty)
+            works.append(work)
+        if work <= self.block_tree.get_tip_work():
+            # Chain that was seen first is kept when the work is equal
+            for block, block_work in zip(new_blocks, works):
+                self.block_tree.add_side_block(block, block_work)
+            print(f"Received {len(new_blocks)} blocks were kept in a side branch.")
+            return True
+        return self.switch_branch(fork_height, branch + new_blocks)
+
+    def switch_branch(self, fork_height, new_blocks):
+        """ Replaces blocks after the fork height with the new blocks. Only the blocks after the fork are disconnected
+            and they are kept as a side branch, so switching back is as cheap. Has to be called with the lock held """
+        disconnected_blocks = self.chain[fork_height + 1:]
+        if self.enforce_balances:
+            transactions = [tx for block in new_blocks for tx in block.data]
+            if not self.balances.can_apply(transactions, disconnected_blocks=disconnected_blocks):
+                print(f"Chain is invalid - senders don't have enough funds")
+                return False
+
+        disconnected_work = self.block_tree.chain_work[fork_height + 1:]
+        self.replace_blocks(fork_height + 1, new_blocks)
+        for block, block_work in zip(disconnected_blocks, disconnected_work):
+            self.block_tree.add_side_block(block, block_work)
+
+        # Transactions from the common blocks were already removed from the mempool,
+        # transactions from the disconnected blocks go back to it unless the new blocks have them too
+        new_transaction_ids = set()
+        for block in new_blocks:
+            self.mempool.discard_all(block.data)
+            new_transaction_ids.update(tx.get_id() for tx in block.data)
+        for block in disconnected_blocks:
+            for tx in block.data:
+                if tx.get_id() not in new_transaction_ids:
+                    self.mempool.add(tx)
+        if self.enforce_balances and disconnected_blocks:
+            self.drop_unspendable_transactions()
+        self.miner.update(tip_changed=True)
+
+        print(f"Blockchain switched to a branch of {len(new_blocks)} new blocks, height is now {len(self.chain)}.")
+        return True
+
+    def replace_blocks(self, height, new_blocks):
+        """ Replaces blocks from the height on. Has to be called with the lock held """
+        for block in reversed(self.chain[height:]):
+            self.balances.disconnect_block(block)
+            self.chain_index.disconnect_block(block, self.balances)
+        self.block_tree.truncate(height)
+        for block in new_blocks:
+            block.finalize()
+            self.connect_block_state(block)
+
+        if self.block_store is not None:
+            self.block_store.truncate(height)
+            for block in new_blocks:
+                self.block_store.append(block)
+        else:
+            self.chain = self.chain[:height] + new_blocks
+
+    def append_block(self, block):
+        block.finalize()
+        self.connect_block_state(block)
+        if self.block_store is not None:
+            self.block_store.append(block)
+        else:
+            self.chain.append(block)
+
+    def connect_block_state(self, block):
+        """ Updates the cumulative work, balances and indexes for a block added to the end of the chain """
+        self.block_tree.connect(block, self.difficulty)
+        self.balances.connect_block(block)
+        self.chain_index.connect_block(block, self.block_tree.get_tip_work(), self.balances)
+
+    def clear(self):
+        """ Removes all blocks, so that any valid chain is accepted """
+        with self.lock:
+            self.replace_blocks(0, [])
+
+    def get_tip_hash(self):
+        chain = self.chain
+        return chain[-1].hash if chain else None
+
+    def get_height(self, block_hash, chain=None):
+        """ Height of the block with the given hash in the chain (current one by default) or None """
+        chain = self.chain if chain is None else chain
+        height = self.chain_index.get_height(block_hash)
+        # Chain could have been replaced after the caller got it
+        if height is None or height >= len(chain) or chain[height].hash != block_hash:
+            return None
+        return height
+
+    def has_block(self, block_hash):
+        return self.get_height(block_hash) is not None
+
+    def get_transaction(self, transaction_id):
+        """ Transaction from the chain or None """
+        chain = self.chain
+        location = self.chain_index.get_transaction_location(transaction_id)
+        if location is None or location[0] >= len(chain):
+            return None
+        height, position = location
+        return chain[height].data[position]
+
+    def get_transaction_proof(self, transaction_id):
+        """ Merkle proof that the transaction is in a block of the chain, for light nodes. None if it isn't in the chain """
+        chain = self.chain
+        location = self.chain_index.get_transaction_location(transaction_id)
+        if location is None or location[0] >= len(chain):
+            return None
+        block = chain[location[0]]
+        proof = block.get_merkle_proof(transaction_id)
+        if proof is None:
+            return None
+        return {'transaction_id': transaction_id, 'block_hash': block.hash, 'proof': [list(step) for step in proof]}
+
+    def get_address_history(self, public_key):
+        """ Ids of the transactions in the chain that the address sent or received """
+        return self.chain_index.get_address_history(public_key)
+
+    def get_locator(self):
+        """ Hashes describing the chain for GET_BLOCKS: the last 10 blocks, then exponentially sparser ones down to the genesis block """
+        chain = self.chain
+        return [chain[height].hash for height in Blockchain.locator_heights(len(chain))]
+
+    @staticmethod
+    def locator_heights(length):
+        heights = []
+        height = length - 1
+        step = 1
+        while height > 0:
+            heights.append(height)
+            if len(heights) >= 10:
+                step *= 2
+            height -= step
+        if length > 0:
+            heights.append(0)
+        return heights
+
+    def get_blocks_after(self, locator, limit):
+        """ Serialized blocks following the newest block from the locator that is in the chain (whole chain if there is none) """
+        chain = self.chain
+        start = self.find_locator_start(chain, locator)
+        return [block.to_json() for block in chain[start:start + limit]]
+
+    def get_headers_after(self, locator, limit):
+        chain = self.chain
+        start = self.find_locator_start(chain, locator)
+        return [block.get_header() for block in chain[start:start + limit]]
+
+    def find_locator_start(self, chain, locator):
+        """ Index of the first block after the newest block from the locator that is in the chain """
+        heights = [self.get_height(block_hash, chain) for block_hash in locator]
+        return max([height + 1 for height in heights if height is not None], default=0)
+
+    def get_blocks(self, block_hashes):
+        """ Serialized blocks with the given hashes, which have to be consecutive. Stops at the first block that isn't in the chain """
+        chain = self.chain
+        blocks = []
+        if block_hashes:
+            start = self.get_height(block_hashes[0], chain)
+            if start is not None:
+                for block, block_hash in zip(chain[start:start + len(block_hashes)], block_hashes):
+                    if block.hash != block_hash:
+                        break
+                    blocks.append(block.to_json())
+        return blocks
+
+    @staticmethod
+    def find_fork_index(chain, chain_json):
+        """ Returns the index of the last block that both chains share (-1 if even the genesis blocks differ) """
+        low, high = 0, min(len(chain), len(chain_json))
+        # Blocks are linked by hashes, so the shared blocks always form a prefix and it can be bisected
+        while low < high:
+            middle = (low + high) // 2
+            if chain[middle].hash == chain_json[middle].get('hash'):
+                low = middle + 1
+            else:
+                high = middle
+        return low - 1
 
     def add_new_transaction(self, transaction):
         if transaction.is_valid():
-            with self.lock:
-                print(f"Adding new transaction to the mempool:\n {str(transaction)}")
-                self.mempool.append(transaction)
-
-                if len(self.mempool) >= 5 and self.currently_mined_block is None:
-                    # Create new block, mine it and add it to the blockchain
-                    new_block = Block(
-                        index=len(self.chain),
-                        previous_hash=self.chain[-1].hash,
-                        timestamp=time.time(),
-                        data=self.mempool.copy()
-                    )
-                    print("Created new block. Mining it...")
-                    self.currently_mined_block = new_block
-
-                    mining_thread = threading.Thread(target=self.start_mining, args=(new_block,))
-                    mining_thread.start()
+            self.add_verified_transaction(transaction)
         else:
             print(f"Received invalid transaction")
 
+    def add_new_transactions(self, transactions):
+        """ Verifies signatures of all transactions at once (in parallel) and adds the valid ones to the mempool """
+        for transaction, is_valid in zip(transactions, Transaction.verify_batch(transactions)):
+            if is_valid:
+                self.add_verified_transaction(transaction)
+            else:
+                print(f"Received invalid transaction")
+
+    def get_balance(self, public_key):
+        return self.balances.get_balance(public_key)
+
+    def add_verified_transaction(self, transaction):
+        with self.lock:
+            if self.enforce_balances and not self.balances.can_spend(transaction, self.mempool.balance_changes):
+                print("Sender of the transaction doesn't have enough funds")
+                return
+            if not self.mempool.add(transaction):
+                print("Transaction is already in the mempool")
+                return
+            print(f"Adding new transaction to the mempool:\n {str(transaction)}")
+            self.miner.update()
+
+    def create_mining_template(self):
+        """ Block for the miner or None if there aren't enough transactions in the mempool or the chain is empty """
+        with self.lock:
+            if len(self.mempool) < Blockchain.MIN_BLOCK_TRANSACTIONS or len(self.chain) == 0:
+                return None
+            new_block = self.create_block_template()
+            if not new_block.data:
+                return None # Senders of all transactions lack funds
+            return new_block
+
+    def create_block_template(self):
+        """ New block with the transactions that pay the highest fee per byte, within the size and count limits.
+            Transactions that have been waiting for too long are dropped first. Has to be called with the lock held """
+        for transaction in self.mempool.expire():
+            print(f"Transaction {transaction.get_id()} expired")
+        accept = None
+        if self.enforce_balances:
+            changes = {} # Changes of balances made by the selected transactions
+            def accept(transaction, selected):
+                if not self.balances.can_spend(transaction, changes):
+                    return False
+                BalanceIndex.record(changes, transaction)
+                return True
+        return Block(
+            index=len(self.chain),
+            previous_hash=self.chain[-1].hash,
+            timestamp=time.time(),
+            data=self.mempool.select(self.max_block_size, self.max_block_transactions, accept),
+            target=self.get_next_difficulty().to_hex()
+        )
+
+    def drop_unspendable_transactions(self):
+        """ Removes transactions from the mempool that their senders can't pay for anymore. Has to be called with the lock held """
+        changes = {} # Changes of balances made by the spendable transactions
+        for transaction in self.mempool:
+            if self.balances.can_spend(transaction, changes):
+                BalanceIndex.record(changes, transaction)
+            else:
+                self.mempool.remove(transaction)
+
     def start_mining(self, new_block):
-        if new_block.mine_block(self.difficulty):
-            with self.lock:
-                if not new_block.validate_block(self.chain[-1], self.difficulty):
+        """ Mines the block in the calling thread with the worker processes of the miner and adds it to the chain """
+        if new_block.mine_block(self.get_next_difficulty(), self.miner.miner):
+            self.add_mined_block(new_block)
+
+    def add_mined_block(self, new_block):
+        """ Adds the mined block to the chain if it still follows the tip and all its transactions are in the mempool """
+        with self.lock:
+            if not new_block.validate_block(self.chain[-1], self.get_next_difficulty(), self.get_next_median_time()):
+                print("Mined block is not valid")
+                return False
+
+            for tx in new_block.data:
+                if tx not in self.mempool:
+                    # Block is invalid - has some transaction that are not in the mempool
                     print("Mined block is not valid")
-                    self.currently_mined_block = None
-                    return
+                    return False
+            if self.enforce_balances and not self.balances.can_apply(new_block.data):
+                # Chain was replaced while mining and some senders don't have enough funds anymore
+                self.drop_unspendable_transactions()
+                print("Mined block is not valid")
+                return False
+            self.mempool.discard_all(new_block.data)
 
-                for tx in new_block.data:
-                    if tx not in self.mempool:
-                        # Block is invalid - has some transaction that are not in the mempool
-                        self.currently_mined_block = None
-                        print("Mined block is not valid")
-                        return
-                for tx in new_block.data:
-                    self.mempool.remove(tx)
+            self.append_block(new_block)
+            print("New block added to the blockchain.")
+            self.miner.update(tip_changed=True)
 
-                self.chain.append(new_block)
-                print("New block added to the blockchain.")
-                self.currently_mined_block = None
+            print("Announcing new block.")
+            self.broadcast_cb()
+            return True
 
-                print("Broadcasting blockchain.")
-                self.broadcast_cb()
+    def close(self):
+        self.miner.stop()
+        with self.lock:
+            if self.block_store is not None:
+                self.block_store.close()
+            self.chain_index.close()
+        Transaction.shutdown_verification_pool()
 
     def __str__(self):
         blockchain_str = f"\n====================Blockchain========================\n\n"
         blockchain_str += "Mempool (transactions that aren't in any block yet):\n"
-        for i in range(0, len(self.mempool)):
+        for i, transaction in enumerate(self.mempool):
             blockchain_str += f"  Mempool Transaction #{i}:\n"
-            blockchain_str += str(self.mempool[i])
+            blockchain_str += str(transaction)
         blockchain_str += f"\nBlocks:\n"
         for i in range(0, len(self.chain)):
             blockchain_str += f"Block #{i}:\n"
@@ -98,12 +465,25 @@ class Blockchain:
         return blockchain_str
 
     @staticmethod
-    def is_chain_valid(chain, difficulty):
+    def is_chain_valid(chain, difficulty, ancestors=()):
+        """ Validates the blocks after the first one. Difficulty is a Retarget or a fixed difficulty.
+            Ancestors are the blocks before the first one, oldest first, their timestamps are needed to adjust the difficulty
+            and to check the timestamps of the blocks. A genesis block has to have the initial target, since the difficulty
+            of the next blocks is taken from it """
+        retarget = Retarget.of(difficulty)
+        timestamps = {block.index: block.timestamp for block in ancestors}
+        if chain and chain[0].index == 0 and chain[0].target != retarget.expected(None, timestamps)[0].to_hex():
+            return False
         for i in range(1, len(chain)):
             current_block = chain[i]
             previous_block = chain[i-1]
-            
-            if not current_block.validate_block(previous_block, difficulty):
+
+            expected_difficulty, median_time = retarget.expected(previous_block.get_header(), timestamps)
+            if expected_difficulty is None or median_time is None:
                 return False
-        
-        return True
+            if not current_block.validate_block(previous_block, expected_difficulty, median_time):
+                return False
+
+        # Signatures of all transactions in the chain are verified in one batch
+        transactions = [tx for block in chain[1:] for tx in block.data]
+        return all(Transaction.verify_batch(transactions))
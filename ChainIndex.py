@@ -0,0 +1,142 @@
+import dbm
+import hashlib
+import json
+import threading
+
+class ChainIndex:
+    """ Lookup indexes of the chain: block hash -> height, transaction id -> (height of the block, position in the block)
+        and address -> ids of its transactions in the order they were added to the chain. Cumulative work at every
+        height and balances of the addresses are stored too, so a restarted node replays only the blocks that
+        weren't indexed yet. Indexes are kept in a dbm database if the path is given, otherwise in memory """
+    def __init__(self, path=None):
+        self.db = dbm.open(path, 'c') if path is not None else {}
+        # Balances are kept in their own database, so they are loaded without reading the other records
+        self.balances_db = dbm.open(path + '-balances', 'c') if path is not None else {}
+        self.lock = threading.Lock() # dbm databases can't be used by many threads at once
+
+    @staticmethod
+    def address_key(public_key, suffix):
+        # Addresses are long PEM keys, so they are hashed
+        address = public_key.decode('utf-8') if isinstance(public_key, bytes) else public_key
+        return b'a' + hashlib.sha256(address.encode('utf-8')).hexdigest().encode('utf-8') + suffix
+
+    @staticmethod
+    def addresses(transaction):
+        return dict.fromkeys([transaction.sender_public_key_bytes.decode('utf-8'), transaction.recipient_public_key])
+
+    @staticmethod
+    def tip_record(height, block_hash):
+        return f"{height} {block_hash}".encode('utf-8')
+
+    @staticmethod
+    def work_key(height):
+        return b'w' + str(height).encode('utf-8')
+
+    def begin_update(self):
+        # Index without a tip is rebuilt, so an update that was interrupted isn't mistaken for a complete one
+        if b'tip' in self.db:
+            del self.db[b'tip']
+
+    def store_balances(self, block, balances):
+        """ Stores the balances (BalanceIndex) of the addresses in the block """
+        for transaction in block.data:
+            for address in ChainIndex.addresses(transaction):
+                key = ChainIndex.address_key(address, b'')
+                balance = balances.get_balance(address)
+                if balance != 0:
+                    self.balances_db[key] = json.dumps([address, balance]).encode('utf-8')
+                elif key in self.balances_db:
+                    del self.balances_db[key]
+
+    def connect_block(self, block, work, balances):
+        """ Adds the block with the cumulative work of the chain and balances after it """
+        with self.lock:
+            self.begin_update()
+            self.db[b'h' + block.hash.encode('utf-8')] = str(block.index).encode('utf-8')
+            for position, transaction in enumerate(block.data):
+                transaction_id = transaction.get_id()
+                self.db[b't' + transaction_id.encode('utf-8')] = f"{block.index} {position}".encode('utf-8')
+                for address in ChainIndex.addresses(transaction):
+                    count = int(self.db.get(ChainIndex.address_key(address, b'#'), b'0'))
+                    self.db[ChainIndex.address_key(address, str(count).encode('utf-8'))] = transaction_id.encode('utf-8')
+                    self.db[ChainIndex.address_key(address, b'#')] = str(count + 1).encode('utf-8')
+            self.db[ChainIndex.work_key(block.index)] = str(work).encode('utf-8')
+            self.store_balances(block, balances)
+            # Written last, so an index that was interrupted while updating doesn't match the chain
+            self.db[b'tip'] = ChainIndex.tip_record(block.index, block.hash)
+
+    def disconnect_block(self, block, balances):
+        """ Removes the block, which has to be the last connected one. Balances are the ones after the block is rolled back """
+        with self.lock:
+            self.begin_update()
+            for position, transaction in reversed(list(enumerate(block.data))):
+                transaction_id = transaction.get_id()
+                location_key = b't' + transaction_id.encode('utf-8')
+                if self.db.get(location_key) == f"{block.index} {position}".encode('utf-8'):
+                    del self.db[location_key]
+                for address in ChainIndex.addresses(transaction):
+                    count = int(self.db.get(ChainIndex.address_key(address, b'#'), b'0')) - 1
+                    del self.db[ChainIndex.address_key(address, str(count).encode('utf-8'))]
+                    self.db[ChainIndex.address_key(address, b'#')] = str(count).encode('utf-8')
+            height_key = b'h' + block.hash.encode('utf-8')
+            if self.db.get(height_key) == str(block.index).encode('utf-8'):
+                del self.db[height_key]
+            del self.db[ChainIndex.work_key(block.index)]
+            self.store_balances(block, balances)
+            self.db[b'tip'] = ChainIndex.tip_record(block.index - 1, block.previous_hash)
+
+    def get_height(self, block_hash):
+        with self.lock:
+            height = self.db.get(b'h' + block_hash.encode('utf-8'))
+        return int(height) if height is not None else None
+
+    def get_transaction_location(self, transaction_id):
+        """ (height of the block, position in the block) or None if the transaction isn't in the chain """
+        with self.lock:
+            location = self.db.get(b't' + transaction_id.encode('utf-8'))
+        if location is None:
+            return None
+        height, position = location.split()
+        return int(height), int(position)
+
+    def get_address_history(self, public_key):
+        """ Ids of the transactions sent or received by the address """
+        with self.lock:
+            count = int(self.db.get(ChainIndex.address_key(public_key, b'#'), b'0'))
+            return [self.db[ChainIndex.address_key(public_key, str(i).encode('utf-8'))].decode('utf-8') for i in range(0, count)]
+
+    def sync_with(self, chain):
+        """ Returns the height up to which the index describes the chain, only blocks after it have to be connected.
+            Index that doesn't describe a beginning of the chain (it's new, it belongs to a different chain or the program
+            stopped while it was being updated) is cleared and -1 is returned """
+        with self.lock:
+            tip = self.db.get(b'tip')
+            if tip is not None:
+                height, block_hash = tip.decode('utf-8').split()
+                height = int(height)
+                if height < len(chain) and chain[height].hash == block_hash and ChainIndex.work_key(height) in self.db:
+                    return height
+            keys = list(self.db.keys())
+            if keys:
+                print("Rebuilding the chain index...")
+            for key in keys:
+                del self.db[key]
+            for key in list(self.balances_db.keys()):
+                del self.balances_db[key]
+        return -1
+
+    def get_chain_work(self, height):
+        """ Cumulative work of the chain at every height up to the height """
+        with self.lock:
+            return [int(self.db[ChainIndex.work_key(i)]) for i in range(0, height + 1)]
+
+    def get_balances(self):
+        """ Address -> balance """
+        with self.lock:
+            return dict(json.loads(self.balances_db[key]) for key in self.balances_db.keys())
+
+    def close(self):
+        with self.lock:
+            if hasattr(self.db, 'close'):
+                self.db.close()
+                self.balances_db.close()
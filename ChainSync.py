@@ -0,0 +1,156 @@
+import asyncio
+import bisect
+from Block import Block
+from BlockTree import BlockTree
+from Protocol import Protocol
+
+class ChainSync:
+    """ Headers-first download of the chain with the most cumulative work. Headers are fetched from the peer whose chain
+        has the most work and validated, then bodies of the blocks are downloaded in ranges from all peers that have them,
+        in parallel """
+    RANGE_SIZE = 100 # Blocks requested from a peer at once
+
+    def __init__(self, blockchain, client, range_size=RANGE_SIZE):
+        self.blockchain = blockchain
+        self.client = client
+        self.range_size = range_size
+        self.headers = []
+        self.header_work = [] # Cumulative work of the chain at every header
+        self.pending = [] # Starts of the ranges that weren't downloaded yet
+        self.downloaded = {} # Start of the range -> its verified blocks, until they are added to the chain
+        self.next_start = 0 # Start of the next range to be added to the chain
+        self.unconnected = [] # Blocks that don't give the chain more work yet
+        self.connect_lock = asyncio.Lock()
+        self.failed = False
+
+    async def run(self, tips):
+        """ Syncs with the peers. Tips map (ip address, port) of each peer to (height, hash of the last block, cumulative work)
+            of its chain """
+        if not tips:
+            return
+        best_peer = max(tips, key=lambda peer: tips[peer][2])
+        if tips[best_peer][2] <= self.blockchain.block_tree.get_tip_work():
+            return
+
+        headers = await self.download_headers(*best_peer)
+        if not headers:
+            return
+        # Work reported by the peer isn't trusted, the work of the downloaded headers is calculated
+        self.header_work = self.get_header_work(headers)
+        if self.header_work[-1] <= self.blockchain.block_tree.get_tip_work():
+            return
+
+        # Bodies can be downloaded from every peer whose last block is one of the headers
+        positions = {header['hash']: i for i, header in enumerate(headers)}
+        peers = {peer: positions[tip_hash] for peer, (height, tip_hash, work) in tips.items() if tip_hash in positions}
+        peers[best_peer] = len(headers) - 1
+        await self.download_bodies(headers, peers)
+
+    def get_header_work(self, headers):
+        """ Cumulative work of the chain at every header. The headers follow a block of the chain """
+        fork_height = headers[0]['index'] - 1
+        chain_work = self.blockchain.block_tree.chain_work
+        work = chain_work[fork_height] if 0 <= fork_height < len(chain_work) else 0
+        header_work = []
+        for header in headers:
+            work += BlockTree.get_header_work(header, self.blockchain.difficulty)
+            header_work.append(work)
+        return header_work
+
+    async def download_headers(self, peer_ip_addr, peer_port):
+        """ Validated headers of the peer's blocks after the last block both chains share """
+        chain = self.blockchain.chain
+        retarget = self.blockchain.retarget
+        locator = self.blockchain.get_locator()
+        headers = []
+        previous_header = None
+        timestamps = {} # Height -> timestamp of the blocks before the header, for adjusting the difficulty and checking timestamps
+        while True:
+            message = {'type': 'GET_HEADERS', 'locator': [headers[-1]['hash']] if headers else locator}
+            batch = (await self.client.request(message, peer_ip_addr, peer_port)).get('headers', [])
+            if batch and not headers and batch[0]['index'] > 0:
+                fork_index = self.blockchain.get_height(batch[0]['previous_hash'], chain)
+                if fork_index is None:
+                    print(f"Headers from {peer_ip_addr}:{peer_port} don't connect to the chain")
+                    return []
+                previous_header = chain[fork_index].get_header()
+                for block in chain[max(0, fork_index - retarget.history):fork_index]:
+                    timestamps[block.index] = block.timestamp
+
+            for header in batch:
+                difficulty, median_time = retarget.expected(previous_header, timestamps)
+                if difficulty is None or median_time is None or not Block.validate_header(header, previous_header, difficulty, median_time):
+                    print(f"Received invalid header from {peer_ip_addr}:{peer_port}")
+                    return headers
+                headers.append(header)
+                previous_header = header
+
+            if len(batch) < Protocol.MAX_HEADERS_PER_MESSAGE:
+                return headers
+
+    async def download_bodies(self, headers, peers):
+        """ Downloads the blocks described by the headers. Peers map (ip address, port) to the index of the last header they have """
+        self.headers = headers
+        self.pending = list(range(0, len(headers), self.range_size))
+        while self.pending and peers and not self.failed:
+            results = await asyncio.gather(*(self.download_ranges(peer, last_index) for peer, last_index in peers.items()))
+            # Ranges of the peers that failed are left for the others
+            working_peers = {peer: last_index for (peer, last_index), result in zip(peers.items(), results) if result}
+            if len(working_peers) == len(peers):
+                break
+            peers = working_peers
+
+    async def download_ranges(self, peer, last_index):
+        """ Downloads pending ranges that the peer has, one at a time. Returns False if the peer failed """
+        loop = asyncio.get_running_loop()
+        while not self.failed:
+            start = next((start for start in self.pending if self.range_end(start) - 1 <= last_index), None)
+            if start is None:
+                return True
+            self.pending.remove(start)
+            headers = self.headers[start:self.range_end(start)]
+
+            try:
+                message = {'type': 'GET_BODIES', 'hashes': [header['hash'] for header in headers]}
+                blocks = (await self.client.request(message, *peer)).get('blocks', [])
+                if not await loop.run_in_executor(None, ChainSync.matches_headers, blocks, headers):
+                    raise ValueError("Blocks don't match their headers")
+            except Exception as e:
+                print(f"Failure when trying to download blocks from {peer[0]}:{peer[1]}: {e}")
+                bisect.insort(self.pending, start)
+                return False
+
+            self.downloaded[start] = blocks
+            await self.connect_downloaded()
+        return True
+
+    def range_end(self, start):
+        return min(start + self.range_size, len(self.headers))
+
+    async def connect_downloaded(self):
+        """ Adds the downloaded ranges to the chain in order. On a fork blocks are kept until they give the chain more work """
+        loop = asyncio.get_running_loop()
+        async with self.connect_lock:
+            while self.next_start in self.downloaded and not self.failed:
+                last_index = self.range_end(self.next_start) - 1
+                self.unconnected += self.downloaded.pop(self.next_start)
+                self.next_start += self.range_size
+                if self.header_work[last_index] <= self.blockchain.block_tree.get_tip_work():
+                    continue
+
+                blocks, self.unconnected = self.unconnected, []
+                await loop.run_in_executor(None, self.blockchain.add_blocks, blocks)
+                if self.blockchain.get_tip_hash() != blocks[-1]['hash']:
+                    print("Downloaded blocks weren't added to the chain, sync stopped")
+                    self.failed = True
+
+    @staticmethod
+    def matches_headers(blocks_json, headers):
+        """ Checks that the blocks are the ones described by the headers and that their hashes are calculated correctly """
+        if len(blocks_json) != len(headers):
+            return False
+        for block_json, header in zip(blocks_json, headers):
+            block = Block.from_json(block_json)
+            if block.get_header() != header or block.calculate_hash() != header['hash']:
+                return False
+        return True
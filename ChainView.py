@@ -0,0 +1,46 @@
+import collections
+import threading
+
+class ChainView:
+    """ Read-only sequence of the blocks in a block store. Blocks are decoded only when they are accessed
+        and the most recently used ones are cached, so memory use doesn't grow with the length of the chain """
+    CACHE_SIZE = 256 # Decoded blocks kept in memory
+
+    def __init__(self, block_store, cache_size=CACHE_SIZE):
+        self.block_store = block_store
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict() # Height -> Block, in order of use
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.block_store)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.get_block(height) for height in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("Block index out of range")
+        return self.get_block(key)
+
+    def __iter__(self):
+        for height in range(0, len(self)):
+            yield self.get_block(height)
+
+    def get_block(self, height):
+        block_hash = self.block_store.get_hash(height)
+        with self.lock:
+            block = self.cache.get(height)
+            # Block at the height could have been replaced since it was cached
+            if block is not None and block.hash == block_hash:
+                self.cache.move_to_end(height)
+                return block
+
+        block = self.block_store.read_block(height).finalize()
+        with self.lock:
+            self.cache[height] = block
+            self.cache.move_to_end(height)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return block
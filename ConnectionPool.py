@@ -0,0 +1,137 @@
+import asyncio
+import socket
+import time
+from Protocol import FrameReader
+
+class PeerConnection:
+    """ Long-lived connection to a peer. Messages are sent over it as frames """
+    def __init__(self, reader, writer, max_frame_size):
+        self.reader = FrameReader(reader, max_frame_size)
+        self.writer = writer
+        self.lock = asyncio.Lock() # Only one request at a time waits for its response
+        self.last_used = time.monotonic()
+        self.messages_sent = 0 # Messages handed to the transport, they might have reached the peer
+
+    async def send(self, data):
+        if self.is_closed():
+            raise ConnectionResetError("Connection was closed before the message was sent")
+        self.last_used = time.monotonic()
+        self.writer.write(data)
+        self.messages_sent += 1
+        await self.writer.drain()
+
+    async def request(self, data):
+        """ Sends the request and returns the response (message, protocol) """
+        async with self.lock:
+            await self.send(data)
+            response = await self.reader.read_message()
+            if response is None:
+                raise ConnectionError("Peer closed the connection without responding")
+            self.last_used = time.monotonic()
+            return response
+
+    def is_closed(self):
+        # The peer closing its side is noticed as the end of the stream
+        return self.writer.is_closing() or self.reader.stream_reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+class ConnectionPool:
+    """ Keeps one connection per peer open between messages. Failed connection attempts are retried
+        with exponential backoff and connections that weren't used for a while are closed """
+    IDLE_TIMEOUT = 60 # Seconds
+    BACKOFF_BASE = 0.5 # Seconds
+    BACKOFF_MAX = 30 # Seconds
+
+    def __init__(self, max_frame_size, timeout, idle_timeout=IDLE_TIMEOUT):
+        self.max_frame_size = max_frame_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connections = {} # (ip address, port) -> PeerConnection
+        self.connect_locks = {} # Prevents opening two connections to the same peer at once
+        self.failures = {} # (ip address, port) -> (number of failed attempts, time of the next allowed attempt)
+        self.eviction_task = None
+
+    async def get_connection(self, peer_ip_addr, peer_port):
+        peer = (peer_ip_addr, peer_port)
+        connection = self.connections.get(peer)
+        if connection is not None and not connection.is_closed():
+            return connection
+
+        async with self.connect_locks.setdefault(peer, asyncio.Lock()):
+            connection = self.connections.get(peer)
+            if connection is not None and not connection.is_closed():
+                return connection
+
+            failures, retry_at = self.failures.get(peer, (0, 0))
+            if time.monotonic() < retry_at:
+                raise ConnectionError(f"Reconnecting to {peer_ip_addr}:{peer_port} is delayed after {failures} failed attempts")
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(peer_ip_addr, peer_port), self.timeout)
+            except Exception:
+                failures += 1
+                delay = min(ConnectionPool.BACKOFF_BASE * 2 ** (failures - 1), ConnectionPool.BACKOFF_MAX)
+                self.failures[peer] = (failures, time.monotonic() + delay)
+                raise
+
+            self.failures.pop(peer, None)
+            client_socket = writer.get_extra_info('socket')
+            if client_socket is not None:
+                client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            connection = PeerConnection(reader, writer, self.max_frame_size)
+            self.connections[peer] = connection
+            self.start_eviction()
+            return connection
+
+    async def send(self, peer_ip_addr, peer_port, data):
+        await self.with_connection(peer_ip_addr, peer_port, lambda connection: connection.send(data))
+
+    async def request(self, peer_ip_addr, peer_port, data):
+        return await self.with_connection(peer_ip_addr, peer_port, lambda connection: connection.request(data))
+
+    async def with_connection(self, peer_ip_addr, peer_port, operation):
+        """ Runs the operation on the pooled connection. If a reused connection turns out to be broken before
+            the message was sent, it's reopened once. A message that might have reached the peer isn't repeated """
+        for attempt in range(0, 2):
+            connection = await self.get_connection(peer_ip_addr, peer_port)
+            messages_sent = connection.messages_sent
+            try:
+                return await asyncio.wait_for(operation(connection), self.timeout)
+            except asyncio.TimeoutError:
+                self.discard(peer_ip_addr, peer_port, connection)
+                raise
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                self.discard(peer_ip_addr, peer_port, connection)
+                reused = messages_sent > 0
+                if attempt == 1 or not reused or connection.messages_sent != messages_sent:
+                    raise
+            except Exception:
+                self.discard(peer_ip_addr, peer_port, connection)
+                raise
+
+    def discard(self, peer_ip_addr, peer_port, connection):
+        connection.close()
+        if self.connections.get((peer_ip_addr, peer_port)) is connection:
+            del self.connections[(peer_ip_addr, peer_port)]
+
+    def evict_idle(self):
+        now = time.monotonic()
+        for (peer_ip_addr, peer_port), connection in list(self.connections.items()):
+            if connection.is_closed() or now - connection.last_used > self.idle_timeout:
+                self.discard(peer_ip_addr, peer_port, connection)
+
+    def start_eviction(self):
+        if self.eviction_task is None or self.eviction_task.done():
+            self.eviction_task = asyncio.get_running_loop().create_task(self.run_eviction())
+
+    async def run_eviction(self):
+        while self.connections:
+            await asyncio.sleep(self.idle_timeout / 2)
+            self.evict_idle()
+
+    async def close(self):
+        if self.eviction_task is not None:
+            self.eviction_task.cancel()
+        for (peer_ip_addr, peer_port), connection in list(self.connections.items()):
+            self.discard(peer_ip_addr, peer_port, connection)
@@ -0,0 +1,62 @@
+class Difficulty:
+    """ Proof of Work difficulty expressed as a 256-bit target. A hash is valid if its value is not above the target """
+    MAX_TARGET = 2 ** 256 - 1
+
+    def __init__(self, target):
+        if not 0 <= target <= Difficulty.MAX_TARGET:
+            raise ValueError("Target must fit in 256 bits")
+        self.target = target
+        self.target_bytes = target.to_bytes(32, 'big')
+
+    @staticmethod
+    def from_zero_bits(bits):
+        """ Difficulty requiring the hash to start with given number of zero bits """
+        return Difficulty(Difficulty.MAX_TARGET >> bits)
+
+    @staticmethod
+    def from_nibbles(nibbles):
+        """ Legacy difficulty - number of leading zeros in the hex representation of the hash """
+        return Difficulty.from_zero_bits(4 * nibbles)
+
+    @staticmethod
+    def from_hex(target_hex):
+        """ Difficulty stored in a block header """
+        if len(target_hex) != 64:
+            raise ValueError("Target must be 64 hex digits")
+        return Difficulty(int(target_hex, 16))
+
+    def to_hex(self):
+        return self.target_bytes.hex()
+
+    @staticmethod
+    def of(difficulty):
+        """ Accepts a Difficulty or a legacy number of hex zeros """
+        if isinstance(difficulty, Difficulty):
+            return difficulty
+        return Difficulty.from_nibbles(difficulty)
+
+    def is_met(self, digest):
+        # Comparing big-endian byte strings of equal length is the same as comparing the integers
+        return digest <= self.target_bytes
+
+    def is_met_by_hex(self, hash_hex):
+        try:
+            digest = bytes.fromhex(hash_hex)
+        except (ValueError, TypeError):
+            return False
+        return len(digest) == 32 and self.is_met(digest)
+
+    def get_work(self):
+        """ Expected number of hashes needed to meet the target """
+        return 2 ** 256 // (self.target + 1)
+
+    def __eq__(self, other):
+        if isinstance(other, Difficulty):
+            return self.target == other.target
+        return False
+
+    def __hash__(self):
+        return hash(self.target)
+
+    def __repr__(self):
+        return f"Difficulty(target={self.target:#066x})"
@@ -0,0 +1,102 @@
+import threading
+from Block import Block
+from Blockchain import Blockchain
+from BlockTree import BlockTree
+from Merkle import Merkle
+from Retarget import Retarget
+
+class HeaderChain:
+    """ Chain of block headers kept by light nodes. Headers are validated like the blocks of a full chain (linkage,
+        hash and Proof of Work), but transactions aren't downloaded: a transaction is confirmed with a Merkle proof
+        against the root in the header of its block. Like full nodes, light nodes follow the chain with the most cumulative work """
+    def __init__(self, difficulty, block_interval=None):
+        self.difficulty = difficulty
+        self.retarget = Retarget(difficulty, block_interval)
+        self.headers = []
+        self.work = [] # Cumulative work of the chain at every height
+        self.heights = {} # Block hash -> height
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.headers)
+
+    def get_tip_hash(self):
+        headers = self.headers
+        return headers[-1]['hash'] if headers else None
+
+    def get_height(self, block_hash):
+        return self.heights.get(block_hash)
+
+    def get_tip_work(self):
+        work = self.work
+        return work[-1] if work else 0
+
+    def has_block(self, block_hash):
+        return block_hash in self.heights
+
+    def get_locator(self):
+        headers = self.headers
+        return [headers[height]['hash'] for height in Blockchain.locator_heights(len(headers))]
+
+    def add_headers(self, headers):
+        """ Connects consecutive headers received from a peer. The chain is switched to them if they give it more cumulative work.
+            Returns False if they are invalid or don't follow a header of the chain """
+        if not headers:
+            return True
+        with self.lock:
+            if headers[0]['index'] == 0:
+                fork_index = -1
+            else:
+                fork_index = self.heights.get(headers[0]['previous_hash'])
+                if fork_index is None:
+                    print("Received headers don't connect to the chain")
+                    return False
+
+            previous_header = self.headers[fork_index] if fork_index >= 0 else None
+            work = self.work[fork_index] if fork_index >= 0 else 0
+            new_work = []
+            # Timestamps of the blocks before the header, for adjusting the difficulty and checking timestamps
+            earlier_headers = self.headers[max(0, fork_index - self.retarget.history):fork_index] if fork_index > 0 else []
+            timestamps = {header['index']: header['timestamp'] for header in earlier_headers}
+            for header in headers:
+                difficulty, median_time = self.retarget.expected(previous_header, timestamps)
+                if difficulty is None or median_time is None or not Block.validate_header(header, previous_header, difficulty, median_time):
+                    print("Received invalid header")
+                    return False
+                previous_header = header
+                work += BlockTree.get_header_work(header, self.difficulty)
+                new_work.append(work)
+
+            if work <= self.get_tip_work():
+                return True # Own chain has at least as much work, the chain that was seen first is kept
+            for header in self.headers[fork_index + 1:]:
+                del self.heights[header['hash']]
+            # Chain is replaced rather than modified, so readers without the lock always see a consistent list
+            self.work = self.work[:fork_index + 1] + new_work
+            self.headers = self.headers[:fork_index + 1] + headers
+            for header in headers:
+                self.heights[header['hash']] = header['index']
+            print(f"Header chain has been updated to height {len(self.headers)}.")
+            return True
+
+    def get_confirmations(self, proof):
+        """ Number of blocks from the tip down to the block containing the transaction (1 if it's in the last block)
+            or 0 if the proof isn't valid for any block of the chain """
+        headers = self.headers
+        height = self.heights.get(proof['block_hash'])
+        if height is None or height >= len(headers) or headers[height]['hash'] != proof['block_hash']:
+            return 0
+        if not Merkle.verify(proof['transaction_id'], proof['proof'], headers[height]['merkle_root']):
+            return 0
+        return len(headers) - height
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        header_chain_str = f"\n====================Header chain======================\n\n"
+        for header in self.headers:
+            header_chain_str += f"Block #{header['index']}:\n"
+            header_chain_str += f" Previous hash: {header['previous_hash']} | Ts: {header['timestamp']}\n"
+            header_chain_str += f" PoW: {header['nonce']} | Hash: {header['hash']}\n Merkle root: {header['merkle_root']}\n"
+        return header_chain_str
@@ -0,0 +1,114 @@
+import asyncio
+from Block import Block
+from HeaderChain import HeaderChain
+from Network import P2PNode, Server
+from Protocol import Protocol
+
+class LightServer(Server):
+    """ Server of a light node. It has no blocks or mempool to share, so requests for them get empty responses
+        and joining nodes are told that its chain is empty, so they never sync from it """
+    async def handle_message(self, message, protocol):
+        loop = asyncio.get_running_loop()
+
+        if message['type'] in ('HELLO', 'NEW_PEER'):
+            self.p2p_node.add_peer(message['ip_address'], message['port'])
+            if protocol != Protocol.JSON:
+                self.p2p_node.set_peer_protocol(message['ip_address'], message['port'], protocol)
+            if message['type'] == 'HELLO':
+                return {'type': 'CHAIN_TIP', 'height': 0, 'hash': '', 'work': 0}
+            return {'type': 'BLOCKCHAIN', 'blockchain': []}
+
+        elif message['type'] == 'BLOCKCHAIN':
+            # Legacy peers send their whole chain, only its headers are kept
+            headers = await loop.run_in_executor(None, LightServer.get_headers, message['blockchain'])
+            self.p2p_node.blockchain.add_headers(headers)
+
+        elif message['type'] == 'NEW_TRANSACTION':
+            pass # Transactions of other nodes aren't tracked
+
+        elif message['type'] in ('GET_BLOCKS', 'GET_BODIES'):
+            return {'type': 'BLOCKS', 'blocks': []}
+
+        elif message['type'] == 'GET_HEADERS':
+            return {'type': 'HEADERS', 'headers': []}
+
+        elif message['type'] == 'GET_TX':
+            return {'type': 'TRANSACTIONS', 'transactions': []}
+
+        elif message['type'] == 'GET_PROOF':
+            return {'type': 'PROOFS', 'proofs': []}
+
+        else:
+            return await super().handle_message(message, protocol)
+
+        return None
+
+    @staticmethod
+    def get_headers(chain_json):
+        return [Block.from_json(block_json).get_header() for block_json in chain_json]
+
+class LightNode(P2PNode):
+    """ Node that keeps only the headers of the blocks, for wallets. Headers are synced from the peers and their Proof of Work
+        is validated, but transactions aren't downloaded: full peers are asked for Merkle proofs of the transactions of interest.
+        Light nodes don't store anything on disk, syncing headers is fast enough to do on every start """
+    def create_blockchain(self, data_dir):
+        return HeaderChain(difficulty = self.difficulty, block_interval = self.block_interval)
+
+    def create_server(self, max_frame_size):
+        return LightServer(self, max_frame_size)
+
+    def connect_and_sync(self):
+        """ Announces the node to every peer and downloads the headers of the chain with the most work """
+        peers = self.get_peers()
+        tips = self.run(self.request_tips(peers))
+        peer_tips = sorted(((tip[2], peer) for peer, tip in zip(peers.items(), tips) if tip is not None), reverse=True)
+        for work, (peer_ip_addr, peer_port) in peer_tips:
+            if work > self.blockchain.get_tip_work():
+                self.run(self.request_headers(peer_ip_addr, peer_port))
+
+    async def request_headers(self, peer_ip_addr, peer_port):
+        """ Fetches the headers that the peer has after the last block both chains share """
+        try:
+            while True:
+                tip = self.blockchain.get_tip_hash()
+                response = await self.client.request({'type': 'GET_HEADERS', 'locator': self.blockchain.get_locator()}, peer_ip_addr, peer_port)
+                headers = response.get('headers', [])
+                if not self.blockchain.add_headers(headers):
+                    return
+                if len(headers) < Protocol.MAX_HEADERS_PER_MESSAGE or self.blockchain.get_tip_hash() == tip:
+                    return
+
+        except Exception as e:
+            print(f"Failure when trying to request headers from {peer_ip_addr}:{peer_port}: {e}")
+
+    async def fetch_inventory(self, peer_ip_addr, peer_port, block_hashes, transaction_ids):
+        """ Fetches headers of the announced blocks. Announced transactions are ignored """
+        if any(not self.blockchain.has_block(block_hash) for block_hash in block_hashes):
+            await self.request_headers(peer_ip_addr, peer_port)
+
+    def add_new_transaction(self, transaction):
+        # Light node has no mempool that peers could fetch the transaction from, so it's sent whole
+        self.run(self.client.broadcast_message({'type': 'NEW_TRANSACTION', 'transaction': transaction.to_json()}, self.get_peers()))
+
+    def confirm_transaction(self, transaction_id):
+        """ Number of blocks from the tip down to the block containing the transaction, 0 if no peer proved it's in the chain """
+        return self.run(self.request_confirmations(transaction_id))
+
+    async def request_confirmations(self, transaction_id):
+        for peer_ip_addr, peer_port in self.get_peers().items():
+            try:
+                response = await self.client.request({'type': 'GET_PROOF', 'ids': [transaction_id]}, peer_ip_addr, peer_port)
+            except Exception as e:
+                print(f"Failure when trying to request proof from {peer_ip_addr}:{peer_port}: {e}")
+                continue
+
+            for proof in response.get('proofs', []):
+                if proof['transaction_id'] != transaction_id:
+                    continue
+                if not self.blockchain.has_block(proof['block_hash']):
+                    # Block could have been mined after the last sync
+                    await self.request_headers(peer_ip_addr, peer_port)
+                confirmations = self.blockchain.get_confirmations(proof)
+                if confirmations > 0:
+                    return confirmations
+        return 0
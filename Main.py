@@ -2,6 +2,7 @@ import socket
 import sys
 from Wallet import Wallet
 from Network import P2PNode
+from LightNode import LightNode
 from Blockchain import Blockchain
 from Transaction import Transaction
 from Block import Block
@@ -23,11 +24,21 @@ class Main:
         print("\nMenu:")
         print("1 - Create a new transaction")
         print("2 - View current blockchain")
-        print("3 - Exit")
-        selection = input("Enter 1, 2 or 3: ")
+        print("3 - Check whether a transaction is in the blockchain")
+        print("4 - Exit")
+        selection = input("Enter 1, 2, 3 or 4: ")
 
-        if selection == "3":
+        if selection == "4":
             return False
+
+        if selection == "3":
+            transaction_id = input("Input transaction id: ")
+            confirmations = self.node.confirm_transaction(transaction_id)
+            if confirmations > 0:
+                print(f"Transaction is in the blockchain, confirmed by {confirmations} block(s).")
+            else:
+                print("Transaction isn't in the blockchain yet.")
+            return True
         
         if selection == "2":
             print(str(self.node.blockchain))
@@ -36,7 +47,8 @@ class Main:
         if selection == "1":
             recipient_public_key = input("Input recipient public key: ")
             amount = int(input("Input amount: "))
-            self.create_new_transaction(recipient_public_key, amount)
+            fee = input("Input fee (transactions with higher fees are added to blocks first, 0 by default): ")
+            self.create_new_transaction(recipient_public_key, amount, int(fee) if fee else 0)
             return True
     
     def setup_interface(self):
@@ -64,21 +76,32 @@ class Main:
             print("Please enter your public key (press Enter, Ctrl+Z and again Enter to finish):")
             public_key = sys.stdin.read()
         
-        self.setup(server_ip, server_port, peer_ip, peer_port, private_key, public_key)
+        # Light nodes keep only block headers and check their transactions with proofs from the other nodes
+        light = input("Run as a light node, without downloading whole blocks? (yes/no): ").lower() == "yes"
 
-    def setup(self, server_ip, server_port, peer_ip, peer_port, private_key, public_key):
-        self.node = P2PNode(server_ip, server_port)
+        # Directory for the blocks, the chain is kept only in memory without it
+        data_dir = None
+        if not light:
+            data_dir = input("Input directory for blockchain data (leave empty to not store it on disk): ") or None
+
+        self.setup(server_ip, server_port, peer_ip, peer_port, private_key, public_key, data_dir, light)
+
+    def setup(self, server_ip, server_port, peer_ip, peer_port, private_key, public_key, data_dir=None, light=False):
+        if light:
+            self.node = LightNode(server_ip, server_port)
+        else:
+            self.node = P2PNode(server_ip, server_port, data_dir=data_dir)
         if (peer_ip and peer_port):
             self.node.join_network(peer_ip, peer_port)
         
         self.wallet = Wallet(private_key, public_key)
     
-    def create_new_transaction(self, recipient_public_key, amount):
-        transaction = Transaction(sender_public_key_bytes=self.wallet.get_public_key(), recipient_public_key=recipient_public_key, amount=amount)
+    def create_new_transaction(self, recipient_public_key, amount, fee=0):
+        transaction = Transaction(sender_public_key_bytes=self.wallet.get_public_key(), recipient_public_key=recipient_public_key, amount=amount, fee=fee)
         transaction.sign_transaction(self.wallet)
 
         if transaction.is_valid():
-            print("Adding the new transaction to the blockchain and broadcasting it...")
+            print(f"Adding the new transaction {transaction.get_id()} to the blockchain and broadcasting it...")
             self.node.add_new_transaction(transaction)
         else:
             print("Transaction is invalid.")
@@ -0,0 +1,109 @@
+import heapq
+import time
+from BalanceIndex import BalanceIndex
+
+class Mempool:
+    """ Transactions that aren't in any block yet, indexed by transaction id. Insertion order is preserved.
+        Transactions are also kept in a heap ordered by fee rate (fee per byte of the encoded transaction), older first
+        when the rates are equal, so blocks can be filled with the most profitable transactions. Removed transactions
+        are left in the heap and skipped, until there are more of them than the transactions in the mempool """
+    EXPIRY = 24 * 60 * 60 # Seconds after which a transaction that didn't get into a block is dropped
+
+    def __init__(self, expiry=EXPIRY):
+        self.expiry = expiry
+        self.transactions = {}
+        self.entries = {} # Transaction id -> (size, time when it was added)
+        self.heap = [] # (-fee rate, timestamp, transaction id)
+        self.balance_changes = {} # Address -> change of its balance once all transactions in the mempool are applied
+
+    def add(self, transaction):
+        """ Adds the transaction, returns False if it's already in the mempool """
+        transaction_id = transaction.get_id()
+        if transaction_id in self.transactions:
+            return False
+        size = transaction.get_size()
+        self.transactions[transaction_id] = transaction
+        self.entries[transaction_id] = (size, time.time())
+        heapq.heappush(self.heap, (-transaction.fee / size, transaction.timestamp, transaction_id))
+        BalanceIndex.record(self.balance_changes, transaction)
+        return True
+
+    def remove(self, transaction):
+        transaction_id = transaction.get_id()
+        transaction = self.transactions.pop(transaction_id)
+        del self.entries[transaction_id]
+        BalanceIndex.record(self.balance_changes, transaction, reverse=True)
+        self.compact()
+
+    def discard_all(self, transactions):
+        """ Removes the transactions that are in the mempool, ignores the others """
+        for transaction in transactions:
+            transaction_id = transaction.get_id()
+            transaction = self.transactions.pop(transaction_id, None)
+            if transaction is not None:
+                del self.entries[transaction_id]
+                BalanceIndex.record(self.balance_changes, transaction, reverse=True)
+        self.compact()
+
+    def compact(self):
+        if len(self.heap) > 2 * len(self.transactions):
+            self.heap = [entry for entry in self.heap if entry[2] in self.transactions]
+            heapq.heapify(self.heap)
+
+    def expire(self, now=None):
+        """ Removes transactions that have been waiting longer than the expiry time. Returns them """
+        deadline = (now if now is not None else time.time()) - self.expiry
+        expired = [self.transactions[transaction_id] for transaction_id, (size, added) in self.entries.items() if added < deadline]
+        self.discard_all(expired)
+        return expired
+
+    def select(self, max_size=None, max_count=None, accept=None):
+        """ Transactions in order of priority that fit in max_size bytes and max_count transactions.
+            Transactions for which accept(transaction, selected transactions) returns False are skipped.
+            The mempool isn't modified """
+        selected = []
+        selected_ids = set()
+        size = 0
+        for entry in self.entries_by_priority():
+            if max_count is not None and len(selected) >= max_count:
+                break
+            transaction = self.transactions.get(entry[2])
+            if transaction is None or entry[2] in selected_ids:
+                continue # Removed (and possibly added again)
+            transaction_size = self.entries[entry[2]][0]
+            if max_size is not None and size + transaction_size > max_size:
+                continue # Smaller transactions may still fit
+            if accept is not None and not accept(transaction, selected):
+                continue
+            selected.append(transaction)
+            selected_ids.add(entry[2])
+            size += transaction_size
+        return selected
+
+    def entries_by_priority(self):
+        """ Entries of the heap in order, without copying or modifying it. Children of a heap entry are never before it,
+            so only entries whose parents were already yielded are compared - the cost depends on the number of
+            entries taken, not on the size of the mempool """
+        heap = self.heap
+        frontier = [(heap[0], 0)] if heap else [] # (entry, position in the heap)
+        while frontier:
+            entry, position = heapq.heappop(frontier)
+            yield entry
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+
+    def get(self, transaction_id):
+        return self.transactions.get(transaction_id)
+
+    def copy(self):
+        return list(self.transactions.values())
+
+    def __contains__(self, transaction):
+        return transaction.get_id() in self.transactions
+
+    def __len__(self):
+        return len(self.transactions)
+
+    def __iter__(self):
+        return iter(list(self.transactions.values()))
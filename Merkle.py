@@ -0,0 +1,66 @@
+import hashlib
+
+class Merkle:
+    """ Merkle tree over transaction ids. The root commits to all transactions of a block, so a single transaction
+        is proven to be in the block with the hashes on the path to the root (log2 of the number of transactions).
+        Leaves and inner nodes are hashed with different prefixes, so an inner node can't be passed off as a leaf.
+        Last node of a level with an odd number of nodes is moved up unchanged, instead of being paired with itself,
+        so no two different lists of transactions have the same root """
+    EMPTY_ROOT = hashlib.sha256(b'').hexdigest()
+    LEFT = 'L'
+    RIGHT = 'R'
+
+    @staticmethod
+    def hash_leaf(transaction_id):
+        return hashlib.sha256(b'\x00' + bytes.fromhex(transaction_id)).digest()
+
+    @staticmethod
+    def hash_node(left, right):
+        return hashlib.sha256(b'\x01' + left + right).digest()
+
+    @staticmethod
+    def next_level(level):
+        next_level = [Merkle.hash_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2 == 1:
+            next_level.append(level[-1])
+        return next_level
+
+    @staticmethod
+    def root(transaction_ids):
+        if not transaction_ids:
+            return Merkle.EMPTY_ROOT
+        level = [Merkle.hash_leaf(transaction_id) for transaction_id in transaction_ids]
+        while len(level) > 1:
+            level = Merkle.next_level(level)
+        return level[0].hex()
+
+    @staticmethod
+    def proof(transaction_ids, position):
+        """ Hashes needed to calculate the root from the transaction at the position, from the bottom of the tree.
+            Each is given with the side it's on: [(hash, 'L' or 'R'), ...] """
+        if not 0 <= position < len(transaction_ids):
+            raise IndexError("Transaction position out of range")
+        proof = []
+        level = [Merkle.hash_leaf(transaction_id) for transaction_id in transaction_ids]
+        while len(level) > 1:
+            sibling = position ^ 1
+            if sibling < len(level): # Otherwise the node is moved up without a pair
+                proof.append((level[sibling].hex(), Merkle.LEFT if sibling < position else Merkle.RIGHT))
+            level = Merkle.next_level(level)
+            position //= 2
+        return proof
+
+    @staticmethod
+    def verify(transaction_id, proof, root):
+        try:
+            node = Merkle.hash_leaf(transaction_id)
+            for sibling, side in proof:
+                if side == Merkle.LEFT:
+                    node = Merkle.hash_node(bytes.fromhex(sibling), node)
+                elif side == Merkle.RIGHT:
+                    node = Merkle.hash_node(node, bytes.fromhex(sibling))
+                else:
+                    return False
+        except ValueError: # Not hex hashes
+            return False
+        return node.hex() == root
@@ -0,0 +1,136 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+from Difficulty import Difficulty
+
+def midstate(prefix):
+    """ SHA-256 state after absorbing the part of the block that does not depend on the nonce """
+    return hashlib.sha256(prefix.encode())
+
+def search_nonces(prefix, start, step, target, stop_event, end=None):
+    """ Tries nonces start, start + step, start + 2 * step, ... until a digest is not above the target.
+        Returns (nonce, hash), or None if it got past the end or was stopped """
+    state = midstate(prefix)
+    nonce = start
+    while not stop_event.is_set():
+        for _ in range(10000):
+            if end is not None and nonce > end:
+                return None
+            sha = state.copy()
+            sha.update(str(nonce).encode())
+            if sha.digest() <= target:
+                return nonce, sha.hexdigest()
+            nonce += step
+    return None
+
+def mining_worker(jobs, results, stop_event):
+    """ Worker process: searches its part of the nonce space of every job it gets, until it gets None """
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id, prefix, start, step, target, end = job
+        results.put((job_id, search_nonces(prefix, start, step, target, stop_event, end)))
+
+class Miner:
+    """ Searches for nonces. With more than one worker the search is split between worker processes, which are started
+        on the first search and kept until the miner is closed, so mining many blocks (or a block in many rounds)
+        doesn't start new processes """
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = []
+        self.jobs = None
+        self.results = None
+        self.stop_event = None
+        self.job_id = 0
+        self.lock = threading.Lock() # One search at a time
+
+    def mine(self, block, difficulty, max_nonces=None):
+        """ Searches for a nonce after block.nonce that satisfies the difficulty. Returns (nonce, hash) or None if mining
+            was stopped or none of the next max_nonces nonces satisfies it """
+        difficulty = Difficulty.of(difficulty)
+        if difficulty.is_met_by_hex(block.hash):
+            return block.nonce, block.hash
+        end = block.nonce + max_nonces if max_nonces is not None else None
+        if self.workers == 1:
+            return self.mine_in_process(block, difficulty, end)
+        return self.mine_in_pool(block, difficulty, end)
+
+    def mine_in_process(self, block, difficulty, end=None):
+        target = difficulty.target_bytes
+        state = midstate(block.hash_prefix())
+        nonce = block.nonce
+        while not block.stop_mining and (end is None or nonce < end):
+            nonce += 1
+            sha = state.copy()
+            sha.update(str(nonce).encode())
+            if sha.digest() <= target:
+                return nonce, sha.hexdigest()
+        return None
+
+    def start_pool(self):
+        if self.processes:
+            return
+        self.jobs = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.processes = [
+            multiprocessing.Process(target=mining_worker, args=(self.jobs, self.results, self.stop_event), daemon=True)
+            for _ in range(self.workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def mine_in_pool(self, block, difficulty, end=None):
+        with self.lock:
+            self.start_pool()
+            self.job_id += 1
+            # Nonce space is interleaved between the workers, so together they cover every nonce exactly once
+            prefix = block.hash_prefix()
+            for i in range(self.workers):
+                self.jobs.put((self.job_id, prefix, block.nonce + 1 + i, self.workers, difficulty.target_bytes, end))
+
+            result = None
+            finished = 0 # Workers that are done with the job
+            while finished < self.workers:
+                if result is not None or block.stop_mining:
+                    self.stop_event.set()
+                try:
+                    job_id, worker_result = self.results.get(timeout=0.05)
+                except queue.Empty:
+                    if any(not process.is_alive() for process in self.processes):
+                        # Worker was killed and will never report. Pool is started again with the next search
+                        print("Mining worker process died, restarting the pool")
+                        self.drop_pool()
+                        return result
+                    continue
+                if job_id != self.job_id:
+                    continue
+                finished += 1
+                if result is None:
+                    result = worker_result
+            # Every worker is idle again, so the next job can't be stopped by this one
+            self.stop_event.clear()
+            return result
+
+    def drop_pool(self):
+        """ Terminates the worker processes. Queues are dropped as well, since a killed worker may have left them broken """
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        self.jobs = None
+        self.results = None
+        self.stop_event = None
+
+    def close(self):
+        """ Stops the worker processes """
+        with self.lock:
+            for _ in self.processes:
+                self.jobs.put(None)
+            for process in self.processes:
+                process.join()
+            self.processes = []
@@ -0,0 +1,126 @@
+import threading
+import time
+from Miner import Miner
+
+class MinerController:
+    """ Mines continuously on a worker thread. The blockchain notifies the controller about every change of the mempool
+        or of the tip. Changes of the mempool are collected for a short time (debounce) before the block template is
+        rebuilt, a change of the tip stops the current block at once. Nonces are searched in rounds by worker processes
+        that stay alive between rounds and templates. If the rebuilt template has the same header as the mined block,
+        mining continues from the last searched nonce. Rounds are sized to take about ROUND_TIME, so a rebuilt template
+        is picked up soon on slow machines and rounds aren't too short on fast ones """
+    DEBOUNCE = 0.5 # Seconds for which changes of the mempool are collected before the template is rebuilt
+    ROUND_TIME = 0.5
+    NONCES_PER_ROUND = 100000 # Size of the first round, before the hash rate is known
+
+    def __init__(self, blockchain, workers=None, debounce=DEBOUNCE, nonces_per_round=NONCES_PER_ROUND, round_time=ROUND_TIME):
+        self.blockchain = blockchain
+        self.miner = Miner(workers)
+        self.debounce = debounce
+        self.nonces_per_round = nonces_per_round
+        self.round_time = round_time
+        self.condition = threading.Condition()
+        self.block = None # Currently mined block
+        self.changed_at = None # Time of the first change that the template doesn't include yet
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            if self.block is not None:
+                self.block.stop_mining = True
+            self.condition.notify_all()
+            thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.miner.close()
+
+    def update(self, tip_changed=False):
+        """ Schedules rebuilding of the template. The worker is started on the first change """
+        with self.condition:
+            now = time.time()
+            if tip_changed:
+                # Block that doesn't follow the tip can't be added to the chain, it's rebuilt without waiting
+                if self.block is not None:
+                    self.block.stop_mining = True
+                    self.block = None
+                    print("Mining stopped due to chain change.")
+                self.changed_at = now - self.debounce
+            elif self.changed_at is None:
+                self.changed_at = now
+            self.condition.notify_all()
+        self.start()
+
+    def is_rebuild_due(self):
+        return self.changed_at is not None and time.time() >= self.changed_at + self.debounce
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.block is None and not self.is_rebuild_due():
+                    timeout = self.changed_at + self.debounce - time.time() if self.changed_at is not None else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                rebuild = self.is_rebuild_due()
+                if rebuild:
+                    self.changed_at = None
+            block = None
+            try:
+                if rebuild:
+                    self.rebuild_template()
+                block = self.block
+                if block is not None:
+                    self.mine_round(block)
+            except Exception as e:
+                # Worker keeps running, the template is rebuilt on the next change
+                print(f"Mining failed: {e}")
+                with self.condition:
+                    if block is not None and self.block is block:
+                        self.block = None
+
+    def rebuild_template(self):
+        template = self.blockchain.create_mining_template()
+        with self.condition:
+            if self.is_rebuild_due():
+                return # Tip changed while the template was created, it's rebuilt again
+            block = self.block
+            if template is not None and block is not None and (template.previous_hash, template.merkle_root) == (block.previous_hash, block.merkle_root):
+                return # Same transactions on the same tip, nonces searched so far stay searched
+            if block is not None:
+                block.stop_mining = True
+            self.block = template
+        if template is not None:
+            print(f"Created new block with {len(template.data)} transactions. Mining it...")
+
+    def mine_round(self, block):
+        """ Searches the next nonces of the block and adds it to the chain if one of them satisfies the difficulty """
+        nonces = self.nonces_per_round
+        started = time.time()
+        result = self.miner.mine(block, block.get_difficulty(), nonces)
+        if result is None:
+            if not block.stop_mining:
+                block.nonce += nonces # Every nonce of the round was searched
+                elapsed = time.time() - started
+                if elapsed > 0:
+                    self.nonces_per_round = max(1000, int(nonces * self.round_time / elapsed))
+            return
+
+        block.nonce, block.hash = result
+        print("Mining finished.")
+        with self.condition:
+            if self.block is not block:
+                return # Template was replaced meanwhile
+            self.block = None
+        # Adding the block changes the tip, which schedules the next template
+        if not self.blockchain.add_mined_block(block):
+            self.update()
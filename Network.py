@@ -1,204 +1,469 @@
-import socket
+import asyncio
+import os
 import threading
 import json
-import time
 from Blockchain import Blockchain
 from Transaction import Transaction
+from Protocol import Protocol, FrameReader
+from ConnectionPool import ConnectionPool
+from ChainSync import ChainSync
+from BlockStore import BlockStore
+from ChainIndex import ChainIndex
 
 class Server:
-    def __init__(self, p2p_node):
+    def __init__(self, p2p_node, max_frame_size=Protocol.MAX_FRAME_SIZE):
         self.p2p_node = p2p_node
-        self.is_running = True
-        self.server_thread = threading.Thread(target=self.start_server)
-        self.server_thread.start()
-    
-    def start_server(self):
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.bind((self.p2p_node.ip_address, self.p2p_node.port))
-        server_socket.listen(5)
+        self.max_frame_size = max_frame_size
+        self.server = None
+        self.connections = {} # Handler task -> writer of every open connection
+        self.fetches = set() # Running fetches of announced inventory, kept so they aren't garbage collected
+
+    async def start_server(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.p2p_node.ip_address, self.p2p_node.port)
         print(f"Server started on port {self.p2p_node.ip_address}:{self.p2p_node.port}")
 
-        while self.is_running:
-            try:
-                client_socket, addr = server_socket.accept()
-                threading.Thread(target=self.handle_request, args=(client_socket,)).start()
-            except Exception as e:
-                print(f"Server encountered an error: {e}")
-                break
-    
-    def handle_request(self, client_socket):
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections[task] = writer
         try:
-            data = client_socket.recv(8192).decode('utf-8')
-            if not data:
-                return
-
-            message = json.loads(data)
-
-            if message['type'] == 'PEERS_REQ': # Request for the list of peers
-                response = json.dumps({'type': 'PEERS', 'peers': self.p2p_node.peers})
-                client_socket.send(response.encode('utf-8'))
-
-            elif message['type'] == 'LEAVE':
-                # Peer leaves the network
-                self.p2p_node.remove_peer(message['ip_address'], message['port'])
-
-            elif message['type'] == 'NEW_PEER':
-                # New peer joined the network, respond with the current chain of blocks
-                response = json.dumps({
-                    'type': 'BLOCKCHAIN',
-                    'blockchain': [block.to_json() for block in self.p2p_node.blockchain.chain]
-                })
-                client_socket.send(response.encode('utf-8'))
-                self.p2p_node.add_peer(message['ip_address'], message['port'])
-            
-            elif message['type'] == 'NEW_TRANSACTION':
-                # Received new transaction
-                transaction = Transaction.from_json(message['transaction'])
-                self.p2p_node.blockchain.add_new_transaction(transaction)
-
-            elif message['type'] == 'BLOCKCHAIN':
-                self.p2p_node.blockchain.compare_replace(message['blockchain'])
+            frame_reader = FrameReader(reader, self.max_frame_size)
+            # Peers keep connections open and send many framed messages over them
+            while True:
+                request = await frame_reader.read_message()
+                if request is None:
+                    return
+
+                message, protocol = request
+                try:
+                    # Respond in the best encoding that the peer supports
+                    response_protocol = max(protocol, Protocol.negotiate(message))
+                    response = await self.handle_message(message, response_protocol)
+                except Exception as e:
+                    # Invalid message is skipped. Connection stays open, so messages queued behind it on it aren't lost
+                    print(f"Server could not handle the message: {e}")
+                    response = None
+
+                if response is not None:
+                    # Responses with many blocks are large, so they are encoded off the event loop
+                    writer.write(await asyncio.get_running_loop().run_in_executor(None, Protocol.encode_frame, response, response_protocol))
+                    await writer.drain()
+
+                if protocol == Protocol.JSON:
+                    return # JSON messages aren't framed, so there is only one per connection
 
         except Exception as e:
             print(f"Server encountered an error: {e}")
         finally:
-            client_socket.close()
+            self.connections.pop(task, None)
+            writer.close()
 
-    def close(self):
-        self.is_running = False
-        try:
-            temp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            temp_socket.connect((self.p2p_node.ip_address, self.p2p_node.port))
-            temp_socket.close()
-        except Exception as e:
-            print(f"Error while trying to stop the server: {e}")
+    async def handle_message(self, message, protocol):
+        """ Handles the request and returns the response message (None if there is nothing to respond) """
+        loop = asyncio.get_running_loop()
+
+        if message['type'] == 'PEERS_REQ': # Request for the list of peers
+            return {'type': 'PEERS', 'peers': self.p2p_node.get_peers()}
+
+        elif message['type'] == 'LEAVE':
+            # Peer leaves the network
+            self.p2p_node.remove_peer(message['ip_address'], message['port'])
+
+        elif message['type'] == 'NEW_PEER':
+            # New peer joined the network, respond with the current chain of blocks. Serializing it is kept off the event loop
+            response = {
+                'type': 'BLOCKCHAIN',
+                'blockchain': await loop.run_in_executor(None, self.get_chain_json)
+            }
+            self.p2p_node.add_peer(message['ip_address'], message['port'])
+            if protocol != Protocol.JSON:
+                self.p2p_node.set_peer_protocol(message['ip_address'], message['port'], protocol)
+            return response
+
+        elif message['type'] == 'HELLO':
+            # New peer joined the network and syncs headers first, so only the tip of the chain and its cumulative work are sent
+            blockchain = self.p2p_node.blockchain
+            response = {'type': 'CHAIN_TIP', 'height': len(blockchain.chain), 'hash': blockchain.get_tip_hash() or '',
+                        'work': blockchain.block_tree.get_tip_work()}
+            self.p2p_node.add_peer(message['ip_address'], message['port'])
+            if protocol != Protocol.JSON:
+                self.p2p_node.set_peer_protocol(message['ip_address'], message['port'], protocol)
+            return response
+
+        elif message['type'] == 'NEW_TRANSACTION':
+            # Received new transaction. Verification and mining are CPU heavy, so they are kept off the event loop
+            transaction = Transaction.from_json(message['transaction'])
+            await loop.run_in_executor(None, self.p2p_node.blockchain.add_new_transaction, transaction)
+
+        elif message['type'] == 'BLOCKCHAIN':
+            await loop.run_in_executor(None, self.p2p_node.blockchain.compare_replace, message['blockchain'])
+
+        elif message['type'] == 'INV':
+            # Peer announces new blocks and transactions, only the missing ones are fetched from it
+            if protocol != Protocol.JSON:
+                self.p2p_node.set_peer_protocol(message['ip_address'], message['port'], protocol)
+            # The fetch runs as its own task. Awaiting it here would stop this connection from serving requests, and two peers
+            # announcing to each other at once would then wait for each other's responses until the timeout
+            fetch = loop.create_task(self.p2p_node.fetch_inventory(message['ip_address'], message['port'], message['blocks'], message['transactions']))
+            self.fetches.add(fetch)
+            fetch.add_done_callback(self.fetch_done)
+
+        elif message['type'] == 'GET_BLOCKS':
+            # Blocks are read from the store and decoded, so lookups are kept off the event loop as well
+            blocks = await loop.run_in_executor(None, self.p2p_node.blockchain.get_blocks_after, message['locator'], Protocol.MAX_BLOCKS_PER_MESSAGE)
+            return {'type': 'BLOCKS', 'blocks': blocks}
+
+        elif message['type'] == 'GET_HEADERS':
+            headers = await loop.run_in_executor(None, self.p2p_node.blockchain.get_headers_after, message['locator'], Protocol.MAX_HEADERS_PER_MESSAGE)
+            return {'type': 'HEADERS', 'headers': headers}
+
+        elif message['type'] == 'GET_BODIES':
+            blocks = await loop.run_in_executor(None, self.p2p_node.blockchain.get_blocks, message['hashes'][:Protocol.MAX_BLOCKS_PER_MESSAGE])
+            return {'type': 'BLOCKS', 'blocks': blocks}
+
+        elif message['type'] == 'GET_TX':
+            mempool = self.p2p_node.blockchain.mempool
+            transactions = (mempool.get(transaction_id) for transaction_id in message['ids'])
+            return {'type': 'TRANSACTIONS', 'transactions': [tx.to_json() for tx in transactions if tx is not None]}
+
+        elif message['type'] == 'GET_PROOF':
+            # Light node asks for proofs that its transactions are in the chain
+            proofs = await loop.run_in_executor(None, self.get_proofs, message['ids'])
+            return {'type': 'PROOFS', 'proofs': proofs}
+
+        return None
+
+    def get_chain_json(self):
+        return [block.to_json() for block in self.p2p_node.blockchain.chain]
+
+    def get_proofs(self, transaction_ids):
+        proofs = (self.p2p_node.blockchain.get_transaction_proof(transaction_id) for transaction_id in transaction_ids)
+        return [proof for proof in proofs if proof is not None]
+
+    def fetch_done(self, fetch):
+        self.fetches.discard(fetch)
+        if not fetch.cancelled() and fetch.exception() is not None:
+            print(f"Failure when trying to fetch announced inventory: {fetch.exception()}")
 
+    async def close(self):
+        for fetch in list(self.fetches):
+            fetch.cancel()
+        await asyncio.gather(*self.fetches, return_exceptions=True)
+        if self.server is not None:
+            self.server.close()
+            # Peers keep their connections open. Closing them ends handlers waiting for next messages
+            tasks = list(self.connections)
+            for writer in self.connections.values():
+                writer.close()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.wait_closed()
         print(f"Server on {self.p2p_node.ip_address}:{self.p2p_node.port} has been closed.")
 
 class Client:
-    def __init__(self, p2p_node):
+    TIMEOUT = 30 # Seconds to wait for a single peer
+
+    def __init__(self, p2p_node, max_frame_size=Protocol.MAX_FRAME_SIZE, timeout=TIMEOUT):
         self.p2p_node = p2p_node
-    
-    def request_peers(self, peer_ip_addr, peer_port):
+        self.max_frame_size = max_frame_size
+        self.timeout = timeout
+        self.pool = ConnectionPool(max_frame_size, timeout) # Connections to peers that support framed messages
+
+    async def request_peers(self, peer_ip_addr, peer_port):
         try:
             print(f"Trying to receive list of peers from {peer_ip_addr}:{peer_port}...")
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((peer_ip_addr, peer_port))
-            message = json.dumps({'type': 'PEERS_REQ'})
-            client_socket.send(message.encode('utf-8'))
-
             # Receive the list of the known peers
-            data = client_socket.recv(8192).decode('utf-8')
-            response = json.loads(data)
+            response = await self.request({'type': 'PEERS_REQ', 'protocols': Protocol.SUPPORTED}, peer_ip_addr, peer_port)
             if response['type'] == 'PEERS':
                 self.p2p_node.update_peers(response['peers'])
 
         except Exception as e:
             print(f"Error connecting to {peer_ip_addr}:{peer_port}: {e}")
-        finally:
-            client_socket.close()
 
-    def request_chain(self, peer_ip_addr, peer_port):
+    async def request_tip(self, peer_ip_addr, peer_port):
+        """ Announces this node to the peer. Returns (height, hash of the last block, cumulative work) of the peer's chain
+            or None if the peer doesn't support headers-first sync """
         try:
-            # Send information about new peer in the network
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((peer_ip_addr, peer_port))
-            message = json.dumps({'type': 'NEW_PEER', 'ip_address': self.p2p_node.ip_address, 'port': self.p2p_node.port})
-            client_socket.send(message.encode('utf-8'))
-
-            # Receive copy of the blockchain
-            data = client_socket.recv(8192).decode('utf-8')
-            response = json.loads(data)
+            response = await self.request({
+                'type': 'HELLO',
+                'ip_address': self.p2p_node.ip_address,
+                'port': self.p2p_node.port,
+                'protocols': Protocol.SUPPORTED
+            }, peer_ip_addr, peer_port)
+            if response['type'] == 'CHAIN_TIP':
+                return response['height'], response['hash'], response['work']
+
+        except Exception as e:
+            print(f"Failure when trying to request chain tip from {peer_ip_addr}:{peer_port}: {e}")
+        return None
+
+    async def request_chain(self, peer_ip_addr, peer_port):
+        try:
+            # Send information about new peer in the network and receive copy of the blockchain
+            response = await self.request({
+                'type': 'NEW_PEER',
+                'ip_address': self.p2p_node.ip_address,
+                'port': self.p2p_node.port,
+                'protocols': Protocol.SUPPORTED
+            }, peer_ip_addr, peer_port)
             if response['type'] == 'BLOCKCHAIN':
-                client_socket.close()
                 return response['blockchain']
-
-            client_socket.close()
             return []
 
         except Exception as e:
             print(f"Failure when trying to request chain from {peer_ip_addr}:{peer_port}: {e}")
             return []
-            
-    def send_message_to_peer(self, message, peer_ip_addr, peer_port):
+
+    async def request_blocks(self, peer_ip_addr, peer_port):
+        """ Fetches the blocks that the peer has after the last block both chains share """
+        loop = asyncio.get_running_loop()
+        blockchain = self.p2p_node.blockchain
+        try:
+            locator = blockchain.get_locator()
+            while True:
+                response = await self.request({'type': 'GET_BLOCKS', 'locator': locator}, peer_ip_addr, peer_port)
+                blocks = response.get('blocks', [])
+                if not await loop.run_in_executor(None, blockchain.add_blocks, blocks):
+                    return
+                # A full batch means that the peer may have more blocks. They follow the last received block, even if it
+                # was kept in a side branch (a fork deeper than one batch gets more work only with the next batches)
+                if len(blocks) < Protocol.MAX_BLOCKS_PER_MESSAGE or blockchain.get_known_block(blocks[-1]['hash']) is None:
+                    return
+                locator = [blocks[-1]['hash']]
+
+        except Exception as e:
+            print(f"Failure when trying to request blocks from {peer_ip_addr}:{peer_port}: {e}")
+
+    async def request_transactions(self, transaction_ids, peer_ip_addr, peer_port):
+        try:
+            response = await self.request({'type': 'GET_TX', 'ids': transaction_ids}, peer_ip_addr, peer_port)
+            return [Transaction.from_json(transaction_json) for transaction_json in response.get('transactions', [])]
+
+        except Exception as e:
+            print(f"Failure when trying to request transactions from {peer_ip_addr}:{peer_port}: {e}")
+            return []
+
+    async def request(self, message, peer_ip_addr, peer_port):
+        """ Sends the request and waits for the response. Requests to peers with unknown encoding
+            are sent as JSON (understood by every peer) over a new connection """
+        protocol = self.p2p_node.get_peer_protocol(peer_ip_addr, peer_port)
+        if protocol == Protocol.JSON:
+            return await asyncio.wait_for(self.exchange(message, peer_ip_addr, peer_port), self.timeout)
+
+        response, protocol = await self.pool.request(peer_ip_addr, peer_port, Protocol.encode_frame(message, protocol))
+        return response
+
+    async def exchange(self, message, peer_ip_addr, peer_port):
+        reader, writer = await asyncio.open_connection(peer_ip_addr, peer_port)
         try:
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((peer_ip_addr, peer_port))
-            client_socket.send(message.encode('utf-8'))
-            client_socket.close()
-            print(f"Sent message {message} to {peer_ip_addr}:{peer_port}")
+            writer.write(json.dumps(message).encode('utf-8'))
+            await writer.drain()
+
+            response = await FrameReader(reader, self.max_frame_size).read_message()
+            if response is None:
+                raise ConnectionError("Peer closed the connection without responding")
+            response, protocol = response
+            if protocol != Protocol.JSON:
+                # Peer responded in a newer encoding, so it can be used for the next messages as well
+                self.p2p_node.set_peer_protocol(peer_ip_addr, peer_port, protocol)
+            return response
+        finally:
+            writer.close()
+
+    async def send_message_to_peer(self, message, peer_ip_addr, peer_port):
+        """ Sends already encoded message (str or bytes) """
+        try:
+            if self.p2p_node.get_peer_protocol(peer_ip_addr, peer_port) == Protocol.JSON:
+                await asyncio.wait_for(self.send(message, peer_ip_addr, peer_port), self.timeout)
+            else:
+                await self.pool.send(peer_ip_addr, peer_port, message)
+            print(f"Sent message {message[:100]} to {peer_ip_addr}:{peer_port}")
         except Exception as e:
             print(f"Failure when trying to send the message to {peer_ip_addr}:{peer_port}: {e}")
 
+    async def send(self, message, peer_ip_addr, peer_port):
+        reader, writer = await asyncio.open_connection(peer_ip_addr, peer_port)
+        try:
+            writer.write(message.encode('utf-8') if isinstance(message, str) else message)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def broadcast_message(self, message, peers):
+        """ Sends the message to all peers concurrently, each in the encoding it supports. Message is encoded once per encoding """
+        encoded = {}
+        sends = []
+        for peer_ip_addr, peer_port in peers.items():
+            protocol = self.p2p_node.get_peer_protocol(peer_ip_addr, peer_port)
+            if protocol not in encoded:
+                encoded[protocol] = Protocol.encode_frame(message, protocol)
+            sends.append(self.send_message_to_peer(encoded[protocol], peer_ip_addr, peer_port))
+        await asyncio.gather(*sends)
+
+    async def close(self):
+        await self.pool.close()
+
 class P2PNode:
-    def __init__(self, ip_address, port):
+    """ Node of the network. Networking runs on a single asyncio event loop in a background thread,
+        public methods are blocking and can be called from any other thread """
+    DIFFICULTY = 4 # Leading hex zeros of the hash of the first blocks
+    BLOCK_INTERVAL = 10 # Seconds between blocks that the difficulty is adjusted for
+
+    def __init__(self, ip_address, port, max_frame_size=Protocol.MAX_FRAME_SIZE, data_dir=None,
+                 difficulty=DIFFICULTY, block_interval=BLOCK_INTERVAL):
         self.ip_address = ip_address
         self.port = port
+        self.difficulty = difficulty
+        self.block_interval = block_interval
         self.peers = {}
+        self.peer_protocols = {} # Encodings supported by peers, JSON is assumed if peer isn't here
         self.lock = threading.Lock()
-        self.server = Server(self)
-        self.client = Client(self)
-        self.blockchain = Blockchain(difficulty = 4, broadcast_cb = self.broadcast_blockchain)
-    
+        self.blockchain = self.create_blockchain(data_dir)
+        self.server = self.create_server(max_frame_size)
+        self.client = Client(self, max_frame_size)
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        self.run(self.server.start_server())
+
+    def create_blockchain(self, data_dir):
+        # Blocks are stored on disk if the directory is given, so the node can restart without downloading them again
+        block_store = BlockStore(data_dir) if data_dir is not None else None
+        chain_index = ChainIndex(os.path.join(data_dir, 'index')) if data_dir is not None else None
+        return Blockchain(difficulty = self.difficulty, broadcast_cb = self.announce_block, block_store = block_store, chain_index = chain_index,
+                          block_interval = self.block_interval)
+
+    def create_server(self, max_frame_size):
+        return Server(self, max_frame_size)
+
+    def run(self, coroutine):
+        """ Runs the coroutine on the event loop and waits for its result """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get_peers(self):
+        with self.lock:
+            return dict(self.peers)
+
     def join_network(self, peer_ip_addr, peer_port):
         with self.lock:
             self.peers[peer_ip_addr] = peer_port
-        self.client.request_peers(peer_ip_addr, peer_port)
+        self.run(self.client.request_peers(peer_ip_addr, peer_port))
         self.connect_and_sync()
-    
+
     def connect_and_sync(self):
-        """ Broadcasts the new peer to the every other peer and select the longest chain of blocks """
-        self.blockchain.chain = []
-        with self.lock:
-            for peer_ip_addr, peer_port in self.peers.items():
-                peer_chain = self.client.request_chain(peer_ip_addr, peer_port)
-                print(f"{peer_ip_addr} responded with chain: {peer_chain}")
+        """ Announces the new peer to every other peer and downloads the longest chain of blocks, headers first.
+            Peers that don't support it send their whole chain """
+        if not self.blockchain.restored:
+            self.blockchain.clear() # Own genesis block is replaced by the network's one
+        peers = self.get_peers()
+        tips = self.run(self.request_tips(peers))
+        self.run(ChainSync(self.blockchain, self.client).run({peer: tip for peer, tip in zip(peers.items(), tips) if tip is not None}))
+
+        legacy_peers = {peer_ip_addr: peer_port for (peer_ip_addr, peer_port), tip in zip(peers.items(), tips) if tip is None}
+        peer_chains = self.run(self.request_chains(legacy_peers))
+        for peer_ip_addr, peer_chain in zip(legacy_peers, peer_chains):
+            print(f"{peer_ip_addr} responded with chain: {peer_chain}")
+
+            self.blockchain.compare_replace(peer_chain)
+
+    async def request_tips(self, peers):
+        return await asyncio.gather(*(self.client.request_tip(peer_ip_addr, peer_port) for peer_ip_addr, peer_port in peers.items()))
+
+    async def request_chains(self, peers):
+        """ Requests chains from all peers concurrently """
+        return await asyncio.gather(*(self.client.request_chain(peer_ip_addr, peer_port) for peer_ip_addr, peer_port in peers.items()))
 
-                self.blockchain.compare_replace(peer_chain)
-    
     def update_peers(self, peers):
         with self.lock:
             self.peers.update(peers)
         print(f"Updated list of peers: {self.peers}")
-    
+
     def add_peer(self, ip_address, port):
         with self.lock:
             self.peers[ip_address] = port
         print(f"New peer added to the list: {ip_address}:{port}")
-    
+
+    def set_peer_protocol(self, ip_address, port, protocol):
+        with self.lock:
+            self.peer_protocols[(ip_address, port)] = protocol
+
+    def get_peer_protocol(self, ip_address, port):
+        return self.peer_protocols.get((ip_address, port), Protocol.JSON)
+
     def remove_peer(self, ip_address, port):
         """ Removes the peer from the list """
         with self.lock:
             if ip_address in self.peers and self.peers[ip_address] == port:
                 del self.peers[ip_address]
+                self.peer_protocols.pop((ip_address, port), None)
                 print(f"Peer {ip_address}:{port} has been removed from the list.")
             else:
                 print(f"Could not find peer {ip_address}:{port}.")
-    
+
     def leave_network(self):
         """ Broadcasts to the other peers information that this peer leaves the network """
-        message = json.dumps({'type': 'LEAVE', 'ip_address': self.ip_address, 'port': self.port})
-        with self.lock:
-            for peer_ip_addr, peer_port in self.peers.items():
-                self.client.send_message_to_peer(message, peer_ip_addr, peer_port)
+        message = {'type': 'LEAVE', 'ip_address': self.ip_address, 'port': self.port}
+        self.run(self.client.broadcast_message(message, self.get_peers()))
+
+        self.run(self.client.close())
+        self.run(self.server.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.blockchain.close()
 
-        self.server.close()
-    
     def add_new_transaction(self, transaction):
         self.blockchain.add_new_transaction(transaction)
-        
-        # Broadcast new transaction
-        message = json.dumps({'type': 'NEW_TRANSACTION', 'transaction': transaction.to_json()})
-        with self.lock:
-            for peer_ip_addr, peer_port in self.peers.items():
-                self.client.send_message_to_peer(message, peer_ip_addr, peer_port)
-    
-    def broadcast_blockchain(self):
-        # Broadcast own blockchain copy
-        message = json.dumps({
-            'type': 'BLOCKCHAIN',
-            'blockchain': [block.to_json() for block in self.blockchain.chain]
-        })
-        with self.lock:
-            for peer_ip_addr, peer_port in self.peers.items():
-                self.client.send_message_to_peer(message, peer_ip_addr, peer_port)
+
+        # Announce new transaction. Peers that don't understand inventory messages receive the whole transaction
+        peers, legacy_peers = self.split_peers()
+        self.run(self.broadcast_all(
+            self.client.broadcast_message(self.inventory(transactions=[transaction.get_id()]), peers),
+            self.client.broadcast_message({'type': 'NEW_TRANSACTION', 'transaction': transaction.to_json()}, legacy_peers)
+        ))
+
+    def confirm_transaction(self, transaction_id):
+        """ Number of blocks from the tip down to the block containing the transaction, 0 if it isn't in the chain """
+        proof = self.blockchain.get_transaction_proof(transaction_id)
+        height = self.blockchain.get_height(proof['block_hash']) if proof is not None else None
+        if height is None:
+            return 0
+        return len(self.blockchain.chain) - height
+
+    def announce_block(self):
+        """ Announces the newly mined block. Called by the mining thread, which doesn't wait for the broadcast to finish """
+        peers, legacy_peers = self.split_peers()
+        broadcasts = [self.client.broadcast_message(self.inventory(blocks=[self.blockchain.chain[-1].hash]), peers)]
+        if legacy_peers:
+            # Peers that don't understand inventory messages receive the whole chain
+            message = {
+                'type': 'BLOCKCHAIN',
+                'blockchain': [block.to_json() for block in self.blockchain.chain]
+            }
+            broadcasts.append(self.client.broadcast_message(message, legacy_peers))
+        asyncio.run_coroutine_threadsafe(self.broadcast_all(*broadcasts), self.loop)
+
+    async def broadcast_all(self, *broadcasts):
+        await asyncio.gather(*broadcasts)
+
+    def inventory(self, blocks=(), transactions=()):
+        return {'type': 'INV', 'ip_address': self.ip_address, 'port': self.port, 'blocks': list(blocks), 'transactions': list(transactions)}
+
+    def split_peers(self):
+        """ Splits peers into the ones that understand inventory messages and the legacy ones """
+        peers, legacy_peers = {}, {}
+        for ip_address, port in self.get_peers().items():
+            if self.get_peer_protocol(ip_address, port) == Protocol.JSON:
+                legacy_peers[ip_address] = port
+            else:
+                peers[ip_address] = port
+        return peers, legacy_peers
+
+    async def fetch_inventory(self, peer_ip_addr, peer_port, block_hashes, transaction_ids):
+        """ Fetches announced blocks and transactions that this node doesn't have yet """
+        loop = asyncio.get_running_loop()
+        missing_ids = [transaction_id for transaction_id in transaction_ids if self.blockchain.mempool.get(transaction_id) is None]
+        if missing_ids:
+            transactions = await self.client.request_transactions(missing_ids, peer_ip_addr, peer_port)
+            if transactions:
+                await loop.run_in_executor(None, self.blockchain.add_new_transactions, transactions)
+
+        if any(not self.blockchain.has_block(block_hash) for block_hash in block_hashes):
+            await self.client.request_blocks(peer_ip_addr, peer_port)
@@ -0,0 +1,502 @@
+import functools
+import json
+import struct
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+from Wallet import Wallet
+
+class MessageReader:
+    """ Reads fields of a binary message one after another """
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def read(self, size):
+        if self.offset + size > len(self.data):
+            raise ValueError("Malformed message: unexpected end of data")
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def read_byte(self):
+        return self.read(1)[0]
+
+    def read_varint(self):
+        result = 0
+        shift = 0
+        while True:
+            byte = self.read_byte()
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def read_bytes(self):
+        return self.read(self.read_varint())
+
+    def read_str(self):
+        return self.read_bytes().decode('utf-8')
+
+class FrameReader:
+    """ Reads messages from an asyncio stream. Binary messages are framed with a 4-byte length header.
+        Legacy JSON messages have no header, so they are read until they can be parsed """
+    RECV_SIZE = 65536
+
+    def __init__(self, stream_reader, max_frame_size):
+        self.stream_reader = stream_reader
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+
+    async def fill(self, size):
+        """ Reads from the stream until there are at least size bytes buffered. Returns False if the peer closed the connection """
+        while len(self.buffer) < size:
+            chunk = await self.stream_reader.read(max(FrameReader.RECV_SIZE, size - len(self.buffer)))
+            if not chunk:
+                return False
+            self.buffer += chunk
+        return True
+
+    async def read_payload(self):
+        """ Returns the next encoded message or None if the connection was closed """
+        if not await self.fill(1):
+            return None
+        if self.buffer.startswith(b'{'):
+            return await self.read_legacy_json()
+
+        if not await self.fill(Protocol.FRAME_HEADER.size):
+            raise ConnectionError("Connection closed in the middle of a frame")
+        length = Protocol.FRAME_HEADER.unpack_from(self.buffer)[0]
+        if length > self.max_frame_size:
+            raise ValueError(f"Frame of {length} bytes exceeds the limit of {self.max_frame_size} bytes")
+        end = Protocol.FRAME_HEADER.size + length
+        if not await self.fill(end):
+            raise ConnectionError("Connection closed in the middle of a frame")
+        payload = bytes(self.buffer[Protocol.FRAME_HEADER.size:end])
+        del self.buffer[:end]
+        return payload
+
+    async def read_legacy_json(self):
+        # Legacy peers send one message per connection, so everything that arrives belongs to it.
+        # Brackets are counted as the data arrives and the message is parsed once, when its outermost object is closed
+        depth = 0
+        in_string = False
+        escaped = False
+        offset = 0
+        while True:
+            for offset in range(offset, len(self.buffer)):
+                byte = self.buffer[offset]
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif byte == 0x5c: # Backslash
+                        escaped = True
+                    elif byte == 0x22: # Quote
+                        in_string = False
+                elif byte == 0x22:
+                    in_string = True
+                elif byte in b'{[':
+                    depth += 1
+                elif byte in b'}]':
+                    depth -= 1
+                    if depth == 0:
+                        if offset >= self.max_frame_size:
+                            break
+                        payload = bytes(self.buffer[:offset + 1])
+                        del self.buffer[:offset + 1]
+                        json.loads(payload) # Raises ValueError if it isn't valid JSON after all
+                        return payload
+            offset = len(self.buffer)
+            if len(self.buffer) > self.max_frame_size:
+                raise ValueError(f"Message exceeds the limit of {self.max_frame_size} bytes")
+            if not await self.fill(len(self.buffer) + 1):
+                raise ValueError("Connection closed before the whole message was received")
+
+    async def read_message(self):
+        """ Returns (message, protocol) or None if the connection was closed """
+        payload = await self.read_payload()
+        if payload is None:
+            return None
+        return Protocol.decode(payload)
+
+class Protocol:
+    """ Wire encodings of the P2P messages.
+        JSON is understood by every peer. The binary encoding stores numbers as varints, hashes as raw bytes,
+        secp256k1 keys as 33-byte compressed points and signatures as 64-byte r||s pairs.
+        Peers announce supported encodings in the 'protocols' field of NEW_PEER and PEERS_REQ requests """
+    JSON = 0
+    BINARY = 1
+    SUPPORTED = [JSON, BINARY]
+
+    MAGIC = b'\xbc' # JSON messages always start with '{', so binary messages can be told apart
+    FRAME_HEADER = struct.Struct('!I') # Its first byte is never '{' for frames below MAX_FRAME_SIZE
+    MAX_FRAME_SIZE = 64 * 1024 * 1024
+    MAX_BLOCKS_PER_MESSAGE = 500 # Limit of blocks in a BLOCKS response, the rest is requested with the next GET_BLOCKS
+    MAX_HEADERS_PER_MESSAGE = 2000
+    MESSAGE_TYPES = ['PEERS_REQ', 'PEERS', 'LEAVE', 'NEW_PEER', 'NEW_TRANSACTION', 'BLOCKCHAIN',
+                     'INV', 'GET_BLOCKS', 'BLOCKS', 'GET_TX', 'TRANSACTIONS',
+                     'HELLO', 'CHAIN_TIP', 'GET_HEADERS', 'HEADERS', 'GET_BODIES', 'GET_PROOF', 'PROOFS']
+
+    # Field tags
+    RAW = 0
+    COMPACT = 1
+    NONE = 2
+    INT = 0
+    FLOAT = 1
+
+    @staticmethod
+    def encode(message, protocol=JSON):
+        if protocol == Protocol.JSON:
+            return json.dumps(message).encode('utf-8')
+        if protocol != Protocol.BINARY:
+            raise ValueError(f"Unsupported protocol {protocol}")
+
+        message_type = message['type']
+        out = bytearray(Protocol.MAGIC)
+        out.append(Protocol.BINARY)
+        out.append(Protocol.MESSAGE_TYPES.index(message_type))
+
+        if message_type == 'PEERS':
+            Protocol.write_varint(out, len(message['peers']))
+            for ip_address, port in message['peers'].items():
+                Protocol.write_str(out, ip_address)
+                Protocol.write_varint(out, port)
+        elif message_type in ('LEAVE', 'NEW_PEER', 'HELLO'):
+            Protocol.write_str(out, message['ip_address'])
+            Protocol.write_varint(out, message['port'])
+        elif message_type == 'NEW_TRANSACTION':
+            Protocol.write_transaction(out, message['transaction'])
+        elif message_type == 'BLOCKCHAIN':
+            Protocol.write_varint(out, len(message['blockchain']))
+            for block_json in message['blockchain']:
+                Protocol.write_block(out, block_json)
+        elif message_type == 'INV':
+            Protocol.write_str(out, message['ip_address'])
+            Protocol.write_varint(out, message['port'])
+            Protocol.write_hashes(out, message['blocks'])
+            Protocol.write_hashes(out, message['transactions'])
+        elif message_type in ('GET_BLOCKS', 'GET_HEADERS'):
+            Protocol.write_hashes(out, message['locator'])
+        elif message_type == 'BLOCKS':
+            Protocol.write_varint(out, len(message['blocks']))
+            for block_json in message['blocks']:
+                Protocol.write_block(out, block_json)
+        elif message_type in ('GET_TX', 'GET_PROOF'):
+            Protocol.write_hashes(out, message['ids'])
+        elif message_type == 'CHAIN_TIP':
+            Protocol.write_varint(out, message['height'])
+            Protocol.write_hash(out, message['hash'])
+            Protocol.write_varint(out, message['work'])
+        elif message_type == 'HEADERS':
+            Protocol.write_varint(out, len(message['headers']))
+            for header in message['headers']:
+                Protocol.write_header(out, header)
+        elif message_type == 'GET_BODIES':
+            Protocol.write_hashes(out, message['hashes'])
+        elif message_type == 'TRANSACTIONS':
+            Protocol.write_varint(out, len(message['transactions']))
+            for transaction_json in message['transactions']:
+                Protocol.write_transaction(out, transaction_json)
+        elif message_type == 'PROOFS':
+            Protocol.write_varint(out, len(message['proofs']))
+            for proof in message['proofs']:
+                Protocol.write_proof(out, proof)
+        return bytes(out)
+
+    @staticmethod
+    def encode_frame(message, protocol=JSON):
+        """ Encodes the message for sending. Binary messages are framed, JSON is sent as is for compatibility """
+        payload = Protocol.encode(message, protocol)
+        if protocol == Protocol.JSON:
+            return payload
+        return Protocol.FRAME_HEADER.pack(len(payload)) + payload
+
+    @staticmethod
+    def decode(data):
+        """ Decodes a message in any supported encoding. Returns (message, protocol) """
+        if not data.startswith(Protocol.MAGIC):
+            return json.loads(data.decode('utf-8')), Protocol.JSON
+
+        reader = MessageReader(data, len(Protocol.MAGIC))
+        protocol = reader.read_byte()
+        if protocol != Protocol.BINARY:
+            raise ValueError(f"Unsupported protocol {protocol}")
+        message_type = Protocol.MESSAGE_TYPES[reader.read_byte()]
+        message = {'type': message_type}
+
+        if message_type == 'PEERS':
+            peers = {}
+            for _ in range(reader.read_varint()):
+                ip_address = reader.read_str()
+                peers[ip_address] = reader.read_varint()
+            message['peers'] = peers
+        elif message_type in ('LEAVE', 'NEW_PEER', 'HELLO'):
+            message['ip_address'] = reader.read_str()
+            message['port'] = reader.read_varint()
+        elif message_type == 'NEW_TRANSACTION':
+            message['transaction'] = Protocol.read_transaction(reader)
+        elif message_type == 'BLOCKCHAIN':
+            message['blockchain'] = [Protocol.read_block(reader) for _ in range(reader.read_varint())]
+        elif message_type == 'INV':
+            message['ip_address'] = reader.read_str()
+            message['port'] = reader.read_varint()
+            message['blocks'] = Protocol.read_hashes(reader)
+            message['transactions'] = Protocol.read_hashes(reader)
+        elif message_type in ('GET_BLOCKS', 'GET_HEADERS'):
+            message['locator'] = Protocol.read_hashes(reader)
+        elif message_type == 'BLOCKS':
+            message['blocks'] = [Protocol.read_block(reader) for _ in range(reader.read_varint())]
+        elif message_type in ('GET_TX', 'GET_PROOF'):
+            message['ids'] = Protocol.read_hashes(reader)
+        elif message_type == 'CHAIN_TIP':
+            message['height'] = reader.read_varint()
+            message['hash'] = Protocol.read_hash(reader)
+            message['work'] = reader.read_varint()
+        elif message_type == 'HEADERS':
+            message['headers'] = [Protocol.read_header(reader) for _ in range(reader.read_varint())]
+        elif message_type == 'GET_BODIES':
+            message['hashes'] = Protocol.read_hashes(reader)
+        elif message_type == 'TRANSACTIONS':
+            message['transactions'] = [Protocol.read_transaction(reader) for _ in range(reader.read_varint())]
+        elif message_type == 'PROOFS':
+            message['proofs'] = [Protocol.read_proof(reader) for _ in range(reader.read_varint())]
+        return message, protocol
+
+    @staticmethod
+    def negotiate(message):
+        """ Best encoding supported by both sides, based on the 'protocols' field of the request """
+        offered = message.get('protocols', [Protocol.JSON])
+        return max(protocol for protocol in Protocol.SUPPORTED if protocol == Protocol.JSON or protocol in offered)
+
+    @staticmethod
+    def write_transaction(out, transaction_json):
+        Protocol.write_public_key(out, transaction_json['sender_public_key'])
+        Protocol.write_public_key(out, transaction_json['recipient_public_key'])
+        Protocol.write_number(out, transaction_json['amount'])
+        Protocol.write_signature(out, transaction_json['signature'])
+        Protocol.write_number(out, transaction_json['timestamp'])
+        Protocol.write_number(out, transaction_json.get('fee', 0))
+
+    @staticmethod
+    def read_transaction(reader):
+        return {
+            'sender_public_key': Protocol.read_public_key(reader),
+            'recipient_public_key': Protocol.read_public_key(reader),
+            'amount': Protocol.read_number(reader),
+            'signature': Protocol.read_signature(reader),
+            'timestamp': Protocol.read_number(reader),
+            'fee': Protocol.read_number(reader)
+        }
+
+    @staticmethod
+    def write_block(out, block_json):
+        Protocol.write_varint(out, block_json['index'])
+        Protocol.write_hash(out, block_json['previous_hash'])
+        Protocol.write_number(out, block_json['timestamp'])
+        Protocol.write_varint(out, len(block_json['data']))
+        for transaction_json in block_json['data']:
+            Protocol.write_transaction(out, transaction_json)
+        Protocol.write_hash(out, block_json['hash'])
+        Protocol.write_varint(out, block_json['nonce'])
+        Protocol.write_target(out, block_json.get('target'))
+
+    @staticmethod
+    def read_block(reader):
+        return {
+            'index': reader.read_varint(),
+            'previous_hash': Protocol.read_hash(reader),
+            'timestamp': Protocol.read_number(reader),
+            'data': [Protocol.read_transaction(reader) for _ in range(reader.read_varint())],
+            'hash': Protocol.read_hash(reader),
+            'nonce': reader.read_varint(),
+            'target': Protocol.read_target(reader)
+        }
+
+    @staticmethod
+    def write_header(out, header):
+        Protocol.write_varint(out, header['index'])
+        Protocol.write_hash(out, header['previous_hash'])
+        Protocol.write_number(out, header['timestamp'])
+        Protocol.write_hash(out, header['merkle_root'])
+        Protocol.write_hash(out, header['hash'])
+        Protocol.write_varint(out, header['nonce'])
+        Protocol.write_target(out, header.get('target'))
+
+    @staticmethod
+    def read_header(reader):
+        return {
+            'index': reader.read_varint(),
+            'previous_hash': Protocol.read_hash(reader),
+            'timestamp': Protocol.read_number(reader),
+            'merkle_root': Protocol.read_hash(reader),
+            'hash': Protocol.read_hash(reader),
+            'nonce': reader.read_varint(),
+            'target': Protocol.read_target(reader)
+        }
+
+    @staticmethod
+    def write_proof(out, proof):
+        Protocol.write_hash(out, proof['transaction_id'])
+        Protocol.write_hash(out, proof['block_hash'])
+        Protocol.write_varint(out, len(proof['proof']))
+        for sibling, side in proof['proof']:
+            Protocol.write_hash(out, sibling)
+            Protocol.write_str(out, side)
+
+    @staticmethod
+    def read_proof(reader):
+        return {
+            'transaction_id': Protocol.read_hash(reader),
+            'block_hash': Protocol.read_hash(reader),
+            'proof': [[Protocol.read_hash(reader), reader.read_str()] for _ in range(reader.read_varint())]
+        }
+
+    @staticmethod
+    def write_varint(out, value):
+        if value < 0:
+            raise ValueError("Varint can not be negative")
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    @staticmethod
+    def write_bytes(out, value):
+        Protocol.write_varint(out, len(value))
+        out += value
+
+    @staticmethod
+    def write_str(out, value):
+        Protocol.write_bytes(out, value.encode('utf-8'))
+
+    @staticmethod
+    def write_number(out, value):
+        # Type has to be preserved, since the same encoding is part of the signed data of transactions
+        if isinstance(value, int):
+            out.append(Protocol.INT)
+            Protocol.write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1)) # Zigzag encoding
+        else:
+            out.append(Protocol.FLOAT)
+            out += struct.pack('!d', value)
+
+    @staticmethod
+    def read_number(reader):
+        if reader.read_byte() == Protocol.INT:
+            value = reader.read_varint()
+            return (value >> 1) if value & 1 == 0 else -((value + 1) >> 1)
+        return struct.unpack('!d', reader.read(8))[0]
+
+    @staticmethod
+    def write_hash(out, value):
+        if len(value) == 64:
+            try:
+                raw = bytes.fromhex(value)
+                if raw.hex() == value:
+                    out.append(Protocol.COMPACT)
+                    out += raw
+                    return
+            except ValueError:
+                pass
+        out.append(Protocol.RAW)
+        Protocol.write_str(out, value)
+
+    @staticmethod
+    def read_hash(reader):
+        if reader.read_byte() == Protocol.COMPACT:
+            return reader.read(32).hex()
+        return reader.read_str()
+
+    @staticmethod
+    def write_target(out, value):
+        if value is None:
+            out.append(Protocol.NONE)
+            return
+        Protocol.write_hash(out, value)
+
+    @staticmethod
+    def read_target(reader):
+        tag = reader.read_byte()
+        if tag == Protocol.NONE:
+            return None
+        if tag == Protocol.COMPACT:
+            return reader.read(32).hex()
+        return reader.read_str()
+
+    @staticmethod
+    def write_hashes(out, values):
+        Protocol.write_varint(out, len(values))
+        for value in values:
+            Protocol.write_hash(out, value)
+
+    @staticmethod
+    def read_hashes(reader):
+        return [Protocol.read_hash(reader) for _ in range(reader.read_varint())]
+
+    @staticmethod
+    def write_public_key(out, value):
+        compressed = Protocol.compress_public_key(value)
+        if compressed is not None:
+            out.append(Protocol.COMPACT)
+            out += compressed
+        else:
+            out.append(Protocol.RAW)
+            Protocol.write_str(out, value)
+
+    @staticmethod
+    def read_public_key(reader):
+        if reader.read_byte() == Protocol.COMPACT:
+            return Protocol.expand_public_key(reader.read(33))
+        return reader.read_str()
+
+    @staticmethod
+    def write_signature(out, value):
+        if value is None:
+            out.append(Protocol.NONE)
+            return
+        der = bytes.fromhex(value)
+        try:
+            r, s = decode_dss_signature(der)
+            raw = r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+            # Only canonical DER signatures can be restored exactly from r and s
+            if encode_dss_signature(r, s) == der:
+                out.append(Protocol.COMPACT)
+                out += raw
+                return
+        except (ValueError, OverflowError):
+            pass
+        out.append(Protocol.RAW)
+        Protocol.write_bytes(out, der)
+
+    @staticmethod
+    def read_signature(reader):
+        tag = reader.read_byte()
+        if tag == Protocol.NONE:
+            return None
+        if tag == Protocol.COMPACT:
+            raw = reader.read(64)
+            return encode_dss_signature(int.from_bytes(raw[:32], 'big'), int.from_bytes(raw[32:], 'big')).hex()
+        return reader.read_bytes().hex()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=Wallet.PUBLIC_KEY_CACHE_SIZE)
+    def compress_public_key(public_key_str):
+        """ 33-byte compressed point of a secp256k1 PEM key, or None if the key can't be restored exactly from it """
+        try:
+            public_key = Wallet.parse_public_key(public_key_str.encode('utf-8'))
+        except Exception:
+            return None # Not a PEM public key
+        if not isinstance(public_key, ec.EllipticCurvePublicKey) or not isinstance(public_key.curve, ec.SECP256K1):
+            return None
+        compressed = public_key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.CompressedPoint)
+        if Protocol.expand_public_key(compressed) != public_key_str:
+            return None
+        return compressed
+
+    @staticmethod
+    @functools.lru_cache(maxsize=Wallet.PUBLIC_KEY_CACHE_SIZE)
+    def expand_public_key(compressed):
+        public_key = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256K1(), compressed)
+        return public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode('utf-8')
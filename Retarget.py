@@ -0,0 +1,71 @@
+from Difficulty import Difficulty
+
+class Retarget:
+    """ Expected difficulty of every block of a chain. Each block stores the target it was mined at in its header,
+        so the work of a chain can be calculated and its blocks validated without any other state. Every WINDOW blocks
+        the target is scaled by the ratio of the time the last WINDOW blocks took to the time they should have taken,
+        so blocks keep coming at the block interval however much hashing power the network has. One adjustment can
+        change the target at most MAX_ADJUSTMENT times, so wrong timestamps can't swing the difficulty too much.
+        Blocks are only mined when there are enough transactions, so slow blocks don't always mean that miners left:
+        the difficulty never gets lower than the initial one. Without a block interval the difficulty never changes.
+        A block's timestamp has to be later than the median timestamp of the MEDIAN_SPAN blocks before it, so it can't
+        be moved back to lower the difficulty """
+    WINDOW = 10
+    MAX_ADJUSTMENT = 4
+    MEDIAN_SPAN = 11
+
+    def __init__(self, difficulty, block_interval=None, window=WINDOW, max_adjustment=MAX_ADJUSTMENT, median_span=MEDIAN_SPAN):
+        self.initial_difficulty = Difficulty.of(difficulty)
+        self.block_interval = block_interval # Seconds
+        self.window = window
+        self.max_adjustment = max_adjustment
+        self.median_span = median_span
+        # Number of blocks before the parent of a block whose timestamps are needed to validate the block
+        self.history = max(window, median_span - 1)
+
+    @staticmethod
+    def of(difficulty):
+        """ Accepts a Retarget or a fixed difficulty """
+        if isinstance(difficulty, Retarget):
+            return difficulty
+        return Retarget(difficulty)
+
+    def is_retarget_height(self, height):
+        # The first window starts after the genesis block
+        return self.block_interval is not None and height > self.window and height % self.window == 0
+
+    def get_difficulty(self, height, previous_target, get_timestamp):
+        """ Difficulty of the block at the height. previous_target is the target stored in the previous block (None if it
+            has none, like genesis blocks of older chains), get_timestamp(height) returns the timestamp of an earlier block
+            of the same branch or None if it isn't known. Returns None if the difficulty can't be calculated """
+        difficulty = Difficulty.from_hex(previous_target) if previous_target is not None else self.initial_difficulty
+        if not self.is_retarget_height(height):
+            return difficulty
+
+        first, last = get_timestamp(height - 1 - self.window), get_timestamp(height - 1)
+        if first is None or last is None:
+            return None
+        expected_timespan = self.block_interval * self.window
+        timespan = min(max(last - first, expected_timespan / self.max_adjustment), expected_timespan * self.max_adjustment)
+        # Target has 256 bits, so it's scaled with integers (timespans in milliseconds) rather than floats
+        target = difficulty.target * round(timespan * 1000) // round(expected_timespan * 1000)
+        return Difficulty(min(max(target, 1), self.initial_difficulty.target))
+
+    def expected(self, previous_header, timestamps):
+        """ Difficulty and median time (see get_median_time) expected for the block after previous_header, which is None
+            for a genesis block. Timestamps map heights to timestamps of the earlier blocks of the same branch, the timestamp
+            of previous_header is added to them. Returns (difficulty, median time), either is None if it can't be calculated """
+        if previous_header is None:
+            return self.initial_difficulty, 0 # Genesis block isn't mined, but it has to have the initial target
+        height = previous_header['index'] + 1
+        timestamps[previous_header['index']] = previous_header['timestamp']
+        return self.get_difficulty(height, previous_header.get('target'), timestamps.get), self.get_median_time(height, timestamps.get)
+
+    def get_median_time(self, height, get_timestamp):
+        """ Median timestamp of the MEDIAN_SPAN blocks before the height (fewer at the beginning of the chain).
+            get_timestamp is the same as for get_difficulty. Returns None if a timestamp isn't known """
+        timestamps = [get_timestamp(i) for i in range(max(0, height - self.median_span), height)]
+        if not timestamps or None in timestamps:
+            return None
+        timestamps.sort()
+        return timestamps[len(timestamps) // 2]
@@ -1,33 +1,122 @@
+import functools
+import hashlib
 import json
+import os
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from Wallet import Wallet
+from Protocol import Protocol
+
+def verify_transaction(transaction):
+    """ Same as Transaction.is_valid, but returns False instead of raising (used by the verification pool) """
+    try:
+        return transaction.is_valid()
+    except Exception:
+        return False
+
+verification_pools = {} # Number of workers -> ProcessPoolExecutor
+verification_pool_lock = threading.Lock()
 
 class Transaction:
-    def __init__(self, sender_public_key_bytes, recipient_public_key, amount, signature=None, timestamp=None):
-        self.sender_public_key_bytes = sender_public_key_bytes
-        self.recipient_public_key = recipient_public_key
+    PARALLEL_VERIFICATION_MIN_BATCH = 64 # Smaller batches are verified in the current process
+    INTERNED_KEYS = 65536 # Number of distinct public keys that are shared between transactions
+    SIGNED_FIELDS = ('sender_public_key_bytes', 'recipient_public_key', 'amount', 'timestamp', 'fee')
+    # Many transactions are kept in memory, so they don't have a __dict__
+    __slots__ = SIGNED_FIELDS + ('signature', 'transaction_data', 'transaction_id')
+
+    def __init__(self, sender_public_key_bytes, recipient_public_key, amount, signature=None, timestamp=None, fee=0):
+        self.sender_public_key_bytes = Transaction.intern_key(sender_public_key_bytes)
+        self.recipient_public_key = Transaction.intern_key(recipient_public_key)
         self.amount = amount
         self.signature = signature
         self.timestamp = timestamp
+        self.fee = fee # Paid by the sender on top of the amount, transactions with higher fees get into blocks first
         
         if self.timestamp is None:
             self.timestamp = time.time()
 
+    def __setattr__(self, name, value):
+        # Signed data and id are calculated once and recalculated only after a signed field changes
+        if name in Transaction.SIGNED_FIELDS:
+            object.__setattr__(self, 'transaction_data', None)
+            object.__setattr__(self, 'transaction_id', None)
+        object.__setattr__(self, name, value)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=INTERNED_KEYS)
+    def intern_key(public_key):
+        """ The same object for every equal key. Each decoded transaction would hold its own copy of the PEM key otherwise """
+        return public_key
+
     def sign_transaction(self, wallet):
         if wallet.get_public_key() != self.sender_public_key_bytes:
             raise Exception("Cannot sign transaction for other wallets!")
-        transaction_data = str(self.sender_public_key_bytes) + str(self.recipient_public_key) + str(self.amount) + str(self.timestamp)
-        self.signature = wallet.sign_transaction(transaction_data)
+        self.signature = wallet.sign_transaction(self.get_transaction_data())
 
     def is_valid(self):
         if self.amount < 0:
             raise Exception("Amount can not be negative")
             return False
+        if self.fee < 0:
+            raise Exception("Fee can not be negative")
         if self.signature is None:
             raise Exception("Transaction is not signed")
             return False
-        transaction_data = str(self.sender_public_key_bytes) + str(self.recipient_public_key) + str(self.amount) + str(self.timestamp)
-        return Wallet.verify_signature(self.sender_public_key_bytes, transaction_data, self.signature)
+        return Wallet.verify_signature(self.sender_public_key_bytes, self.get_transaction_data(), self.signature)
+
+    @staticmethod
+    def verify_batch(transactions, workers=None):
+        """ Verifies many transactions across a pool of processes. Returns list of results in the same order """
+        transactions = list(transactions)
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(transactions) < Transaction.PARALLEL_VERIFICATION_MIN_BATCH:
+            return [verify_transaction(transaction) for transaction in transactions]
+
+        chunksize = max(1, len(transactions) // (workers * 4))
+        pool = Transaction.get_verification_pool(workers)
+        return list(pool.map(verify_transaction, transactions, chunksize=chunksize))
+
+    @staticmethod
+    def get_verification_pool(workers):
+        """ Process pool shared by all verifications. Starting the processes costs about as much as verifying a batch,
+            so they are started on the first large batch and kept until shutdown_verification_pool """
+        with verification_pool_lock:
+            if workers not in verification_pools:
+                verification_pools[workers] = ProcessPoolExecutor(max_workers=workers)
+            return verification_pools[workers]
+
+    @staticmethod
+    def shutdown_verification_pool():
+        with verification_pool_lock:
+            pools = list(verification_pools.values())
+            verification_pools.clear()
+        for pool in pools:
+            pool.shutdown()
+
+    def get_transaction_data(self):
+        """ Data that is signed by the sender: canonical binary encoding of the signed fields """
+        if self.transaction_data is None:
+            out = bytearray()
+            Protocol.write_bytes(out, self.sender_public_key_bytes)
+            Protocol.write_str(out, self.recipient_public_key)
+            Protocol.write_number(out, self.amount)
+            Protocol.write_number(out, self.timestamp)
+            Protocol.write_number(out, self.fee)
+            object.__setattr__(self, 'transaction_data', bytes(out))
+        return self.transaction_data
+
+    def get_id(self):
+        """ Stable transaction id - hash of the signed data """
+        if self.transaction_id is None:
+            object.__setattr__(self, 'transaction_id', hashlib.sha256(self.get_transaction_data()).hexdigest())
+        return self.transaction_id
+
+    def get_size(self):
+        """ Size of the transaction in the binary encoding """
+        out = bytearray()
+        Protocol.write_transaction(out, self.to_json())
+        return len(out)
 
     def to_json(self):
         return {
@@ -35,13 +124,15 @@ class Transaction:
             'recipient_public_key': self.recipient_public_key,
             'amount': self.amount,
             'signature': self.signature.hex() if self.signature else None,
-            'timestamp': self.timestamp
+            'timestamp': self.timestamp,
+            'fee': self.fee
         }
     
     def __str__(self):
+        fee_str = f"  Fee: {self.fee}\n" if self.fee else ""
         return (f"  Sender: {self.sender_public_key_bytes}\n"
                 f"  Recipient: {self.recipient_public_key}\n"
-                f"  Amount: {self.amount}\n"
+                f"  Amount: {self.amount}\n" + fee_str +
                 f"  Signature: {self.signature if self.signature else 'Unsigned'}\n"
                 f"  Timestamp: {self.timestamp}\n")
 
@@ -51,7 +142,8 @@ class Transaction:
             sender_public_key_bytes=transaction_json['sender_public_key'].encode('utf-8'),
             recipient_public_key=transaction_json['recipient_public_key'],
             amount=transaction_json['amount'],
-            timestamp=transaction_json['timestamp']
+            timestamp=transaction_json['timestamp'],
+            fee=transaction_json.get('fee', 0)
         )
         if transaction_json['signature']:
             transaction.signature = bytes.fromhex(transaction_json['signature'])
@@ -62,5 +154,6 @@ class Transaction:
             return (self.sender_public_key_bytes == other.sender_public_key_bytes and
                     self.recipient_public_key == other.recipient_public_key and
                     self.amount == other.amount and
-                    self.timestamp == other.timestamp)
+                    self.timestamp == other.timestamp and
+                    self.fee == other.fee)
         return False
@@ -1,3 +1,4 @@
+import functools
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
@@ -5,7 +6,10 @@ from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.backends import default_backend
 
 class Wallet:
+    PUBLIC_KEY_CACHE_SIZE = 1024 # Number of parsed public keys kept for signature verification
+
     def __init__(self, private_key=None, public_key=None):
+        self.public_key_pem = None # Memoized result of get_public_key
         if private_key and public_key:
             self.private_key = Wallet.load_private_key(private_key)
             self.public_key = Wallet.load_public_key(public_key)
@@ -19,14 +23,21 @@ class Wallet:
         print(f"Private key: {self.get_private_key().decode('utf-8')}")
 
     def sign_transaction(self, transaction_data):
-        signature = self.private_key.sign(transaction_data.encode('utf-8'), ec.ECDSA(hashes.SHA256()))
+        signature = self.private_key.sign(Wallet.to_bytes(transaction_data), ec.ECDSA(hashes.SHA256()))
         return signature
 
+    @staticmethod
+    def to_bytes(data):
+        # Transactions sign their canonical bytes, text is accepted as well
+        return data if isinstance(data, bytes) else data.encode('utf-8')
+
     def get_public_key(self):
-        return self.public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
+        if self.public_key_pem is None:
+            self.public_key_pem = self.public_key.public_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            )
+        return self.public_key_pem
     
     def get_private_key(self):
         return self.private_key.private_bytes(
@@ -50,11 +61,22 @@ class Wallet:
             backend=default_backend()
         )
 
+    @staticmethod
+    @functools.lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
+    def parse_public_key(public_key_bytes):
+        """ Parses PEM public key. Results are cached, since a few senders produce most of the transactions """
+        return serialization.load_pem_public_key(public_key_bytes)
+
+    @staticmethod
+    def public_key_cache_info():
+        """ Hits, misses and size of the parsed public keys cache """
+        return Wallet.parse_public_key.cache_info()
+
     @staticmethod
     def verify_signature(public_key_bytes, transaction_data, signature):
-        public_key = serialization.load_pem_public_key(public_key_bytes)
+        public_key = Wallet.parse_public_key(public_key_bytes)
         try:
-            public_key.verify(signature, transaction_data.encode('utf-8'), ec.ECDSA(hashes.SHA256()))
+            public_key.verify(signature, Wallet.to_bytes(transaction_data), ec.ECDSA(hashes.SHA256()))
             return True
         except InvalidSignature:
             return False
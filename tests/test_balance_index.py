@@ -0,0 +1,119 @@
+import unittest
+import sys
+from io import StringIO
+from unittest.mock import MagicMock
+from BalanceIndex import BalanceIndex
+from Block import Block
+from Blockchain import Blockchain
+from Transaction import Transaction
+from Wallet import Wallet
+
+class TestBalanceIndex(unittest.TestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.sender = Wallet()
+        self.recipient = Wallet()
+        self.recipient_key = self.recipient.get_public_key().decode('utf-8')
+        self.index = BalanceIndex()
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+
+    def transaction(self, amount, sender=None, recipient_key=None):
+        sender = sender or self.sender
+        transaction = Transaction(sender.get_public_key(), recipient_key or self.recipient_key, amount)
+        transaction.sign_transaction(sender)
+        return transaction
+
+    def test_connect_and_disconnect(self):
+        block = Block(1, "0", 0, [self.transaction(10), self.transaction(2.5)])
+
+        self.index.connect_block(block)
+        self.assertEqual(self.index.get_balance(self.sender.get_public_key()), -12.5)
+        self.assertEqual(self.index.get_balance(self.recipient_key), 12.5)
+
+        self.index.disconnect_block(block)
+        self.assertEqual(self.index.get_balance(self.recipient_key), 0)
+        self.assertEqual(self.index.balances, {})
+
+    def test_fee_is_paid_by_sender(self):
+        transaction = Transaction(self.sender.get_public_key(), self.recipient_key, 10, fee=1.5)
+        self.index.add(BalanceIndex.address(self.sender.get_public_key()), 11)
+
+        self.assertFalse(self.index.can_apply([transaction, transaction]))
+        self.index.connect_block(Block(1, "0", 0, [transaction]))
+        self.assertEqual(self.index.get_balance(self.sender.get_public_key()), -0.5)
+        self.assertEqual(self.index.get_balance(self.recipient_key), 10)
+        self.assertTrue(self.index.can_apply([], disconnected_blocks=[Block(1, "0", 0, [transaction])]))
+
+    def test_can_apply(self):
+        self.index.add(BalanceIndex.address(self.sender.get_public_key()), 10)
+        spent_block = Block(1, "0", 0, [self.transaction(8)])
+
+        self.assertTrue(self.index.can_apply([self.transaction(10)]))
+        self.assertFalse(self.index.can_apply([self.transaction(6), self.transaction(6)]))
+        self.assertFalse(self.index.can_spend(self.transaction(6), {BalanceIndex.address(self.sender.get_public_key()): -6}))
+        self.assertTrue(self.index.can_spend(self.transaction(6), {BalanceIndex.address(self.sender.get_public_key()): -4}))
+
+        self.index.connect_block(spent_block)
+        self.assertFalse(self.index.can_apply([self.transaction(10)]))
+        self.assertTrue(self.index.can_apply([self.transaction(10)], disconnected_blocks=[spent_block]))
+        self.assertEqual(self.index.get_balance(self.sender.get_public_key()), 2) # Checks don't modify the index
+
+    def test_record(self):
+        changes = {}
+        transaction = Transaction(self.sender.get_public_key(), self.recipient_key, 10, fee=1)
+
+        BalanceIndex.record(changes, transaction)
+        self.assertEqual(changes, {BalanceIndex.address(self.sender.get_public_key()): -11, self.recipient_key: 10})
+        BalanceIndex.record(changes, transaction, reverse=True)
+        self.assertEqual(changes, {})
+
+    def test_blockchain_balances(self):
+        blockchain = Blockchain(1, MagicMock(), enforce_balances=True)
+        blockchain.balances.add(BalanceIndex.address(self.sender.get_public_key()), 10)
+
+        blockchain.add_new_transaction(self.transaction(7))
+        blockchain.add_new_transaction(self.transaction(7)) # Only 3 left after the first one
+        self.assertEqual(len(blockchain.mempool), 1)
+
+        new_block = Block(1, blockchain.chain[-1].hash, blockchain.chain[0].timestamp + 1, blockchain.mempool.copy())
+        new_block.mine_block(1)
+        blockchain.start_mining(new_block)
+        self.assertEqual(blockchain.get_balance(self.sender.get_public_key()), 3)
+        self.assertEqual(blockchain.get_balance(self.recipient_key), 7)
+
+    def test_blockchain_reorganization(self):
+        blockchain = Blockchain(1, MagicMock(), enforce_balances=True)
+        blockchain.balances.add(BalanceIndex.address(self.sender.get_public_key()), 10)
+        own_block = Block(1, blockchain.chain[-1].hash, blockchain.chain[0].timestamp + 1, [self.transaction(7)])
+        own_block.mine_block(1)
+        blockchain.mempool.add(own_block.data[0])
+        blockchain.start_mining(own_block)
+
+        other_recipient_key = Wallet().get_public_key().decode('utf-8')
+        other_chain = [blockchain.chain[0]]
+        for i in range(1, 3):
+            other_chain.append(Block(i, other_chain[-1].hash, other_chain[0].timestamp + i + 1, [self.transaction(5, recipient_key=other_recipient_key)]))
+            other_chain[-1].mine_block(1)
+
+        blockchain.compare_replace([block.to_json() for block in other_chain])
+
+        self.assertEqual(blockchain.get_balance(self.sender.get_public_key()), 0)
+        self.assertEqual(blockchain.get_balance(self.recipient_key), 0)
+        self.assertEqual(blockchain.get_balance(other_recipient_key), 10)
+
+    def test_blockchain_rejects_overspending_chain(self):
+        blockchain = Blockchain(1, MagicMock(), enforce_balances=True)
+        other_chain = [blockchain.chain[0]]
+        other_chain.append(Block(1, other_chain[-1].hash, other_chain[0].timestamp + 1, [self.transaction(5)]))
+        other_chain[-1].mine_block(1)
+
+        blockchain.compare_replace([block.to_json() for block in other_chain])
+
+        self.assertEqual(len(blockchain.chain), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,13 @@
+import unittest
+from Benchmark import benchmark
+
+class TestBenchmark(unittest.TestCase):
+    def test_benchmark(self):
+        results = benchmark(count=200)
+
+        self.assertEqual(results['count'], 200)
+        self.assertLess(results['transactions_after'], results['transactions_before'])
+        self.assertLess(results['block_after'], results['block_before'])
+
+if __name__ == '__main__':
+    unittest.main()
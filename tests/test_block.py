@@ -1,8 +1,13 @@
 import unittest
+import copy
+import pickle
 import time
 from Wallet import Wallet
 from Transaction import Transaction
 from Block import Block
+from Difficulty import Difficulty
+from Merkle import Merkle
+from Miner import Miner
 from unittest.mock import patch, MagicMock
 import sys
 from io import StringIO
@@ -17,18 +22,20 @@ class TestBlock(unittest.TestCase):
         self.mock_wallet.get_public_key.return_value = b"mock_public_key"
         
         self.mock_transaction = MagicMock()
+        self.mock_transaction.get_id.return_value = "ab" * 32
         self.mock_transaction.to_json.return_value = {'mock': 'data'}
         
         self.previous_block = Block(
             index=0,
             previous_hash="0",
             timestamp=time.time(),
-            data=[]
+            data=[],
+            target=Difficulty.of(2).to_hex()
         )
         self.block = Block(
             index=1,
             previous_hash=self.previous_block.hash,
-            timestamp=time.time(),
+            timestamp=self.previous_block.timestamp + 1,
             data=[self.mock_transaction]
         )
     
@@ -45,11 +52,31 @@ class TestBlock(unittest.TestCase):
         self.assertTrue(self.block.mine_block(difficulty))
         self.assertTrue(self.block.hash.startswith("0" * difficulty))
 
+    def test_mine_block_with_miner(self):
+        miner = Miner(workers=2)
+        try:
+            self.assertTrue(self.block.mine_block(2, miner))
+            processes = list(miner.processes)
+            next_block = Block(2, self.block.hash, self.block.timestamp + 1, [])
+            self.assertTrue(next_block.mine_block(2, miner))
+            self.assertEqual(miner.processes, processes) # Worker processes are reused for the next block
+        finally:
+            miner.close()
+        self.assertTrue(self.block.hash.startswith("00"))
+        self.assertEqual(len(processes), 2)
+        self.assertEqual(next_block.hash, next_block.calculate_hash())
+
     def test_mine_block_stopped(self):
         difficulty = 2
         self.block.stop_mining = True  # Simulate stopping the mining
         self.assertFalse(self.block.mine_block(difficulty))
 
+    def test_mine_block_zero_bits_difficulty(self):
+        difficulty = Difficulty.from_zero_bits(6)
+        self.assertTrue(self.block.mine_block(difficulty))
+        self.assertTrue(self.block.validate_block(self.previous_block, difficulty, self.previous_block.timestamp))
+        self.assertTrue(self.block.hash[0] == "0" and self.block.hash[1] in "0123")
+
     def test_to_json(self):
         self.block.mine_block(2)
         json_data = self.block.to_json()
@@ -77,21 +104,114 @@ class TestBlock(unittest.TestCase):
 
     def test_validate_block(self):
         self.block.mine_block(2)
-        self.assertTrue(self.block.validate_block(self.previous_block, 2))
+        self.assertTrue(self.block.validate_block(self.previous_block, 2, self.previous_block.timestamp))
 
     def test_validate_block_invalid_previous_hash(self):
         self.block.previous_hash = "invalid_hash"
         self.block.mine_block(2)
-        self.assertFalse(self.block.validate_block(self.previous_block, 2))
+        self.assertFalse(self.block.validate_block(self.previous_block, 2, self.previous_block.timestamp))
 
     def test_validate_block_invalid_difficulty(self):
         while self.block.hash[1] == '0':
             self.block.mine_block(1)
-        self.assertFalse(self.block.validate_block(self.previous_block, 2))
+        self.assertFalse(self.block.validate_block(self.previous_block, 2, self.previous_block.timestamp))
+
+    def test_validate_block_other_target(self):
+        self.block.mine_block(2)
+        # Hash also meets the easier difficulty, but the block has to be mined at exactly the expected one
+        self.assertFalse(self.block.validate_block(self.previous_block, 1, self.previous_block.timestamp))
+        self.assertEqual(self.block.get_difficulty(), Difficulty.of(2))
+
+    def test_validate_block_invalid_index(self):
+        self.block.index = 2
+        self.block.mine_block(1)
+        self.assertFalse(self.block.validate_block(self.previous_block, 1, self.previous_block.timestamp))
+
+    def test_target_is_hashed(self):
+        self.block.mine_block(1)
+        block_hash = self.block.hash
+        self.block.target = Difficulty.of(0).to_hex()
+        self.assertNotEqual(self.block.calculate_hash(), block_hash)
+        self.assertEqual(self.block.get_header()['target'], self.block.target)
 
     def test_validate_block_invalid_hash(self):
         self.block.hash = "00_invalid_hash"
-        self.assertFalse(self.block.validate_block(self.previous_block, 2))
+        self.assertFalse(self.block.validate_block(self.previous_block, 2, self.previous_block.timestamp))
+
+    def test_validate_header(self):
+        self.block.mine_block(2)
+        header = self.block.get_header()
+        previous_header = self.previous_block.get_header()
+        self.assertTrue(Block.validate_header(previous_header, None, 2, 0))
+        self.assertTrue(Block.validate_header(header, previous_header, 2, previous_header['timestamp']))
+        self.assertFalse(Block.validate_header(header, None, 2, 0))
+        self.assertFalse(Block.validate_header(previous_header, None, 3, 0)) # Genesis block with another target
+        self.assertFalse(Block.validate_header(dict(header, index=2), previous_header, 2, previous_header['timestamp']))
+        self.assertFalse(Block.validate_header(dict(header, previous_hash="invalid_hash"), previous_header, 2, previous_header['timestamp']))
+        self.assertFalse(Block.validate_header(dict(header, hash="f" * 64), previous_header, 2, previous_header['timestamp']))
+        self.assertFalse(Block.validate_header(dict(header, merkle_root="f" * 64), previous_header, 2, previous_header['timestamp']))
+        self.assertFalse(Block.validate_header(header, previous_header, 1, previous_header['timestamp']))
+
+    def test_validate_block_timestamp(self):
+        # Timestamp has to be later than the median timestamp of the blocks before
+        self.block.mine_block(1)
+        self.assertFalse(self.block.validate_block(self.previous_block, 1, self.block.timestamp))
+        self.assertFalse(Block.validate_header(self.block.get_header(), self.previous_block.get_header(), 1, self.block.timestamp))
+
+        # Timestamp can't be too far in the future
+        self.block.timestamp = time.time() + Block.MAX_FUTURE_TIME + 60
+        self.block.hash = self.block.calculate_hash()
+        self.block.mine_block(1)
+        self.assertFalse(self.block.validate_block(self.previous_block, 1, self.previous_block.timestamp))
+        self.assertFalse(Block.validate_header(self.block.get_header(), self.previous_block.get_header(), 1, self.previous_block.timestamp))
+
+        self.block.timestamp = time.time() + Block.MAX_FUTURE_TIME - 60
+        self.block.hash = self.block.calculate_hash()
+        self.block.mine_block(1)
+        self.assertTrue(self.block.validate_block(self.previous_block, 1, self.previous_block.timestamp))
+
+    def test_finalize(self):
+        self.block.mine_block(0)
+        self.block.finalize()
+
+        self.assertIsInstance(self.block.data, tuple)
+        self.assertFalse(hasattr(self.block, 'stop_mining'))
+        self.assertFalse(hasattr(self.block, '__dict__'))
+        with self.assertRaises(AttributeError):
+            self.block.hash = "0" * 64
+        for name in ('hash', 'data', 'finalized'):
+            with self.assertRaises(AttributeError):
+                delattr(self.block, name)
+        self.assertTrue(self.block.validate_block(self.previous_block, 0, self.previous_block.timestamp))
+
+    def test_pickle_and_copy(self):
+        wallet = Wallet()
+        block = Block(1, self.previous_block.hash, time.time(), [Transaction(wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", 5)])
+        block.mine_block(1)
+        for copied in (pickle.loads(pickle.dumps(block)), copy.copy(block)):
+            self.assertEqual(copied.to_json(), block.to_json())
+            self.assertFalse(copied.stop_mining)
+
+        block.finalize()
+        copied = pickle.loads(pickle.dumps(block))
+        self.assertEqual(copied.to_json(), block.to_json())
+        self.assertTrue(copied.finalized)
+        with self.assertRaises(AttributeError):
+            copied.hash = "0" * 64
+
+    def test_merkle_root(self):
+        wallet = Wallet()
+        transactions = [Transaction(wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", amount) for amount in range(1, 6)]
+        block = Block(1, self.previous_block.hash, time.time(), transactions)
+        block.mine_block(1)
+        self.assertTrue(block.validate_block(self.previous_block, 1, self.previous_block.timestamp))
+
+        proof = block.get_merkle_proof(transactions[3].get_id())
+        self.assertTrue(Merkle.verify(transactions[3].get_id(), proof, block.get_header()['merkle_root']))
+        self.assertIsNone(block.get_merkle_proof(self.mock_transaction.get_id()))
+
+        transactions[3].amount = 100 # Changed transaction no longer matches the root
+        self.assertFalse(block.validate_block(self.previous_block, 1, self.previous_block.timestamp))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+import os
+import sys
+import tempfile
+from io import StringIO
+from unittest.mock import MagicMock
+from Block import Block
+from Blockchain import Blockchain
+from BlockStore import BlockStore
+from Transaction import Transaction
+from Wallet import Wallet
+
+class TestBlockStore(unittest.TestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.directory = tempfile.TemporaryDirectory()
+        wallet = Wallet()
+        transaction = Transaction(wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", 10, timestamp=1.5)
+        transaction.sign_transaction(wallet)
+        self.blocks = [Block(0, "0", 0.5, [])]
+        for i in range(1, 6):
+            self.blocks.append(Block(i, self.blocks[-1].hash, i, [transaction]))
+        self.store = BlockStore(self.directory.name)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+        sys.stdout = sys.__stdout__
+
+    def reopen(self, **kwargs):
+        self.store.close()
+        self.store = BlockStore(self.directory.name, **kwargs)
+
+    def assert_stored(self, blocks):
+        self.assertEqual(len(self.store), len(blocks))
+        self.assertEqual([self.store.read_block(height).to_json() for height in range(len(self.store))], [block.to_json() for block in blocks])
+
+    def segment_files(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def test_restart(self):
+        for block in self.blocks:
+            self.store.append(block)
+
+        self.reopen()
+
+        self.assert_stored(self.blocks)
+        self.assertEqual(self.store.get_height(self.blocks[3].hash), 3)
+        self.assertEqual(self.store.read_block(2).to_json(), self.blocks[2].to_json())
+
+    def test_torn_record_is_removed(self):
+        for block in self.blocks:
+            self.store.append(block)
+        self.store.close()
+        path = os.path.join(self.directory.name, self.segment_files()[0])
+        os.truncate(path, os.path.getsize(path) - 5)
+
+        self.reopen()
+        self.assert_stored(self.blocks[:-1])
+
+        self.store.append(self.blocks[-1])
+        self.reopen()
+        self.assert_stored(self.blocks)
+
+    def test_damaged_record_is_removed_with_later_ones(self):
+        for block in self.blocks:
+            self.store.append(block)
+        segment, offset, length = self.store.locations[3]
+        self.store.close()
+        with open(os.path.join(self.directory.name, self.segment_files()[0]), 'r+b') as segment_file:
+            segment_file.seek(offset + length - 1)
+            segment_file.write(b'\xff')
+
+        self.reopen()
+
+        self.assert_stored(self.blocks[:3])
+        self.assertIsNone(self.store.get_height(self.blocks[4].hash))
+
+    def test_segments(self):
+        self.reopen(segment_size=1)
+        for block in self.blocks:
+            self.store.append(block)
+        self.assertEqual(len(self.segment_files()), len(self.blocks))
+
+        self.store.truncate(2)
+        self.assertEqual(len(self.segment_files()), 3)
+        self.store.append(self.blocks[2])
+
+        self.reopen(segment_size=1)
+        self.assert_stored(self.blocks[:3])
+
+    def test_truncate(self):
+        for block in self.blocks:
+            self.store.append(block)
+
+        self.store.truncate(4)
+        other_block = Block(4, self.blocks[3].hash, 100, [])
+        self.store.append(other_block)
+        self.reopen(sync=BlockStore.SYNC_ALWAYS)
+
+        self.assert_stored(self.blocks[:4] + [other_block])
+        self.assertIsNone(self.store.get_height(self.blocks[4].hash))
+        self.assertEqual(self.store.get_height(other_block.hash), 4)
+
+    def test_invalid_sync_policy(self):
+        with self.assertRaises(ValueError):
+            BlockStore(self.directory.name, sync='sometimes')
+
+    def test_blockchain_is_restored(self):
+        blockchain = Blockchain(1, MagicMock(), self.store)
+        new_block = Block(1, blockchain.chain[-1].hash, blockchain.chain[0].timestamp + 1, [])
+        new_block.mine_block(1)
+        blockchain.start_mining(new_block)
+
+        self.reopen()
+        restored_blockchain = Blockchain(1, MagicMock(), self.store)
+
+        self.assertTrue(restored_blockchain.restored)
+        self.assertEqual([block.hash for block in restored_blockchain.chain], [block.hash for block in blockchain.chain])
+
+    def test_blockchain_replacement_is_stored(self):
+        blockchain = Blockchain(1, MagicMock(), self.store)
+        own_block = Block(1, blockchain.chain[-1].hash, blockchain.chain[0].timestamp + 1, [])
+        own_block.mine_block(1)
+        blockchain.start_mining(own_block)
+        other_chain = blockchain.chain[:1]
+        for i in range(1, 3):
+            other_chain.append(Block(i, other_chain[-1].hash, other_chain[0].timestamp + i + 1, []))
+            other_chain[-1].mine_block(1)
+
+        blockchain.compare_replace([block.to_json() for block in other_chain])
+
+        self.reopen()
+        self.assert_stored(other_chain)
+
+if __name__ == '__main__':
+    unittest.main()
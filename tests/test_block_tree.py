@@ -0,0 +1,93 @@
+import unittest
+from unittest.mock import MagicMock
+from BlockTree import BlockTree
+from Block import Block
+from Difficulty import Difficulty
+
+class TestBlockTree(unittest.TestCase):
+
+    def setUp(self):
+        self.block_tree = BlockTree(max_side_blocks=3, max_orphans=2)
+        self.work = Difficulty.of(2).get_work()
+
+    def mock_block(self, index, block_hash, previous_hash):
+        block = MagicMock(spec=Block)
+        block.index = index
+        block.hash = block_hash
+        block.previous_hash = previous_hash
+        block.get_difficulty.return_value = None
+        return block
+
+    def test_get_work(self):
+        self.assertEqual(Difficulty.from_zero_bits(8).get_work(), 256)
+        self.assertEqual(Difficulty(Difficulty.MAX_TARGET).get_work(), 1)
+
+    def test_connect_and_truncate(self):
+        for i in range(3):
+            self.block_tree.connect(self.mock_block(i, str(i), str(i - 1)), 2)
+        self.assertEqual(self.block_tree.chain_work, [self.work, 2 * self.work, 3 * self.work])
+
+        self.block_tree.truncate(1)
+
+        self.assertEqual(self.block_tree.get_tip_work(), self.work)
+
+    def test_connect_uses_block_target(self):
+        block = self.mock_block(1, "a", "0")
+        block.get_difficulty.return_value = Difficulty.from_zero_bits(8)
+
+        self.block_tree.connect(block, 2)
+
+        self.assertEqual(self.block_tree.get_tip_work(), 256)
+
+    def test_connect_removes_side_block(self):
+        block = self.mock_block(1, "a", "0")
+        self.block_tree.add_side_block(block, self.work)
+
+        self.block_tree.connect(block, 2)
+
+        self.assertIsNone(self.block_tree.get_side_block("a"))
+
+    def test_get_branch(self):
+        heights = {"0": 0, "1": 1}
+        self.block_tree.add_side_block(self.mock_block(2, "a", "1"), 3 * self.work)
+        self.block_tree.add_side_block(self.mock_block(3, "b", "a"), 4 * self.work)
+
+        fork_height, branch = self.block_tree.get_branch("b", heights.get)
+
+        self.assertEqual(fork_height, 1)
+        self.assertEqual([block.hash for block in branch], ["a", "b"])
+
+    def test_get_branch_from_other_genesis(self):
+        self.block_tree.add_side_block(self.mock_block(0, "g", "0"), self.work)
+        self.block_tree.add_side_block(self.mock_block(1, "a", "g"), 2 * self.work)
+
+        self.assertEqual(self.block_tree.get_branch("a", {}.get)[0], -1)
+
+    def test_side_blocks_eviction(self):
+        for i in range(4):
+            self.block_tree.add_side_block(self.mock_block(i + 2, str(i), str(i - 1)), self.work)
+
+        self.assertEqual(list(self.block_tree.side_blocks), ["1", "2", "3"])
+        # Branch can't be followed to the main chain once its first block was evicted
+        self.assertEqual(self.block_tree.get_branch("3", {"-1": 1}.get), (None, []))
+
+    def test_orphans(self):
+        first = self.mock_block(5, "a", "x")
+        second = self.mock_block(5, "b", "x")
+        self.block_tree.add_orphan(first)
+        self.block_tree.add_orphan(second)
+        self.block_tree.add_orphan(first)
+
+        self.assertEqual(self.block_tree.take_orphans("x"), [first, second])
+        self.assertEqual(self.block_tree.take_orphans("x"), [])
+        self.assertEqual(len(self.block_tree.orphans_by_parent), 0)
+
+    def test_orphans_eviction(self):
+        for i in range(3):
+            self.block_tree.add_orphan(self.mock_block(5, str(i), "p" + str(i)))
+
+        self.assertEqual(list(self.block_tree.orphans), ["1", "2"])
+        self.assertEqual(self.block_tree.take_orphans("p0"), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,11 @@ from unittest.mock import patch, MagicMock
 from Blockchain import Blockchain
 from Block import Block
 from Transaction import Transaction
+from Wallet import Wallet
+from Difficulty import Difficulty
+from Retarget import Retarget
 import sys
+import time
 from io import StringIO
 
 class TestBlockchain(unittest.TestCase):
@@ -15,6 +19,7 @@ class TestBlockchain(unittest.TestCase):
         self.difficulty = 2
         self.broadcast_cb = MagicMock()
         self.blockchain = Blockchain(self.difficulty, self.broadcast_cb)
+        self.blockchain.miner = MagicMock()
     
     def tearDown(self):
         sys.stdout = sys.__stdout__
@@ -25,6 +30,9 @@ class TestBlockchain(unittest.TestCase):
         new_chain_json = [{'index': 1}, {'index': 2}]
         mock_from_json.return_value = MagicMock(spec=Block)
         mock_from_json.return_value.data = []
+        mock_from_json.return_value.index = 1
+        mock_from_json.return_value.hash = "a" * 64
+        mock_from_json.return_value.get_difficulty.return_value = None
         mock_is_chain_valid.return_value = True
 
         self.blockchain.compare_replace(new_chain_json)
@@ -45,62 +53,331 @@ class TestBlockchain(unittest.TestCase):
         mock_is_chain_valid.assert_called_once()
         self.broadcast_cb.assert_not_called()
 
-    @patch('Block.Block.from_json')
-    @patch('Blockchain.Blockchain.is_chain_valid')
-    def test_compare_replace_equal_length(self, mock_is_chain_valid, mock_from_json):
-        new_chain_json = [{'index': 1}]
+    def mock_transaction(self):
+        mock_transaction = MagicMock(spec=Transaction)
+        mock_transaction.get_id.return_value = f"{id(mock_transaction):064x}"
+        mock_transaction.fee = 0
+        mock_transaction.timestamp = 0
+        mock_transaction.get_size.return_value = 100
+        return mock_transaction
 
-        self.blockchain.compare_replace(new_chain_json)
+    def mine_next_block(self, chain):
+        block = Block(len(chain), chain[-1].hash, chain[-1].timestamp + 1, [])
+        block.mine_block(self.difficulty)
+        return block
 
-        self.assertEqual(len(self.blockchain.chain), 1)  # Genesis block only
-        mock_from_json.assert_not_called()
-        mock_is_chain_valid.assert_not_called()
+    def test_compare_replace_deserializes_only_new_blocks(self):
+        longer_chain = list(self.blockchain.chain)
+        for i in range(3):
+            longer_chain.append(self.mine_next_block(longer_chain))
+        self.blockchain.replace_blocks(0, longer_chain[:2])
+        new_chain_json = [block.to_json() for block in longer_chain]
+
+        with patch('Block.Block.from_json', wraps=Block.from_json) as mock_from_json:
+            self.blockchain.compare_replace(new_chain_json)
+
+        self.assertEqual(mock_from_json.call_count, 2)
+        self.assertEqual([block.hash for block in self.blockchain.chain], [block.hash for block in longer_chain])
+        self.assertIs(self.blockchain.chain[1], longer_chain[1])
+
+    def test_compare_replace_fork(self):
+        own_chain = list(self.blockchain.chain)
+        own_chain.append(self.mine_next_block(own_chain))
+        own_chain.append(self.mine_next_block(own_chain))
+        self.blockchain.replace_blocks(0, own_chain)
+        other_chain = own_chain[:2]
+        other_chain.append(Block(2, other_chain[-1].hash, other_chain[-1].timestamp + 2, []))
+        other_chain[-1].mine_block(self.difficulty)
+        other_chain.append(self.mine_next_block(other_chain))
+
+        self.blockchain.compare_replace([block.to_json() for block in other_chain])
+
+        self.assertEqual([block.hash for block in self.blockchain.chain], [block.hash for block in other_chain])
+
+    def mine_fork(self, chain, height, length):
+        """ Blocks following chain[height - 1] that differ from the blocks of the chain """
+        fork = list(chain[:height])
+        fork.append(Block(height, fork[-1].hash, fork[-1].timestamp + 2, []))
+        fork[-1].mine_block(self.difficulty)
+        while len(fork) < height + length:
+            fork.append(self.mine_next_block(fork))
+        return fork[height:]
+
+    def test_compare_replace_equal_length_kept_as_side_branch(self):
+        own_chain = list(self.blockchain.chain)
+        own_chain.append(self.mine_next_block(own_chain))
+        self.blockchain.replace_blocks(0, own_chain)
+        side_branch = self.mine_fork(own_chain, 1, 1)
+
+        self.blockchain.compare_replace([block.to_json() for block in own_chain[:1] + side_branch])
+
+        self.assertEqual([block.hash for block in self.blockchain.chain], [block.hash for block in own_chain])
+        self.assertIsNotNone(self.blockchain.block_tree.get_side_block(side_branch[0].hash))
         self.broadcast_cb.assert_not_called()
 
+    def test_add_blocks_extending_side_branch(self):
+        own_chain = list(self.blockchain.chain)
+        for i in range(3):
+            own_chain.append(self.mine_next_block(own_chain))
+        self.blockchain.replace_blocks(0, own_chain)
+        side_branch = self.mine_fork(own_chain, 2, 3)
+        self.assertTrue(self.blockchain.add_blocks([block.to_json() for block in side_branch[:2]]))
+        self.assertEqual(self.blockchain.get_tip_hash(), own_chain[-1].hash)
+
+        with patch('Blockchain.Blockchain.is_chain_valid', wraps=Blockchain.is_chain_valid) as mock_is_chain_valid:
+            self.assertTrue(self.blockchain.add_blocks([side_branch[2].to_json()]))
+
+        # Only the new block was validated, the side branch was connected without downloading it again
+        self.assertEqual(len(mock_is_chain_valid.call_args[0][0]), 2)
+        self.assertEqual([block.hash for block in self.blockchain.chain], [block.hash for block in own_chain[:2] + side_branch])
+        self.assertIsNotNone(self.blockchain.block_tree.get_side_block(own_chain[2].hash))
+        self.assertEqual(self.blockchain.block_tree.get_tip_work(), 5 * Difficulty.of(self.difficulty).get_work())
+
+    def test_switch_branch_returns_transactions_to_mempool(self):
+        wallet = Wallet()
+        transaction = Transaction(wallet.get_public_key(), "recipient", 5)
+        transaction.signature = wallet.sign_transaction(transaction.get_transaction_data())
+        own_chain = list(self.blockchain.chain)
+        own_chain.append(Block(1, own_chain[0].hash, own_chain[0].timestamp + 1, [transaction]))
+        own_chain[-1].mine_block(self.difficulty)
+        self.blockchain.replace_blocks(0, own_chain)
+        other_chain = own_chain[:1] + self.mine_fork(own_chain, 1, 2)
+
+        self.blockchain.compare_replace([block.to_json() for block in other_chain])
+
+        self.assertEqual(self.blockchain.get_tip_hash(), other_chain[-1].hash)
+        self.assertIn(transaction, self.blockchain.mempool)
+        self.assertIsNone(self.blockchain.get_transaction(transaction.get_id()))
+
+    def test_add_blocks_connects_orphans(self):
+        longer_chain = list(self.blockchain.chain)
+        for i in range(4):
+            longer_chain.append(self.mine_next_block(longer_chain))
+
+        self.assertFalse(self.blockchain.add_blocks([block.to_json() for block in longer_chain[3:]]))
+        self.assertEqual(len(self.blockchain.chain), 1)
+        self.assertTrue(self.blockchain.add_blocks([block.to_json() for block in longer_chain[1:3]]))
+
+        self.assertEqual([block.hash for block in self.blockchain.chain], [block.hash for block in longer_chain])
+        self.assertEqual(len(self.blockchain.block_tree.orphans), 0)
+
+    def test_retarget(self):
+        self.blockchain.retarget = Retarget(self.difficulty, block_interval=10, window=2)
+        chain = list(self.blockchain.chain)
+        for i in range(1, 4):
+            chain.append(Block(i, chain[-1].hash, chain[0].timestamp + i, []))
+            chain[-1].mine_block(self.difficulty)
+        self.blockchain.compare_replace([block.to_json() for block in chain])
+        self.assertEqual(len(self.blockchain.chain), 4)
+
+        # Blocks came every second instead of every 10 seconds, the difficulty is raised the most it can be
+        expected_difficulty = Difficulty(Difficulty.of(self.difficulty).target // 4)
+        self.assertEqual(self.blockchain.get_next_difficulty(), expected_difficulty)
+        easy_block = Block(4, chain[-1].hash, chain[0].timestamp + 4, [])
+        easy_block.mine_block(self.difficulty)
+        self.blockchain.add_blocks([easy_block.to_json()])
+        self.assertEqual(len(self.blockchain.chain), 4)
+        block = Block(4, chain[-1].hash, chain[0].timestamp + 4, [])
+        block.mine_block(expected_difficulty)
+        self.assertTrue(self.blockchain.add_blocks([block.to_json()]))
+        self.assertEqual(self.blockchain.get_tip_hash(), block.hash)
+
+    def test_compare_replace_easy_genesis_target(self):
+        # Next blocks would take the target of the genesis block and need no Proof of Work
+        easy = Difficulty(Difficulty.MAX_TARGET)
+        chain = [Block(0, "0", time.time(), [], target=easy.to_hex())]
+        for i in range(1, 4):
+            chain.append(Block(i, chain[-1].hash, chain[-1].timestamp + 1, []))
+            chain[-1].mine_block(easy)
+        self.blockchain.clear()
+
+        self.blockchain.compare_replace([block.to_json() for block in chain])
+
+        self.assertEqual(len(self.blockchain.chain), 0)
+        self.assertFalse(Blockchain.is_chain_valid(chain, self.difficulty))
+
+    def test_compare_replace_invalid_new_block(self):
+        longer_chain = list(self.blockchain.chain)
+        longer_chain.append(self.mine_next_block(longer_chain))
+        new_chain_json = [block.to_json() for block in longer_chain]
+        new_chain_json[1]['hash'] = "f" * 64
+
+        self.blockchain.compare_replace(new_chain_json)
+
+        self.assertEqual(len(self.blockchain.chain), 1)
+
+    def test_add_blocks(self):
+        longer_chain = list(self.blockchain.chain)
+        for i in range(3):
+            longer_chain.append(self.mine_next_block(longer_chain))
+        self.blockchain.replace_blocks(0, longer_chain[:2])
+
+        self.assertTrue(self.blockchain.add_blocks([block.to_json() for block in longer_chain[2:]]))
+
+        self.assertEqual([block.hash for block in self.blockchain.chain], [block.hash for block in longer_chain])
+        self.assertIs(self.blockchain.chain[1], longer_chain[1])
+
+    def test_add_blocks_not_connected(self):
+        longer_chain = list(self.blockchain.chain)
+        for i in range(3):
+            longer_chain.append(self.mine_next_block(longer_chain))
+
+        self.assertFalse(self.blockchain.add_blocks([block.to_json() for block in longer_chain[2:]]))
+        self.assertEqual(len(self.blockchain.chain), 1)
+
+    def test_get_locator(self):
+        self.blockchain.chain = [MagicMock(hash=str(i)) for i in range(100)]
+
+        locator = self.blockchain.get_locator()
+
+        self.assertEqual(locator[:10], [str(i) for i in range(99, 89, -1)])
+        self.assertEqual(locator[10:], ['88', '84', '76', '60', '28', '0'])
+
+    def test_get_blocks_after(self):
+        chain = list(self.blockchain.chain)
+        for i in range(3):
+            chain.append(self.mine_next_block(chain))
+        self.blockchain.replace_blocks(0, chain)
+
+        self.assertEqual(self.blockchain.get_blocks_after(['x', chain[1].hash, chain[0].hash], 10), [block.to_json() for block in chain[2:]])
+        self.assertEqual(self.blockchain.get_blocks_after(['x'], 2), [block.to_json() for block in chain[:2]])
+
+    def test_is_chain_valid_invalid_signature(self):
+        wallet = Wallet()
+        transaction = Transaction(wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", 10)
+        transaction.sign_transaction(wallet)
+        chain = list(self.blockchain.chain)
+        chain.append(Block(1, chain[-1].hash, chain[-1].timestamp + 1, [transaction]))
+        chain[-1].mine_block(self.difficulty)
+        self.assertTrue(Blockchain.is_chain_valid(chain, self.difficulty))
+
+        transaction.amount = 1000 # Block is rehashed, but the signature no longer matches
+        chain[-1].hash = chain[-1].calculate_hash()
+        chain[-1].mine_block(self.difficulty)
+        self.assertFalse(Blockchain.is_chain_valid(chain, self.difficulty))
+
+    @patch('Transaction.Transaction.verify_batch')
+    def test_add_new_transactions(self, mock_verify_batch):
+        mock_transactions = [self.mock_transaction() for i in range(3)]
+        mock_verify_batch.return_value = [True, False, True]
+
+        self.blockchain.add_new_transactions(mock_transactions)
+
+        mock_verify_batch.assert_called_once_with(mock_transactions)
+        self.assertIn(mock_transactions[0], self.blockchain.mempool)
+        self.assertNotIn(mock_transactions[1], self.blockchain.mempool)
+        self.assertIn(mock_transactions[2], self.blockchain.mempool)
+
+    def test_find_fork_index(self):
+        chain = [MagicMock(hash=h) for h in "abcd"]
+        self.assertEqual(Blockchain.find_fork_index(chain, [{'hash': h} for h in "abcdef"]), 3)
+        self.assertEqual(Blockchain.find_fork_index(chain, [{'hash': h} for h in "abxyz"]), 1)
+        self.assertEqual(Blockchain.find_fork_index(chain, [{'hash': h} for h in "xyz"]), -1)
+
     def test_add_new_transaction_valid(self):
-        mock_transaction = MagicMock(spec=Transaction)
+        mock_transaction = self.mock_transaction()
         mock_transaction.is_valid = lambda : True
 
         self.blockchain.add_new_transaction(mock_transaction)
 
         self.assertIn(mock_transaction, self.blockchain.mempool)
-        self.assertIsNone(self.blockchain.currently_mined_block)
+        self.blockchain.miner.update.assert_called_once_with()
 
     def test_add_new_transaction_invalid(self):
-        mock_transaction = MagicMock(spec=Transaction)
+        mock_transaction = self.mock_transaction()
         mock_transaction.is_valid = lambda : False
 
         self.blockchain.add_new_transaction(mock_transaction)
 
         self.assertNotIn(mock_transaction, self.blockchain.mempool)
-        self.assertIsNone(self.blockchain.currently_mined_block)
+        self.blockchain.miner.update.assert_not_called()
     
-    @patch('Block.Block')
-    @patch('Blockchain.Blockchain.start_mining')
-    def test_add_new_transactions_and_create_block(self, mock_start_mining, mock_block_class):
-        mock_transaction = MagicMock(spec=Transaction)
+    def test_add_new_transaction_duplicate(self):
+        mock_transaction = self.mock_transaction()
         mock_transaction.is_valid = lambda : True
-        mock_block_class.return_value = MagicMock(spec=Block)
 
         for i in range(5):
             self.blockchain.add_new_transaction(mock_transaction)
 
-        self.assertIn(mock_transaction, self.blockchain.mempool)
-        self.assertIsNotNone(self.blockchain.currently_mined_block)
-        mock_start_mining.assert_called_once()
+        self.assertEqual(len(self.blockchain.mempool), 1)
+        self.blockchain.miner.update.assert_called_once_with()
+
+    @patch('Block.Block')
+    def test_create_mining_template(self, mock_block_class):
+        mock_transactions = [self.mock_transaction() for i in range(5)]
+        mock_block_class.return_value = MagicMock(spec=Block)
+
+        for i, mock_transaction in enumerate(mock_transactions):
+            self.assertIsNone(self.blockchain.create_mining_template())
+            mock_transaction.is_valid = lambda : True
+            self.blockchain.add_new_transaction(mock_transaction)
+
+        for mock_transaction in mock_transactions:
+            self.assertIn(mock_transaction, self.blockchain.mempool)
+        self.assertIsNotNone(self.blockchain.create_mining_template())
+        self.assertEqual(self.blockchain.miner.update.call_count, 5)
+
+        self.blockchain.clear() # Join didn't find any chain
+        self.assertIsNone(self.blockchain.create_mining_template())
+
+    def test_create_block_template(self):
+        wallet = Wallet()
+        transactions = [Transaction(wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", 1, timestamp=i, fee=i % 4) for i in range(8)]
+        for transaction in transactions:
+            self.blockchain.mempool.add(transaction)
+        self.blockchain.max_block_transactions = 3
+
+        block = self.blockchain.create_block_template()
+
+        self.assertEqual(block.data, [transactions[3], transactions[7], transactions[2]])
+        self.assertEqual(block.previous_hash, self.blockchain.chain[-1].hash)
+        self.blockchain.max_block_size = transactions[0].get_size()
+        self.assertEqual(self.blockchain.create_block_template().data, [transactions[3]])
 
     def test_start_mining_valid_block(self):
         last_block = self.blockchain.chain[-1]
         mock_block = MagicMock(spec=Block)
         mock_block.data = []
-        self.blockchain.currently_mined_block = mock_block
-        mock_block.mine_block = lambda difficulty: True
+        mock_block.index = 1
+        mock_block.hash = "a" * 64
+        mock_block.get_difficulty.return_value = None
+        mock_block.mine_block.return_value = True
 
         self.blockchain.start_mining(mock_block)
 
-        mock_block.validate_block.assert_called_once_with(last_block, self.blockchain.difficulty)
-
+        # Block is mined with the worker processes that the miner keeps
+        mock_block.mine_block.assert_called_once_with(Difficulty.of(self.blockchain.difficulty), self.blockchain.miner.miner)
+        mock_block.validate_block.assert_called_once_with(last_block, Difficulty.of(self.blockchain.difficulty), last_block.timestamp)
+        self.blockchain.miner.update.assert_called_once_with(tip_changed=True)
         self.broadcast_cb.assert_called_once()
 
+    def test_add_mined_block_not_following_tip(self):
+        block = self.mine_next_block(self.blockchain.chain)
+        self.blockchain.replace_blocks(1, [self.mine_next_block(self.blockchain.chain)])
+
+        self.assertFalse(self.blockchain.add_mined_block(block))
+        self.assertEqual(len(self.blockchain.chain), 2)
+        self.broadcast_cb.assert_not_called()
+
+    def test_timestamp_not_after_median_time(self):
+        chain = list(self.blockchain.chain)
+        for i in range(2):
+            chain.append(self.mine_next_block(chain))
+        self.blockchain.replace_blocks(0, chain)
+        block = Block(3, chain[-1].hash, chain[1].timestamp, []) # Median timestamp of the last 3 blocks
+        block.mine_block(self.difficulty)
+
+        self.blockchain.add_blocks([block.to_json()])
+        self.assertEqual(len(self.blockchain.chain), 3)
+        self.assertFalse(self.blockchain.add_mined_block(block))
+
+    def test_switch_branch_updates_miner(self):
+        longer_chain = list(self.blockchain.chain)
+        longer_chain.append(self.mine_next_block(longer_chain))
+
+        self.blockchain.compare_replace([block.to_json() for block in longer_chain])
+
+        self.blockchain.miner.update.assert_called_once_with(tip_changed=True)
+
 if __name__ == '__main__':
     unittest.main()
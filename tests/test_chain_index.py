@@ -0,0 +1,136 @@
+import unittest
+import sys
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import MagicMock, patch
+from BalanceIndex import BalanceIndex
+from Block import Block
+from Blockchain import Blockchain
+from BlockStore import BlockStore
+from BlockTree import BlockTree
+from ChainIndex import ChainIndex
+from Transaction import Transaction
+from Wallet import Wallet
+
+class TestChainIndex(unittest.TestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.sender = Wallet()
+        self.recipient_key = Wallet().get_public_key().decode('utf-8')
+        self.blocks = [Block(0, "0", 0.5, [])]
+        for i in range(1, 4):
+            self.blocks.append(Block(i, self.blocks[-1].hash, i, [self.transaction(i), self.transaction(i + 0.5)]))
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+
+    def transaction(self, amount):
+        transaction = Transaction(self.sender.get_public_key(), self.recipient_key, amount)
+        transaction.sign_transaction(self.sender)
+        return transaction
+
+    def transaction_ids(self, blocks):
+        return [transaction.get_id() for block in blocks for transaction in block.data]
+
+    def connect_blocks(self, index, blocks):
+        balances = BalanceIndex()
+        for block in blocks:
+            balances.connect_block(block)
+            index.connect_block(block, block.index + 1, balances)
+        return balances
+
+    def test_connect_and_disconnect(self):
+        index = ChainIndex()
+        balances = self.connect_blocks(index, self.blocks)
+
+        self.assertEqual(index.get_height(self.blocks[2].hash), 2)
+        self.assertEqual(index.get_transaction_location(self.blocks[3].data[1].get_id()), (3, 1))
+        self.assertEqual(index.get_address_history(self.sender.get_public_key()), self.transaction_ids(self.blocks))
+        self.assertEqual(index.get_address_history(self.recipient_key), self.transaction_ids(self.blocks))
+
+        self.assertEqual(index.get_balances(), balances.balances)
+        self.assertEqual(index.get_chain_work(3), [1, 2, 3, 4])
+
+        balances.disconnect_block(self.blocks[3])
+        index.disconnect_block(self.blocks[3], balances)
+        self.assertIsNone(index.get_height(self.blocks[3].hash))
+        self.assertIsNone(index.get_transaction_location(self.blocks[3].data[1].get_id()))
+        self.assertEqual(index.get_address_history(self.recipient_key), self.transaction_ids(self.blocks[:3]))
+        self.assertEqual(index.get_address_history(Wallet().get_public_key()), [])
+        self.assertEqual(index.get_balances(), balances.balances)
+        self.assertEqual(index.get_chain_work(2), [1, 2, 3])
+
+    def test_persistent_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index')
+            index = ChainIndex(path)
+            self.assertEqual(index.sync_with(self.blocks), -1)
+            balances = self.connect_blocks(index, self.blocks[:3])
+            index.close()
+
+            index = ChainIndex(path)
+            self.assertEqual(index.get_height(self.blocks[2].hash), 2)
+            self.held_output.truncate(0)
+            # Only the last block has to be connected
+            self.assertEqual(index.sync_with(self.blocks), 2)
+            self.assertNotIn("Rebuilding", self.held_output.getvalue())
+            self.assertEqual(index.get_balances(), balances.balances)
+
+            index.sync_with(self.blocks[:2]) # Index of a different chain is rebuilt
+            self.assertIn("Rebuilding", self.held_output.getvalue())
+            self.assertIsNone(index.get_height(self.blocks[1].hash))
+            self.assertEqual(index.get_address_history(self.recipient_key), [])
+            self.assertEqual(index.get_balances(), {})
+            index.close()
+
+    def test_blockchain_resumes_from_index(self):
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryDirectory() as index_directory:
+            index_path = os.path.join(index_directory, 'index')
+            blockchain = Blockchain(1, MagicMock(), BlockStore(directory), chain_index=ChainIndex(index_path))
+            chain = [blockchain.chain[0]]
+            for i in range(1, 4):
+                chain.append(Block(i, chain[-1].hash, chain[0].timestamp + i, [self.transaction(i)]))
+                chain[-1].mine_block(1)
+            blockchain.replace_blocks(1, chain[1:3])
+            blockchain.close()
+            # Block was stored, but the node stopped before it was indexed
+            store = BlockStore(directory)
+            store.append(chain[3])
+            store.close()
+
+            with patch.object(Blockchain, 'connect_block_state', autospec=True, side_effect=Blockchain.connect_block_state) as connect_block_state:
+                restored_blockchain = Blockchain(1, MagicMock(), BlockStore(directory), chain_index=ChainIndex(index_path))
+
+            self.assertEqual(connect_block_state.call_count, 1)
+            balances = BalanceIndex()
+            block_tree = BlockTree()
+            for block in chain:
+                balances.connect_block(block)
+                block_tree.connect(block, 1)
+            self.assertEqual(restored_blockchain.balances.balances, balances.balances)
+            self.assertEqual(restored_blockchain.block_tree.chain_work, block_tree.chain_work)
+            self.assertEqual(restored_blockchain.get_height(chain[3].hash), 3)
+            restored_blockchain.close()
+
+    def test_blockchain_lookups(self):
+        blockchain = Blockchain(1, MagicMock())
+        chain = [blockchain.chain[0]]
+        for i in range(1, 3):
+            chain.append(Block(i, chain[-1].hash, i, [self.transaction(i)]))
+            chain[-1].mine_block(1)
+        blockchain.replace_blocks(0, chain)
+        transaction = chain[2].data[0]
+
+        self.assertEqual(blockchain.get_height(chain[1].hash), 1)
+        self.assertIs(blockchain.get_transaction(transaction.get_id()), transaction)
+        self.assertEqual(blockchain.get_address_history(self.recipient_key), self.transaction_ids(chain))
+
+        blockchain.replace_blocks(2, [])
+        self.assertIsNone(blockchain.get_height(chain[2].hash))
+        self.assertIsNone(blockchain.get_transaction(transaction.get_id()))
+
+if __name__ == '__main__':
+    unittest.main()
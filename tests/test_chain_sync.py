@@ -0,0 +1,156 @@
+import unittest
+import sys
+from io import StringIO
+from unittest.mock import patch, MagicMock
+from Block import Block
+from Blockchain import Blockchain
+from ChainSync import ChainSync
+from Difficulty import Difficulty
+from Network import Server
+from Protocol import Protocol
+from Retarget import Retarget
+
+class FakeClient:
+    """ Sends requests straight to the servers of the peers """
+    def __init__(self, servers):
+        self.servers = servers
+        self.requests = []
+
+    async def request(self, message, peer_ip_addr, peer_port):
+        self.requests.append(((peer_ip_addr, peer_port), message['type']))
+        server = self.servers[(peer_ip_addr, peer_port)]
+        if server is None:
+            raise ConnectionError("Peer is down")
+        return await server.handle_message(message, Protocol.BINARY)
+
+class TestChainSync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.difficulty = 1
+        self.source = Blockchain(self.difficulty, MagicMock())
+        for i in range(1, 8):
+            block = Block(i, self.source.chain[-1].hash, self.source.chain[0].timestamp + i, [])
+            block.mine_block(self.difficulty)
+            self.source.append_block(block)
+        source_node = MagicMock()
+        source_node.blockchain = self.source
+        self.server = Server(source_node)
+
+        self.blockchain = Blockchain(self.difficulty, MagicMock())
+        self.blockchain.replace_blocks(0, [])
+        self.tip = (len(self.source.chain), self.source.chain[-1].hash, self.source.block_tree.get_tip_work())
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+
+    def assert_synced(self):
+        self.assertEqual([block.hash for block in self.blockchain.chain], [block.hash for block in self.source.chain])
+
+    async def test_sync_from_several_peers(self):
+        client = FakeClient({('127.0.0.1', 5000): self.server, ('127.0.0.2', 5000): self.server})
+
+        with patch.object(Protocol, 'MAX_HEADERS_PER_MESSAGE', 3):
+            await ChainSync(self.blockchain, client, range_size=2).run({('127.0.0.1', 5000): self.tip, ('127.0.0.2', 5000): self.tip})
+
+        self.assert_synced()
+        self.assertEqual(client.requests.count((('127.0.0.1', 5000), 'GET_HEADERS')), 3)
+        self.assertIn((('127.0.0.2', 5000), 'GET_BODIES'), client.requests)
+        self.assertNotIn((('127.0.0.2', 5000), 'GET_HEADERS'), client.requests)
+
+    async def test_sync_continues_after_peer_failure(self):
+        client = FakeClient({('127.0.0.1', 5000): self.server, ('127.0.0.2', 5000): None})
+
+        await ChainSync(self.blockchain, client, range_size=2).run({('127.0.0.1', 5000): self.tip, ('127.0.0.2', 5000): self.tip})
+
+        self.assert_synced()
+
+    async def test_sync_downloads_only_missing_blocks(self):
+        self.blockchain.replace_blocks(0, self.source.chain[:5])
+        client = FakeClient({('127.0.0.1', 5000): self.server})
+
+        with patch('Block.Block.from_json', wraps=Block.from_json) as mock_from_json:
+            await ChainSync(self.blockchain, client, range_size=2).run({('127.0.0.1', 5000): self.tip})
+
+        self.assert_synced()
+        self.assertIs(self.blockchain.chain[4], self.source.chain[4])
+        self.assertEqual(mock_from_json.call_count, 6) # 3 missing blocks, checked against headers and then validated
+
+    async def test_sync_skips_shorter_chains(self):
+        self.blockchain.replace_blocks(0, list(self.source.chain))
+        client = FakeClient({('127.0.0.1', 5000): self.server})
+
+        await ChainSync(self.blockchain, client).run({('127.0.0.1', 5000): (3, self.source.chain[2].hash, self.source.block_tree.chain_work[2])})
+
+        self.assertEqual(client.requests, [])
+
+    async def test_sync_rejects_invalid_header(self):
+        invalid_block = Block(4, self.source.chain[3].hash, self.source.chain[0].timestamp + 4, [], hash="f" * 64)
+        self.source.replace_blocks(4, [invalid_block] + self.source.chain[5:])
+        client = FakeClient({('127.0.0.1', 5000): self.server})
+
+        await ChainSync(self.blockchain, client, range_size=2).run({('127.0.0.1', 5000): self.tip})
+
+        self.assertEqual([block.hash for block in self.blockchain.chain], [block.hash for block in self.source.chain[:4]])
+
+    def fork_servers(self):
+        """ Servers of a longer chain whose blocks came slowly and of a shorter one whose last block is 4 times harder """
+        genesis_block = self.source.chain[0]
+        longer_chain, heavier_chain = [genesis_block], [genesis_block]
+        for i in range(1, 6):
+            longer_chain.append(Block(i, longer_chain[-1].hash, genesis_block.timestamp + i * 100, []))
+            longer_chain[-1].mine_block(self.difficulty)
+        for i in range(1, 5):
+            heavier_chain.append(Block(i, heavier_chain[-1].hash, genesis_block.timestamp + i, []))
+            heavier_chain[-1].mine_block(self.difficulty if i < 4 else Difficulty(Difficulty.of(self.difficulty).target // 4))
+
+        servers = []
+        for chain in (longer_chain, heavier_chain):
+            blockchain = Blockchain(self.difficulty, MagicMock())
+            blockchain.replace_blocks(0, chain)
+            node = MagicMock()
+            node.blockchain = blockchain
+            servers.append(Server(node))
+        for blockchain in (self.blockchain, servers[0].p2p_node.blockchain, servers[1].p2p_node.blockchain):
+            blockchain.retarget = Retarget(self.difficulty, block_interval=10, window=2)
+        return servers
+
+    def get_tip(self, server):
+        blockchain = server.p2p_node.blockchain
+        return (len(blockchain.chain), blockchain.get_tip_hash(), blockchain.block_tree.get_tip_work())
+
+    async def test_sync_chooses_chain_with_most_work(self):
+        longer_server, heavier_server = self.fork_servers()
+        self.blockchain.replace_blocks(0, list(longer_server.p2p_node.blockchain.chain))
+        client = FakeClient({('127.0.0.1', 5000): heavier_server})
+
+        await ChainSync(self.blockchain, client).run({('127.0.0.1', 5000): self.get_tip(heavier_server)})
+
+        self.assertEqual(self.blockchain.get_tip_hash(), heavier_server.p2p_node.blockchain.get_tip_hash())
+        self.assertEqual(len(self.blockchain.chain), 5)
+
+    async def test_sync_checks_reported_work(self):
+        longer_server, heavier_server = self.fork_servers()
+        self.blockchain.replace_blocks(0, list(heavier_server.p2p_node.blockchain.chain))
+        client = FakeClient({('127.0.0.1', 5000): longer_server})
+        height, tip_hash, work = self.get_tip(longer_server)
+
+        # Longer chain has less work, even if the peer reports more
+        await ChainSync(self.blockchain, client).run({('127.0.0.1', 5000): (height, tip_hash, work * 10)})
+
+        self.assertEqual(self.blockchain.get_tip_hash(), heavier_server.p2p_node.blockchain.get_tip_hash())
+        self.assertNotIn((('127.0.0.1', 5000), 'GET_BODIES'), client.requests)
+
+    def test_matches_headers(self):
+        blocks = [block.to_json() for block in self.source.chain[1:3]]
+        headers = [block.get_header() for block in self.source.chain[1:3]]
+        self.assertTrue(ChainSync.matches_headers(blocks, headers))
+        self.assertFalse(ChainSync.matches_headers(blocks[:1], headers))
+
+        blocks[1]['timestamp'] = 100 # Body doesn't hash to the header's hash
+        headers[1]['timestamp'] = 100
+        self.assertFalse(ChainSync.matches_headers(blocks, headers))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import sys
+import tempfile
+from io import StringIO
+from unittest.mock import patch, MagicMock
+from Block import Block
+from Blockchain import Blockchain
+from BlockStore import BlockStore
+from ChainView import ChainView
+
+class TestChainView(unittest.TestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = BlockStore(self.directory.name)
+        self.blocks = [Block(0, "0", 0.5, [])]
+        for i in range(1, 6):
+            self.blocks.append(Block(i, self.blocks[-1].hash, i, []))
+        for block in self.blocks:
+            self.store.append(block)
+        self.view = ChainView(self.store, cache_size=2)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+        sys.stdout = sys.__stdout__
+
+    def hashes(self, blocks):
+        return [block.hash for block in blocks]
+
+    def test_sequence(self):
+        self.assertEqual(len(self.view), 6)
+        self.assertEqual(self.view[2].to_json(), self.blocks[2].to_json())
+        self.assertEqual(self.view[-1].hash, self.blocks[-1].hash)
+        self.assertEqual(self.hashes(self.view[1:3]), self.hashes(self.blocks[1:3]))
+        self.assertEqual(self.hashes(self.view[-2:]), self.hashes(self.blocks[-2:]))
+        self.assertEqual(self.hashes(self.view), self.hashes(self.blocks))
+        with self.assertRaises(IndexError):
+            self.view[6]
+
+    def test_cache(self):
+        with patch.object(self.store, 'read_block', wraps=self.store.read_block) as mock_read_block:
+            block = self.view[-1]
+            self.assertIs(self.view[-1], block)
+            self.assertEqual(mock_read_block.call_count, 1)
+
+            list(self.view)
+            self.assertEqual(len(self.view.cache), 2)
+            self.assertEqual(mock_read_block.call_count, 7)
+
+    def test_replaced_block_is_not_cached(self):
+        self.view[4]
+        other_block = Block(4, self.blocks[3].hash, 100, [])
+        self.store.truncate(4)
+        self.store.append(other_block)
+
+        self.assertEqual(len(self.view), 5)
+        self.assertEqual(self.view[4].hash, other_block.hash)
+
+    def test_blockchain_reads_blocks_from_store(self):
+        blockchain = Blockchain(1, MagicMock(), self.store)
+
+        self.assertIsInstance(blockchain.chain, ChainView)
+        self.assertEqual(blockchain.get_tip_hash(), self.blocks[-1].hash)
+        self.assertEqual(blockchain.get_height(self.blocks[2].hash), 2)
+        self.assertEqual(blockchain.get_blocks_after([self.blocks[3].hash], 10), [block.to_json() for block in self.blocks[4:]])
+
+        blockchain.clear()
+        self.assertEqual(len(self.store), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import asyncio
+import time
+from unittest.mock import patch
+from ConnectionPool import ConnectionPool
+from Protocol import Protocol
+
+class TestConnectionPool(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.received = []
+        self.connections = 0
+        self.respond = True
+        self.server = await asyncio.start_server(self.handle_connection, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.pool = ConnectionPool(Protocol.MAX_FRAME_SIZE, timeout=1)
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle_connection(self, reader, writer):
+        """ Echo server - responds to every PEERS_REQ with an empty list of peers """
+        self.connections += 1
+        while True:
+            header = await reader.read(Protocol.FRAME_HEADER.size)
+            if not header:
+                break
+            payload = await reader.readexactly(Protocol.FRAME_HEADER.unpack(header)[0])
+            message, protocol = Protocol.decode(payload)
+            self.received.append(message)
+            if message['type'] == 'PEERS_REQ' and not self.respond:
+                break
+            if message['type'] == 'PEERS_REQ':
+                writer.write(Protocol.encode_frame({'type': 'PEERS', 'peers': {}}, Protocol.BINARY))
+                await writer.drain()
+        writer.close()
+
+    async def test_connection_is_reused(self):
+        leave = Protocol.encode_frame({'type': 'LEAVE', 'ip_address': '127.0.0.1', 'port': 1}, Protocol.BINARY)
+        request = Protocol.encode_frame({'type': 'PEERS_REQ'}, Protocol.BINARY)
+
+        for i in range(0, 3):
+            await self.pool.send('127.0.0.1', self.port, leave)
+            response = await self.pool.request('127.0.0.1', self.port, request)
+            self.assertEqual(response, ({'type': 'PEERS', 'peers': {}}, Protocol.BINARY))
+
+        self.assertEqual(self.connections, 1)
+        self.assertEqual(len(self.received), 6)
+
+    async def test_concurrent_requests(self):
+        request = Protocol.encode_frame({'type': 'PEERS_REQ'}, Protocol.BINARY)
+
+        responses = await asyncio.gather(*(self.pool.request('127.0.0.1', self.port, request) for i in range(0, 10)))
+
+        self.assertEqual(len(responses), 10)
+        self.assertEqual(self.connections, 1)
+
+    async def test_reconnect_after_connection_closed(self):
+        request = Protocol.encode_frame({'type': 'PEERS_REQ'}, Protocol.BINARY)
+        await self.pool.request('127.0.0.1', self.port, request)
+        self.pool.connections[('127.0.0.1', self.port)].close()
+
+        await self.pool.request('127.0.0.1', self.port, request)
+
+        self.assertEqual(self.connections, 2)
+
+    async def test_retry_when_stale_connection_fails_before_sending(self):
+        request = Protocol.encode_frame({'type': 'PEERS_REQ'}, Protocol.BINARY)
+        await self.pool.request('127.0.0.1', self.port, request)
+        connection = self.pool.connections[('127.0.0.1', self.port)]
+
+        with patch.object(connection, 'is_closed', side_effect=[False, True]):
+            response = await self.pool.request('127.0.0.1', self.port, request)
+
+        self.assertEqual(response, ({'type': 'PEERS', 'peers': {}}, Protocol.BINARY))
+        self.assertEqual(self.connections, 2)
+        self.assertEqual(connection.messages_sent, 1)
+
+    async def test_no_retry_when_failure_happens_after_sending(self):
+        request = Protocol.encode_frame({'type': 'PEERS_REQ'}, Protocol.BINARY)
+        await self.pool.request('127.0.0.1', self.port, request)
+        self.respond = False
+
+        with self.assertRaises(ConnectionError):
+            await self.pool.request('127.0.0.1', self.port, request)
+
+        # The peer might have processed the request, so it isn't sent again
+        self.assertEqual(self.connections, 1)
+        self.assertEqual(len(self.received), 2)
+
+    async def test_backoff(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+        with self.assertRaises(OSError):
+            await self.pool.send('127.0.0.1', self.port, b'data')
+        with self.assertRaises(ConnectionError) as context:
+            await self.pool.send('127.0.0.1', self.port, b'data')
+        self.assertIn("delayed", str(context.exception))
+        self.assertEqual(self.pool.failures[('127.0.0.1', self.port)][0], 1)
+
+    async def test_evict_idle(self):
+        request = Protocol.encode_frame({'type': 'PEERS_REQ'}, Protocol.BINARY)
+        await self.pool.request('127.0.0.1', self.port, request)
+        self.pool.idle_timeout = 0.01
+        time.sleep(0.02)
+
+        self.pool.evict_idle()
+
+        self.assertEqual(self.pool.connections, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import hashlib
+from Difficulty import Difficulty
+
+class TestDifficulty(unittest.TestCase):
+
+    def test_from_nibbles_matches_hex_prefix(self):
+        difficulty = Difficulty.from_nibbles(2)
+        for i in range(0, 2000):
+            digest = hashlib.sha256(str(i).encode()).digest()
+            self.assertEqual(difficulty.is_met(digest), digest.hex().startswith("00"))
+
+    def test_from_zero_bits(self):
+        difficulty = Difficulty.from_zero_bits(9)
+        self.assertTrue(difficulty.is_met(bytes([0, 0x7f]) + b'\xff' * 30))
+        self.assertFalse(difficulty.is_met(bytes([0, 0x80]) + b'\x00' * 30))
+
+    def test_from_target(self):
+        difficulty = Difficulty(1000)
+        self.assertTrue(difficulty.is_met((1000).to_bytes(32, 'big')))
+        self.assertFalse(difficulty.is_met((1001).to_bytes(32, 'big')))
+
+    def test_invalid_target(self):
+        with self.assertRaises(ValueError):
+            Difficulty(2 ** 256)
+
+    def test_hex(self):
+        difficulty = Difficulty.from_zero_bits(13)
+        self.assertEqual(difficulty.to_hex(), "0007" + "f" * 60)
+        self.assertEqual(Difficulty.from_hex(difficulty.to_hex()), difficulty)
+        with self.assertRaises(ValueError):
+            Difficulty.from_hex("7fff")
+
+    def test_hashable(self):
+        self.assertEqual(len({Difficulty.from_zero_bits(8), Difficulty.from_nibbles(2), Difficulty.from_zero_bits(9)}), 2)
+
+    def test_of(self):
+        self.assertEqual(Difficulty.of(4), Difficulty.from_zero_bits(16))
+        difficulty = Difficulty.from_zero_bits(13)
+        self.assertIs(Difficulty.of(difficulty), difficulty)
+
+    def test_is_met_by_hex_invalid(self):
+        difficulty = Difficulty.from_nibbles(2)
+        self.assertFalse(difficulty.is_met_by_hex("00_invalid_hash"))
+        self.assertFalse(difficulty.is_met_by_hex("00"))
+        self.assertFalse(difficulty.is_met_by_hex(None))
+
+if __name__ == '__main__':
+    unittest.main()
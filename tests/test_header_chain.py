@@ -0,0 +1,114 @@
+import unittest
+import sys
+from io import StringIO
+from Block import Block
+from HeaderChain import HeaderChain
+from Difficulty import Difficulty
+from Retarget import Retarget
+from Transaction import Transaction
+from Wallet import Wallet
+
+class TestHeaderChain(unittest.TestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.difficulty = 1
+        wallet = Wallet()
+        self.transactions = [Transaction(wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", amount) for amount in range(1, 4)]
+        self.blocks = [Block(0, "0", 0.5, [], target=Difficulty.of(self.difficulty).to_hex())]
+        for i in range(1, 5):
+            self.blocks.append(self.mine(Block(i, self.blocks[-1].hash, i, self.transactions if i == 2 else [])))
+        self.headers = [block.get_header() for block in self.blocks]
+        self.header_chain = HeaderChain(self.difficulty)
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+
+    def mine(self, block):
+        block.mine_block(self.difficulty)
+        return block
+
+    def test_add_headers(self):
+        self.assertTrue(self.header_chain.add_headers(self.headers[:2]))
+        self.assertFalse(self.header_chain.add_headers(self.headers[3:])) # Header 2 is missing
+        self.assertTrue(self.header_chain.add_headers(self.headers[2:]))
+
+        self.assertEqual(len(self.header_chain), 5)
+        self.assertEqual(self.header_chain.get_tip_hash(), self.blocks[-1].hash)
+        self.assertEqual(self.header_chain.get_height(self.blocks[3].hash), 3)
+        self.assertEqual(self.header_chain.get_locator(), [block.hash for block in reversed(self.blocks)])
+
+    def test_retarget(self):
+        self.header_chain.retarget = Retarget(self.difficulty, block_interval=10, window=2)
+        self.assertTrue(self.header_chain.add_headers(self.headers[:4]))
+
+        # Blocks came every second instead of every 10 seconds, block 4 has to be mined at a higher difficulty
+        self.assertFalse(self.header_chain.add_headers(self.headers[4:]))
+        block = Block(4, self.blocks[3].hash, 4, [])
+        block.mine_block(Difficulty(Difficulty.of(self.difficulty).target // 4))
+        self.assertTrue(self.header_chain.add_headers([block.get_header()]))
+        self.assertEqual(len(self.header_chain), 5)
+
+    def test_easy_genesis_target(self):
+        easy = Difficulty(Difficulty.MAX_TARGET)
+        blocks = [Block(0, "0", 0.5, [], target=easy.to_hex())]
+        blocks.append(Block(1, blocks[0].hash, 1, []))
+        blocks[1].mine_block(easy)
+
+        self.assertFalse(self.header_chain.add_headers([block.get_header() for block in blocks]))
+        self.assertEqual(len(self.header_chain), 0)
+
+    def test_invalid_headers(self):
+        self.header_chain.add_headers(self.headers[:2])
+
+        self.assertFalse(self.header_chain.add_headers([dict(self.headers[2], nonce=self.headers[2]['nonce'] + 1)]))
+        self.assertFalse(self.header_chain.add_headers([dict(self.headers[2], merkle_root="f" * 64)]))
+        self.assertEqual(len(self.header_chain), 2)
+
+    def test_fork(self):
+        self.header_chain.add_headers(self.headers)
+        fork = [self.blocks[2]]
+        for i in range(3, 7):
+            fork.append(self.mine(Block(i, fork[-1].hash, i + 100, [])))
+
+        self.assertTrue(self.header_chain.add_headers([block.get_header() for block in fork[1:3]])) # Not longer, ignored
+        self.assertEqual(self.header_chain.get_tip_hash(), self.blocks[-1].hash)
+
+        self.assertTrue(self.header_chain.add_headers([block.get_header() for block in fork[1:]]))
+        self.assertEqual(self.header_chain.get_tip_hash(), fork[-1].hash)
+        self.assertFalse(self.header_chain.has_block(self.blocks[4].hash))
+        self.assertEqual(len(self.header_chain), 7)
+
+    def test_fork_with_more_work(self):
+        self.header_chain.retarget = Retarget(self.difficulty, block_interval=10, window=2)
+        # Blocks came every 100 seconds, so the difficulty stays at the initial one
+        longer_chain = [self.blocks[0]]
+        for i in range(1, 6):
+            longer_chain.append(self.mine(Block(i, longer_chain[-1].hash, i * 100, [])))
+        # Blocks came every second, so block 4 is 4 times harder
+        harder_block = Block(4, self.blocks[3].hash, 4, [])
+        harder_block.mine_block(Difficulty(Difficulty.of(self.difficulty).target // 4))
+        heavier_chain = self.blocks[:4] + [harder_block]
+
+        self.assertTrue(self.header_chain.add_headers([block.get_header() for block in longer_chain]))
+        self.assertTrue(self.header_chain.add_headers([block.get_header() for block in heavier_chain[1:]]))
+
+        # Shorter chain has more work
+        self.assertEqual(self.header_chain.get_tip_hash(), harder_block.hash)
+        self.assertEqual(len(self.header_chain), 5)
+        self.assertEqual(self.header_chain.get_tip_work(), 8 * Difficulty.of(self.difficulty).get_work())
+        self.assertTrue(self.header_chain.add_headers([block.get_header() for block in longer_chain[1:]]))
+        self.assertEqual(self.header_chain.get_tip_hash(), harder_block.hash)
+
+    def test_confirmations(self):
+        self.header_chain.add_headers(self.headers)
+        transaction_id = self.transactions[2].get_id()
+        proof = {'transaction_id': transaction_id, 'block_hash': self.blocks[2].hash, 'proof': self.blocks[2].get_merkle_proof(transaction_id)}
+
+        self.assertEqual(self.header_chain.get_confirmations(proof), 3)
+        self.assertEqual(self.header_chain.get_confirmations(dict(proof, block_hash=self.blocks[3].hash)), 0)
+        self.assertEqual(self.header_chain.get_confirmations(dict(proof, transaction_id=self.transactions[0].get_id())), 0)
+
+if __name__ == '__main__':
+    unittest.main()
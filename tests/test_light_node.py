@@ -0,0 +1,85 @@
+import unittest
+import socket
+import sys
+import time
+from io import StringIO
+from unittest.mock import MagicMock
+from Block import Block
+from LightNode import LightNode, LightServer
+from Network import P2PNode
+from Protocol import Protocol
+from Transaction import Transaction
+from Wallet import Wallet
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as temp_socket:
+        temp_socket.bind(('127.0.0.1', 0))
+        return temp_socket.getsockname()[1]
+
+class TestLightServer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.mock_p2p_node = MagicMock()
+        self.server = LightServer(self.mock_p2p_node)
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+
+    async def test_hello(self):
+        response = await self.server.handle_message({'type': 'HELLO', 'ip_address': '127.0.0.2', 'port': 5001}, Protocol.BINARY)
+
+        self.assertEqual(response, {'type': 'CHAIN_TIP', 'height': 0, 'hash': '', 'work': 0})
+        self.mock_p2p_node.add_peer.assert_called_once_with('127.0.0.2', 5001)
+        self.mock_p2p_node.set_peer_protocol.assert_called_once_with('127.0.0.2', 5001, Protocol.BINARY)
+
+    async def test_requests_for_data(self):
+        self.assertEqual(await self.server.handle_message({'type': 'GET_BODIES', 'hashes': ['a' * 64]}, Protocol.BINARY), {'type': 'BLOCKS', 'blocks': []})
+        self.assertEqual(await self.server.handle_message({'type': 'GET_PROOF', 'ids': ['a' * 64]}, Protocol.BINARY), {'type': 'PROOFS', 'proofs': []})
+        self.assertIsNone(await self.server.handle_message({'type': 'NEW_TRANSACTION', 'transaction': {}}, Protocol.BINARY))
+
+class TestLightNode(unittest.TestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return condition()
+
+    def test_sync_and_confirm_transaction(self):
+        full_node = P2PNode('127.0.0.1', free_port())
+        wallet = Wallet()
+        transactions = [Transaction(wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", amount) for amount in range(1, 4)]
+        for transaction in transactions:
+            transaction.sign_transaction(wallet)
+        block = Block(1, full_node.blockchain.chain[-1].hash, time.time(), transactions)
+        block.mine_block(full_node.blockchain.difficulty)
+        full_node.blockchain.append_block(block)
+
+        light_node = LightNode('127.0.0.2', free_port())
+        light_node.join_network('127.0.0.1', full_node.port)
+
+        self.assertEqual(light_node.blockchain.get_tip_hash(), block.hash)
+        self.assertEqual(light_node.confirm_transaction(transactions[1].get_id()), 1)
+        self.assertEqual(light_node.confirm_transaction(Transaction(wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", 7).get_id()), 0)
+
+        # New blocks are announced to the light node, which fetches only their headers
+        next_block = Block(2, block.hash, time.time(), [])
+        next_block.mine_block(full_node.blockchain.difficulty)
+        full_node.blockchain.append_block(next_block)
+        full_node.announce_block()
+        self.assertTrue(self.wait_for(lambda: light_node.blockchain.get_tip_hash() == next_block.hash))
+        self.assertEqual(light_node.confirm_transaction(transactions[1].get_id()), 2)
+
+        light_node.leave_network()
+        full_node.leave_network()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import time
+import sys
+from io import StringIO
+from Wallet import Wallet
+from Transaction import Transaction
+from Mempool import Mempool
+
+class TestMempool(unittest.TestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.wallet = Wallet()
+        self.transactions = [
+            Transaction(self.wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", amount, timestamp=amount)
+            for amount in range(0, 5)
+        ]
+        self.mempool = Mempool()
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+
+    def test_add(self):
+        for transaction in self.transactions:
+            self.assertTrue(self.mempool.add(transaction))
+        self.assertEqual(len(self.mempool), 5)
+        self.assertEqual(self.mempool.copy(), self.transactions)
+
+    def test_add_duplicate(self):
+        self.mempool.add(self.transactions[0])
+        duplicate = Transaction.from_json(self.transactions[0].to_json())
+        self.assertFalse(self.mempool.add(duplicate))
+        self.assertEqual(len(self.mempool), 1)
+
+    def test_contains(self):
+        self.mempool.add(self.transactions[0])
+        self.assertIn(Transaction.from_json(self.transactions[0].to_json()), self.mempool)
+        self.assertNotIn(self.transactions[1], self.mempool)
+
+    def test_remove(self):
+        self.mempool.add(self.transactions[0])
+        self.mempool.remove(self.transactions[0])
+        self.assertEqual(len(self.mempool), 0)
+        with self.assertRaises(KeyError):
+            self.mempool.remove(self.transactions[0])
+
+    def test_discard_all(self):
+        for transaction in self.transactions[:3]:
+            self.mempool.add(transaction)
+        self.mempool.discard_all(self.transactions[1:])
+        self.assertEqual(list(self.mempool), self.transactions[:1])
+
+    def test_balance_changes(self):
+        sender = self.wallet.get_public_key().decode('utf-8')
+        for transaction in self.transactions:
+            self.mempool.add(transaction)
+        self.assertEqual(self.mempool.balance_changes, {sender: -10, "DUMMY_RECIPIENT_KEY": 10})
+
+        self.mempool.remove(self.transactions[4])
+        self.mempool.discard_all(self.transactions[:2])
+        self.assertEqual(self.mempool.balance_changes, {sender: -5, "DUMMY_RECIPIENT_KEY": 5})
+        self.mempool.expire(now=time.time() + self.mempool.expiry + 1)
+        self.assertEqual(self.mempool.balance_changes, {})
+
+    def test_get(self):
+        self.mempool.add(self.transactions[2])
+        self.assertIs(self.mempool.get(self.transactions[2].get_id()), self.transactions[2])
+        self.assertIsNone(self.mempool.get(self.transactions[3].get_id()))
+
+    def test_select_by_fee_rate(self):
+        fees = [0, 30, 10, 30, 20]
+        transactions = [Transaction(self.wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", 1, timestamp=i, fee=fee) for i, fee in enumerate(fees)]
+        for transaction in transactions:
+            self.mempool.add(transaction)
+
+        self.assertEqual(self.mempool.select(), [transactions[i] for i in [1, 3, 4, 2, 0]])
+        self.assertEqual(self.mempool.select(max_count=2), transactions[1:4:2])
+        size = transactions[0].get_size()
+        self.assertEqual(self.mempool.select(max_size=3 * size), [transactions[i] for i in [1, 3, 4]])
+        self.assertEqual(self.mempool.select(accept=lambda transaction, selected: transaction.fee != 30), [transactions[i] for i in [4, 2, 0]])
+
+        self.mempool.remove(transactions[1])
+        self.mempool.add(transactions[1])
+        self.assertEqual(self.mempool.select(max_count=3), [transactions[i] for i in [1, 3, 4]])
+        self.assertEqual(len(self.mempool), 5)
+
+    def test_entries_by_priority(self):
+        fees = [7, 3, 9, 1, 5, 8, 2, 6, 4, 0]
+        for i, fee in enumerate(fees):
+            self.mempool.add(Transaction(self.wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", 1, timestamp=i, fee=fee))
+        heap = list(self.mempool.heap)
+
+        self.assertEqual(list(self.mempool.entries_by_priority()), sorted(heap))
+        self.assertEqual(self.mempool.heap, heap) # Heap isn't copied or modified
+
+    def test_removed_transactions_are_compacted(self):
+        for transaction in self.transactions:
+            self.mempool.add(transaction)
+        self.mempool.discard_all(self.transactions[:3])
+
+        self.assertEqual(len(self.mempool.heap), 2)
+        self.assertEqual(self.mempool.select(), self.transactions[3:])
+
+    def test_expire(self):
+        self.mempool = Mempool(expiry=60)
+        for transaction in self.transactions[:2]:
+            self.mempool.add(transaction)
+        self.mempool.entries[self.transactions[0].get_id()] = (100, time.time() - 61)
+
+        self.assertEqual(self.mempool.expire(), self.transactions[:1])
+        self.assertEqual(self.mempool.copy(), self.transactions[1:2])
+
+if __name__ == '__main__':
+    unittest.main()
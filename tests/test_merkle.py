@@ -0,0 +1,42 @@
+import unittest
+import hashlib
+from Merkle import Merkle
+
+class TestMerkle(unittest.TestCase):
+    def setUp(self):
+        self.transaction_ids = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(9)]
+
+    def test_root(self):
+        self.assertEqual(Merkle.root([]), Merkle.EMPTY_ROOT)
+        self.assertEqual(Merkle.root(self.transaction_ids[:1]), Merkle.hash_leaf(self.transaction_ids[0]).hex())
+        self.assertNotEqual(Merkle.root(self.transaction_ids[:3]), Merkle.root(self.transaction_ids[:2]))
+        # Last transaction isn't paired with itself
+        self.assertNotEqual(Merkle.root(self.transaction_ids[:3]), Merkle.root(self.transaction_ids[:3] + self.transaction_ids[2:3]))
+        self.assertNotEqual(Merkle.root(self.transaction_ids[:2]), Merkle.root(self.transaction_ids[1::-1]))
+
+    def test_proofs(self):
+        for count in range(1, len(self.transaction_ids) + 1):
+            transaction_ids = self.transaction_ids[:count]
+            root = Merkle.root(transaction_ids)
+            for position, transaction_id in enumerate(transaction_ids):
+                proof = Merkle.proof(transaction_ids, position)
+                self.assertLessEqual(len(proof), (count - 1).bit_length())
+                self.assertTrue(Merkle.verify(transaction_id, proof, root))
+
+        with self.assertRaises(IndexError):
+            Merkle.proof(self.transaction_ids, len(self.transaction_ids))
+
+    def test_invalid_proofs(self):
+        root = Merkle.root(self.transaction_ids)
+        proof = Merkle.proof(self.transaction_ids, 4)
+
+        self.assertFalse(Merkle.verify(self.transaction_ids[5], proof, root))
+        self.assertFalse(Merkle.verify(self.transaction_ids[4], proof[:-1], root))
+        self.assertFalse(Merkle.verify(self.transaction_ids[4], [(proof[0][0], 'L' if proof[0][1] == 'R' else 'R')] + proof[1:], root))
+        self.assertFalse(Merkle.verify(self.transaction_ids[4], [('xyz', 'L')] + proof[1:], root))
+        # Inner node can't be used as a leaf
+        inner_node = Merkle.hash_node(Merkle.hash_leaf(self.transaction_ids[0]), Merkle.hash_leaf(self.transaction_ids[1])).hex()
+        self.assertFalse(Merkle.verify(inner_node, Merkle.proof(self.transaction_ids, 0)[1:], root))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import time
+import threading
+from Block import Block
+from Miner import Miner, midstate
+from unittest.mock import MagicMock
+import sys
+from io import StringIO
+
+class TestMiner(unittest.TestCase):
+
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.mock_transaction = MagicMock()
+        self.mock_transaction.get_id.return_value = "ab" * 32
+        self.block = Block(
+            index=1,
+            previous_hash="0",
+            timestamp=time.time(),
+            data=[self.mock_transaction]
+        )
+        self.pool_miner = Miner(workers=2)
+
+    def tearDown(self):
+        self.pool_miner.close()
+        sys.stdout = sys.__stdout__
+
+    def test_mine_in_process(self):
+        nonce, block_hash = Miner(workers=1).mine(self.block, 2)
+        self.block.nonce = nonce
+        self.assertTrue(block_hash.startswith("00"))
+        self.assertEqual(block_hash, self.block.calculate_hash())
+
+    def test_mine_in_pool(self):
+        nonce, block_hash = self.pool_miner.mine(self.block, 2)
+        self.block.nonce = nonce
+        self.assertTrue(block_hash.startswith("00"))
+        self.assertEqual(block_hash, self.block.calculate_hash())
+
+    def test_mine_in_pool_stopped(self):
+        self.block.stop_mining = True
+        self.assertIsNone(self.pool_miner.mine(self.block, 64))
+
+    def test_mine_in_pool_stopped_while_mining(self):
+        threading.Timer(0.2, lambda: setattr(self.block, 'stop_mining', True)).start()
+        self.assertIsNone(self.pool_miner.mine(self.block, 64))
+
+    def test_mine_in_pool_worker_died(self):
+        self.pool_miner.start_pool()
+        processes = list(self.pool_miner.processes)
+        threading.Timer(0.2, processes[0].kill).start()
+
+        self.assertIsNone(self.pool_miner.mine(self.block, 64))
+        self.assertEqual(self.pool_miner.processes, [])
+        for process in processes:
+            self.assertFalse(process.is_alive())
+
+        nonce, block_hash = self.pool_miner.mine(self.block, 1, max_nonces=1000)
+        self.assertEqual(len(self.pool_miner.processes), 2)
+
+    def test_mine_in_process_up_to_max_nonces(self):
+        self.assertIsNone(Miner(workers=1).mine(self.block, 64, max_nonces=100))
+        nonce, block_hash = Miner(workers=1).mine(self.block, 1, max_nonces=1000)
+        self.assertTrue(0 <= nonce <= 1000)
+
+    def test_mine_in_pool_up_to_max_nonces(self):
+        self.block.nonce = 500
+        self.block.hash = self.block.calculate_hash()
+        self.assertIsNone(self.pool_miner.mine(self.block, 64, max_nonces=100))
+        nonce, block_hash = self.pool_miner.mine(self.block, 1, max_nonces=1000)
+        self.assertTrue(500 <= nonce <= 1500)
+
+    def test_pool_is_reused(self):
+        miner = Miner(workers=2)
+        try:
+            self.assertIsNone(miner.mine(self.block, 64, max_nonces=100))
+            processes = list(miner.processes)
+            nonce, block_hash = miner.mine(self.block, 1, max_nonces=1000)
+            self.assertEqual(miner.processes, processes)
+            self.block.nonce = nonce
+            self.assertEqual(block_hash, self.block.calculate_hash())
+        finally:
+            miner.close()
+        self.assertEqual(miner.processes, [])
+        for process in processes:
+            self.assertFalse(process.is_alive())
+
+    def test_midstate_matches_calculate_hash(self):
+        state = midstate(self.block.hash_prefix())
+        for nonce in range(0, 50):
+            sha = state.copy()
+            sha.update(str(nonce).encode())
+            self.block.nonce = nonce
+            self.assertEqual(sha.hexdigest(), self.block.calculate_hash())
+
+    def test_default_workers(self):
+        self.assertGreaterEqual(Miner().workers, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import time
+from Block import Block
+from Difficulty import Difficulty
+from MinerController import MinerController
+from unittest.mock import MagicMock
+import sys
+from io import StringIO
+
+class TestMinerController(unittest.TestCase):
+
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.blockchain = MagicMock()
+        self.controller = MinerController(self.blockchain, workers=1, debounce=0.05, nonces_per_round=100)
+
+    def tearDown(self):
+        self.controller.stop()
+        sys.stdout = sys.__stdout__
+
+    def block(self, transaction_id="ab" * 32, difficulty=64):
+        """ Block at a difficulty that can't be met by default, so mining only ends with the round """
+        mock_transaction = MagicMock()
+        mock_transaction.get_id.return_value = transaction_id
+        return Block(index=1, previous_hash="0", timestamp=time.time(), data=[mock_transaction], target=Difficulty.of(difficulty).to_hex())
+
+    def test_mine_round_keeps_nonce_progress(self):
+        block = self.block()
+        self.blockchain.create_mining_template.return_value = block
+        self.controller.rebuild_template()
+        self.controller.mine_round(block)
+        self.assertEqual(block.nonce, 100)
+
+        # Template with the same header, only created later
+        self.blockchain.create_mining_template.return_value = self.block()
+        self.controller.rebuild_template()
+
+        self.assertIs(self.controller.block, block)
+        self.assertFalse(block.stop_mining)
+
+    def test_rounds_are_sized_by_time(self):
+        self.controller.nonces_per_round = 2000
+        self.controller.round_time = 10
+        block = self.block()
+
+        self.controller.mine_round(block)
+
+        self.assertEqual(block.nonce, 2000)
+        self.assertGreater(self.controller.nonces_per_round, 2000) # 2000 hashes take much less than 10 seconds
+
+    def test_worker_survives_errors(self):
+        self.blockchain.create_mining_template.side_effect = [OSError("Disk failure"), None]
+
+        self.controller.update()
+        time.sleep(0.2)
+        self.assertTrue(self.controller.thread.is_alive())
+        self.assertIn("Mining failed: Disk failure", self.held_output.getvalue())
+
+        self.controller.update()
+        time.sleep(0.2)
+        self.assertEqual(self.blockchain.create_mining_template.call_count, 2)
+
+    def test_rebuild_with_new_transactions(self):
+        block = self.block()
+        self.blockchain.create_mining_template.return_value = block
+        self.controller.rebuild_template()
+        new_block = self.block(transaction_id="cd" * 32)
+        self.blockchain.create_mining_template.return_value = new_block
+
+        self.controller.rebuild_template()
+
+        self.assertIs(self.controller.block, new_block)
+        self.assertTrue(block.stop_mining)
+
+    def test_tip_change_stops_mining(self):
+        block = self.block()
+        self.controller.block = block
+        self.controller.start = MagicMock()
+
+        self.controller.update(tip_changed=True)
+
+        self.assertTrue(block.stop_mining)
+        self.assertIsNone(self.controller.block)
+        self.assertTrue(self.controller.is_rebuild_due())
+
+    def test_update_is_debounced(self):
+        self.controller.start = MagicMock()
+        for i in range(3):
+            self.controller.update()
+        self.assertFalse(self.controller.is_rebuild_due())
+
+        time.sleep(0.06)
+
+        self.assertTrue(self.controller.is_rebuild_due())
+
+    def test_mined_block_is_added(self):
+        self.controller.nonces_per_round = 10000
+        block = self.block(difficulty=1)
+        self.blockchain.create_mining_template.return_value = block
+        self.blockchain.add_mined_block.return_value = True
+
+        self.controller.update()
+        for _ in range(100):
+            if self.blockchain.add_mined_block.called:
+                break
+            time.sleep(0.05)
+
+        self.blockchain.create_mining_template.assert_called_once()
+        self.blockchain.add_mined_block.assert_called_once_with(block)
+        self.assertTrue(block.hash.startswith("0"))
+
+if __name__ == '__main__':
+    unittest.main()
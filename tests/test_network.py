@@ -1,103 +1,346 @@
 import unittest
-from unittest.mock import patch, MagicMock
+import asyncio
+import socket
+import time
+import threading
+from unittest.mock import patch, MagicMock, AsyncMock
 import json
 from Network import Server, Client, P2PNode
 from Blockchain import Blockchain
+from Block import Block
 from Transaction import Transaction
+from Wallet import Wallet
+from Protocol import Protocol
 import sys
 from io import StringIO
 
-class TestServer(unittest.TestCase):
-    @patch('threading.Thread')
-    def setUp(self, mock_thread):
+def stream_reader(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+def stream_writer():
+    writer = MagicMock()
+    writer.drain = AsyncMock()
+    return writer
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as temp_socket:
+        temp_socket.bind(('127.0.0.1', 0))
+        return temp_socket.getsockname()[1]
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
         self.held_output = StringIO()
         sys.stdout = self.held_output
 
         self.mock_blockchain = MagicMock()
-        self.mock_blockchain.data = []
-        self.mock_client_socket = MagicMock()
+        self.mock_blockchain.chain = []
         self.mock_p2p_node = MagicMock()
         self.mock_p2p_node.blockchain = self.mock_blockchain
         self.server = Server(self.mock_p2p_node)
-    
+
     def tearDown(self):
         sys.stdout = sys.__stdout__
 
-    @patch('socket.socket')
-    def test_handle_request_peers_req(self, mock_socket):
-        self.mock_client_socket.recv.return_value = json.dumps({'type': 'PEERS_REQ'}).encode('utf-8')
-        self.server.p2p_node.peers = {'127.0.0.1': 5000}
-        
-        self.server.handle_request(self.mock_client_socket)
+    async def test_handle_request_peers_req(self):
+        self.mock_p2p_node.get_peers.return_value = {'127.0.0.1': 5000}
+        writer = stream_writer()
+
+        await self.server.handle_connection(stream_reader(json.dumps({'type': 'PEERS_REQ'}).encode('utf-8')), writer)
 
-        self.mock_client_socket.send.assert_called_once_with(
+        writer.write.assert_called_once_with(
             json.dumps({'type': 'PEERS', 'peers': {'127.0.0.1': 5000}}).encode('utf-8')
         )
+        writer.close.assert_called_once()
 
-    @patch('socket.socket')
-    def test_handle_request_new_peer(self, mock_socket):
-        self.mock_client_socket.recv.return_value = json.dumps({'type': 'NEW_PEER', 'ip_address': '192.168.1.1', 'port': 5001}).encode('utf-8')
+    async def test_handle_request_new_peer(self):
+        writer = stream_writer()
+        request = json.dumps({'type': 'NEW_PEER', 'ip_address': '192.168.1.1', 'port': 5001}).encode('utf-8')
 
-        self.server.handle_request(self.mock_client_socket)
+        await self.server.handle_connection(stream_reader(request), writer)
 
-        self.mock_client_socket.send.assert_called_once_with(
+        writer.write.assert_called_once_with(
             json.dumps({
                     'type': 'BLOCKCHAIN',
                     'blockchain': []
             }).encode('utf-8')
         )
         self.mock_p2p_node.add_peer.assert_called_once_with('192.168.1.1', 5001)
+        self.mock_p2p_node.set_peer_protocol.assert_not_called()
+
+    async def test_handle_request_new_peer_binary(self):
+        writer = stream_writer()
+        request = json.dumps({
+            'type': 'NEW_PEER', 'ip_address': '192.168.1.1', 'port': 5001, 'protocols': [Protocol.JSON, Protocol.BINARY]
+        }).encode('utf-8')
+
+        await self.server.handle_connection(stream_reader(request), writer)
+
+        writer.write.assert_called_once_with(
+            Protocol.encode_frame({'type': 'BLOCKCHAIN', 'blockchain': []}, Protocol.BINARY)
+        )
+        self.mock_p2p_node.set_peer_protocol.assert_called_once_with('192.168.1.1', 5001, Protocol.BINARY)
+
+    async def test_handle_request_binary_peers_req(self):
+        self.mock_p2p_node.get_peers.return_value = {'127.0.0.1': 5000}
+        writer = stream_writer()
+
+        await self.server.handle_connection(stream_reader(Protocol.encode_frame({'type': 'PEERS_REQ'}, Protocol.BINARY)), writer)
 
-    @patch('socket.socket')
-    def test_handle_request_new_transaction(self, mock_socket):
+        writer.write.assert_called_once_with(
+            Protocol.encode_frame({'type': 'PEERS', 'peers': {'127.0.0.1': 5000}}, Protocol.BINARY)
+        )
+
+    async def test_handle_connection_continues_after_invalid_message(self):
+        self.mock_p2p_node.get_peers.return_value = {'127.0.0.1': 5000}
+        self.mock_blockchain.add_new_transaction.side_effect = ValueError("Amount can not be negative")
+        transaction_data = {'amount': -1, 'sender_public_key': '123456', 'recipient_public_key': '654321', 'timestamp': 15,
+                            'signature': None, 'fee': 0}
+        writer = stream_writer()
+        requests = (Protocol.encode_frame({'type': 'NEW_TRANSACTION', 'transaction': transaction_data}, Protocol.BINARY) +
+                    Protocol.encode_frame({'type': 'PEERS_REQ'}, Protocol.BINARY))
+
+        await self.server.handle_connection(stream_reader(requests), writer)
+
+        self.mock_blockchain.add_new_transaction.assert_called_once()
+        writer.write.assert_called_once_with(
+            Protocol.encode_frame({'type': 'PEERS', 'peers': {'127.0.0.1': 5000}}, Protocol.BINARY)
+        )
+
+    async def test_handle_request_new_transaction(self):
         transaction_data = {'amount': 10, 'sender_public_key': '123456', 'recipient_public_key': '654321', 'timestamp': 15, 'signature': ''}
-        self.mock_client_socket.recv.return_value = json.dumps({'type': 'NEW_TRANSACTION', 'transaction': transaction_data}).encode('utf-8')
         self.mock_p2p_node.blockchain.add_new_transaction = MagicMock()
 
-        self.server.handle_request(self.mock_client_socket)
+        response = await self.server.handle_message({'type': 'NEW_TRANSACTION', 'transaction': transaction_data}, Protocol.JSON)
 
+        self.assertIsNone(response)
         self.mock_p2p_node.blockchain.add_new_transaction.assert_called_once_with(Transaction.from_json(transaction_data))
 
-class TestClient(unittest.TestCase):
+    async def test_handle_request_blockchain(self):
+        response = await self.server.handle_message({'type': 'BLOCKCHAIN', 'blockchain': [{'index': 0}]}, Protocol.JSON)
+
+        self.assertIsNone(response)
+        self.mock_blockchain.compare_replace.assert_called_once_with([{'index': 0}])
+
+    async def test_handle_request_inventory(self):
+        self.mock_p2p_node.fetch_inventory = AsyncMock()
+        message = {'type': 'INV', 'ip_address': '192.168.1.1', 'port': 5001, 'blocks': ['a' * 64], 'transactions': []}
+
+        response = await self.server.handle_message(message, Protocol.BINARY)
+        await asyncio.gather(*self.server.fetches)
+
+        self.assertIsNone(response)
+        self.mock_p2p_node.set_peer_protocol.assert_called_once_with('192.168.1.1', 5001, Protocol.BINARY)
+        self.mock_p2p_node.fetch_inventory.assert_awaited_once_with('192.168.1.1', 5001, ['a' * 64], [])
+
+    async def test_handle_request_inventory_does_not_wait_for_fetch(self):
+        fetched = asyncio.Event()
+        async def fetch_inventory(*args):
+            await fetched.wait()
+        self.mock_p2p_node.fetch_inventory = fetch_inventory
+        message = {'type': 'INV', 'ip_address': '192.168.1.1', 'port': 5001, 'blocks': [], 'transactions': ['b' * 64]}
+
+        response = await asyncio.wait_for(self.server.handle_message(message, Protocol.BINARY), 1)
+
+        self.assertIsNone(response)
+        self.assertEqual(len(self.server.fetches), 1)
+        fetched.set()
+        await asyncio.gather(*self.server.fetches)
+        self.assertEqual(self.server.fetches, set())
+
+    async def test_handle_request_get_blocks(self):
+        self.mock_blockchain.get_blocks_after.return_value = [{'index': 1}]
+
+        response = await self.server.handle_message({'type': 'GET_BLOCKS', 'locator': ['a' * 64]}, Protocol.JSON)
+
+        self.assertEqual(response, {'type': 'BLOCKS', 'blocks': [{'index': 1}]})
+        self.mock_blockchain.get_blocks_after.assert_called_once_with(['a' * 64], Protocol.MAX_BLOCKS_PER_MESSAGE)
+
+    async def test_handle_request_get_blocks_off_event_loop(self):
+        def get_blocks_after(locator, limit):
+            time.sleep(0.3) # Stands in for reading and decoding many blocks
+            return [{'index': 1}]
+        self.mock_blockchain.get_blocks_after.side_effect = get_blocks_after
+
+        request = asyncio.ensure_future(self.server.handle_message({'type': 'GET_BLOCKS', 'locator': []}, Protocol.BINARY))
+        start = time.monotonic()
+        await asyncio.sleep(0.05)
+
+        self.assertLess(time.monotonic() - start, 0.2) # Other connections are still served meanwhile
+        self.assertEqual(await request, {'type': 'BLOCKS', 'blocks': [{'index': 1}]})
+
+    async def test_handle_request_hello(self):
+        self.mock_blockchain.chain = [MagicMock(hash='a' * 64)]
+        self.mock_blockchain.get_tip_hash.return_value = 'a' * 64
+        self.mock_blockchain.block_tree.get_tip_work.return_value = 300
+
+        response = await self.server.handle_message({'type': 'HELLO', 'ip_address': '192.168.1.1', 'port': 5001}, Protocol.BINARY)
+
+        self.assertEqual(response, {'type': 'CHAIN_TIP', 'height': 1, 'hash': 'a' * 64, 'work': 300})
+        self.mock_p2p_node.add_peer.assert_called_once_with('192.168.1.1', 5001)
+        self.mock_p2p_node.set_peer_protocol.assert_called_once_with('192.168.1.1', 5001, Protocol.BINARY)
+
+    async def test_handle_request_get_tx(self):
+        transaction = MagicMock()
+        transaction.to_json.return_value = {'amount': 10}
+        self.mock_blockchain.mempool.get.side_effect = lambda transaction_id: transaction if transaction_id == 'a' else None
+
+        response = await self.server.handle_message({'type': 'GET_TX', 'ids': ['a', 'b']}, Protocol.JSON)
+
+        self.assertEqual(response, {'type': 'TRANSACTIONS', 'transactions': [{'amount': 10}]})
+
+    async def test_handle_request_leave(self):
+        await self.server.handle_message({'type': 'LEAVE', 'ip_address': '192.168.1.1', 'port': 5001}, Protocol.JSON)
+
+        self.mock_p2p_node.remove_peer.assert_called_once_with('192.168.1.1', 5001)
+
+    async def test_handle_request_malformed(self):
+        writer = stream_writer()
+
+        await self.server.handle_connection(stream_reader(b'{"type": "PEERS_REQ"'), writer)
+
+        writer.write.assert_not_called()
+        writer.close.assert_called_once()
+
+class TestClient(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.held_output = StringIO()
         sys.stdout = self.held_output
 
         self.mock_blockchain = MagicMock()
         self.mock_blockchain.data = []
-        self.mock_client_socket = MagicMock()
         self.mock_p2p_node = MagicMock()
         self.mock_p2p_node.blockchain = self.mock_blockchain
+        self.mock_p2p_node.ip_address = '127.0.0.1'
+        self.mock_p2p_node.port = 5000
+        self.mock_p2p_node.get_peer_protocol.return_value = Protocol.JSON
         self.client = Client(self.mock_p2p_node)
-    
+        self.writer = stream_writer()
+
     def tearDown(self):
         sys.stdout = sys.__stdout__
 
-    @patch('socket.socket')
-    def test_request_peers(self, mock_socket):
-        self.mock_client_socket.recv.return_value = json.dumps({'type': 'PEERS', 'peers': {'192.168.1.4': 5002}}).encode('utf-8')
-        mock_socket.return_value = self.mock_client_socket
-        
-        self.client.request_peers('192.168.1.1', 5001)
+    @patch('asyncio.open_connection')
+    async def test_request_peers(self, mock_open_connection):
+        response = json.dumps({'type': 'PEERS', 'peers': {'192.168.1.4': 5002}}).encode('utf-8')
+        mock_open_connection.return_value = (stream_reader(response), self.writer)
+
+        await self.client.request_peers('192.168.1.1', 5001)
 
+        mock_open_connection.assert_called_once_with('192.168.1.1', 5001)
         self.mock_p2p_node.update_peers.assert_called_once_with({'192.168.1.4': 5002})
 
-    @patch('socket.socket')
-    def test_request_chain(self, mock_socket):
-        self.mock_client_socket.recv.return_value = json.dumps({'type': 'BLOCKCHAIN', 'blockchain': []}).encode('utf-8')
-        mock_socket.return_value = self.mock_client_socket
+    @patch('asyncio.open_connection')
+    async def test_request_chain(self, mock_open_connection):
+        response = json.dumps({'type': 'BLOCKCHAIN', 'blockchain': [{'index': 0}]}).encode('utf-8')
+        mock_open_connection.return_value = (stream_reader(response), self.writer)
+
+        blockchain = await self.client.request_chain('192.168.1.1', 5001)
+
+        self.assertEqual(blockchain, [{'index': 0}])
+        request = json.loads(self.writer.write.call_args[0][0])
+        self.assertEqual(request, {'type': 'NEW_PEER', 'ip_address': '127.0.0.1', 'port': 5000, 'protocols': Protocol.SUPPORTED})
+
+    @patch('asyncio.open_connection')
+    async def test_request_chain_binary_response(self, mock_open_connection):
+        response = Protocol.encode_frame({'type': 'BLOCKCHAIN', 'blockchain': []}, Protocol.BINARY)
+        mock_open_connection.return_value = (stream_reader(response), self.writer)
 
-        blockchain = self.client.request_chain('192.168.1.1', 5001)
+        blockchain = await self.client.request_chain('192.168.1.1', 5001)
 
         self.assertEqual(blockchain, [])
-        
-    @patch('socket.socket')
-    def test_send_message_to_peer(self, mock_socket):
-        mock_socket.return_value = self.mock_client_socket
+        self.mock_p2p_node.set_peer_protocol.assert_called_once_with('192.168.1.1', 5001, Protocol.BINARY)
 
-        self.client.send_message_to_peer('Hello', '192.168.1.1', 5001)
+    @patch('asyncio.open_connection')
+    async def test_request_chain_timeout(self, mock_open_connection):
+        async def never_connects(*args):
+            await asyncio.sleep(10)
+        mock_open_connection.side_effect = never_connects
+        self.client.timeout = 0.05
 
-        self.mock_client_socket.send.assert_called_once_with('Hello'.encode('utf-8'))
+        blockchain = await self.client.request_chain('192.168.1.1', 5001)
+
+        self.assertEqual(blockchain, [])
+
+    @patch('asyncio.open_connection')
+    async def test_send_message_to_peer(self, mock_open_connection):
+        mock_open_connection.return_value = (stream_reader(b''), self.writer)
+
+        await self.client.send_message_to_peer('Hello', '192.168.1.1', 5001)
+
+        self.writer.write.assert_called_once_with('Hello'.encode('utf-8'))
+        self.writer.close.assert_called_once()
+
+    async def test_send_message_to_binary_peer_uses_pool(self):
+        self.mock_p2p_node.get_peer_protocol.return_value = Protocol.BINARY
+        self.client.pool.send = AsyncMock()
+
+        await self.client.send_message_to_peer(b'Hello', '192.168.1.1', 5001)
+
+        self.client.pool.send.assert_awaited_once_with('192.168.1.1', 5001, b'Hello')
+
+    async def test_request_binary_peer_uses_pool(self):
+        self.mock_p2p_node.get_peer_protocol.return_value = Protocol.BINARY
+        self.client.pool.request = AsyncMock(return_value=({'type': 'PEERS', 'peers': {}}, Protocol.BINARY))
+
+        await self.client.request_peers('192.168.1.1', 5001)
+
+        self.client.pool.request.assert_awaited_once_with(
+            '192.168.1.1', 5001, Protocol.encode_frame({'type': 'PEERS_REQ', 'protocols': Protocol.SUPPORTED}, Protocol.BINARY)
+        )
+        self.mock_p2p_node.update_peers.assert_called_once_with({})
+
+    async def test_request_blocks_of_deep_fork(self):
+        blockchain = Blockchain(1, MagicMock())
+        genesis_block = blockchain.chain[0]
+        own_chain, other_chain = [genesis_block], [genesis_block]
+        for i in range(1, 8):
+            if i < 5:
+                own_chain.append(Block(i, own_chain[-1].hash, genesis_block.timestamp + i, []))
+                own_chain[-1].mine_block(1)
+            other_chain.append(Block(i, other_chain[-1].hash, genesis_block.timestamp + i + 0.5, []))
+            other_chain[-1].mine_block(1)
+        blockchain.replace_blocks(0, own_chain)
+        self.mock_p2p_node.blockchain = blockchain
+        peer_node = MagicMock()
+        peer_node.blockchain = Blockchain(1, MagicMock())
+        peer_node.blockchain.replace_blocks(0, other_chain)
+        peer_server = Server(peer_node)
+        async def request(message, peer_ip_addr, peer_port):
+            return await peer_server.handle_message(message, Protocol.BINARY)
+        self.client.request = AsyncMock(side_effect=request)
+
+        # First batch of the other branch has less work than the own chain
+        with patch.object(Protocol, 'MAX_BLOCKS_PER_MESSAGE', 3):
+            await self.client.request_blocks('192.168.1.1', 5001)
+
+        self.assertEqual([block.hash for block in blockchain.chain], [block.hash for block in other_chain])
+        self.assertEqual(self.client.request.await_count, 3)
+
+    async def test_broadcast_message(self):
+        protocols = {('192.168.1.1', 5001): Protocol.BINARY}
+        self.mock_p2p_node.get_peer_protocol = lambda ip_address, port: protocols.get((ip_address, port), Protocol.JSON)
+        self.client.send_message_to_peer = AsyncMock()
+        message = {'type': 'LEAVE', 'ip_address': '127.0.0.1', 'port': 5000}
+
+        await self.client.broadcast_message(message, {'192.168.1.1': 5001, '192.168.1.2': 5002})
+
+        self.client.send_message_to_peer.assert_any_await(Protocol.encode_frame(message, Protocol.BINARY), '192.168.1.1', 5001)
+        self.client.send_message_to_peer.assert_any_await(Protocol.encode_frame(message, Protocol.JSON), '192.168.1.2', 5002)
+
+    async def test_broadcast_message_is_concurrent(self):
+        self.mock_p2p_node.get_peer_protocol.return_value = Protocol.JSON
+        async def slow_send(*args):
+            await asyncio.sleep(0.2)
+        self.client.send_message_to_peer = slow_send
+        peers = {f'192.168.1.{i}': 5000 for i in range(0, 20)}
+
+        start = time.monotonic()
+        await self.client.broadcast_message({'type': 'PEERS_REQ'}, peers)
+
+        self.assertLess(time.monotonic() - start, 1)
 
 class TestP2PNode(unittest.TestCase):
     @patch('Network.Client')
@@ -106,34 +349,129 @@ class TestP2PNode(unittest.TestCase):
         self.held_output = StringIO()
         sys.stdout = self.held_output
 
+        mock_server.return_value.start_server = AsyncMock()
         self.mock_client_instance = mock_client.return_value
+        self.mock_client_instance.request_peers = AsyncMock()
+        self.mock_client_instance.request_tip = AsyncMock(return_value=None)
+        self.mock_client_instance.request_chain = AsyncMock(return_value=[])
+        self.mock_client_instance.broadcast_message = AsyncMock()
         self.mock_p2p_node = P2PNode('127.0.0.1', 5000)
-    
+
     def tearDown(self):
+        self.mock_p2p_node.loop.call_soon_threadsafe(self.mock_p2p_node.loop.stop)
         sys.stdout = sys.__stdout__
 
-    @patch('Network.Client')
-    @patch('Network.Server')
-    def test_join_network(self, mock_server, mock_client):
-        self.mock_client_instance.request_peers.return_value = None
+    def test_join_network(self):
+        self.mock_p2p_node.join_network('192.168.1.1', 5001)
+
+        self.mock_client_instance.request_peers.assert_awaited_once_with('192.168.1.1', 5001)
+        self.mock_client_instance.request_tip.assert_awaited_once_with('192.168.1.1', 5001)
+        self.mock_client_instance.request_chain.assert_awaited_once_with('192.168.1.1', 5001)
+
+    @patch('Network.ChainSync')
+    def test_join_network_headers_first(self, mock_chain_sync):
+        self.mock_client_instance.request_tip.return_value = (3, 'a' * 64)
+        mock_chain_sync.return_value.run = AsyncMock()
 
         self.mock_p2p_node.join_network('192.168.1.1', 5001)
 
-        self.mock_client_instance.request_peers.assert_called_once_with('192.168.1.1', 5001)
+        mock_chain_sync.return_value.run.assert_awaited_once_with({('192.168.1.1', 5001): (3, 'a' * 64)})
+        self.mock_client_instance.request_chain.assert_not_awaited()
 
-    @patch('Network.Client')
-    @patch('Network.Server')
-    def test_leave_network(self, mock_server, mock_client):
-        self.mock_client_instance.send_message_to_peer = MagicMock()
+    def test_leave_network(self):
+        self.mock_p2p_node.peers = {'192.168.1.1': 5001}
+        self.mock_p2p_node.server.close = AsyncMock()
+        self.mock_client_instance.close = AsyncMock()
 
         self.mock_p2p_node.leave_network()
 
-        for peer_ip_addr, peer_port in self.mock_p2p_node.peers.items():
-            self.mock_client_instance.send_message_to_peer.assert_any_call(
-                json.dumps({'type': 'LEAVE', 'ip_address': '127.0.0.1', 'port': 5000}),
-                peer_ip_addr,
-                peer_port
-            )
+        self.mock_client_instance.broadcast_message.assert_awaited_once_with(
+            {'type': 'LEAVE', 'ip_address': '127.0.0.1', 'port': 5000},
+            {'192.168.1.1': 5001}
+        )
+        self.mock_p2p_node.server.close.assert_awaited_once()
+
+class TestP2PNetwork(unittest.TestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+
+    def test_join_and_leave(self):
+        first_node = P2PNode('127.0.0.1', free_port())
+        second_node = P2PNode('127.0.0.2', free_port())
+
+        second_node.join_network('127.0.0.1', first_node.port)
+
+        self.assertEqual(first_node.peers, {'127.0.0.2': second_node.port})
+        self.assertEqual(second_node.peers, {'127.0.0.1': first_node.port})
+        self.assertEqual(first_node.get_peer_protocol('127.0.0.2', second_node.port), Protocol.BINARY)
+        self.assertEqual(second_node.get_peer_protocol('127.0.0.1', first_node.port), Protocol.BINARY)
+        self.assertEqual(second_node.blockchain.chain[0].hash, first_node.blockchain.chain[0].hash)
+
+        for i in range(0, 3):
+            first_node.run(first_node.client.broadcast_message({'type': 'PEERS_REQ'}, first_node.get_peers()))
+        self.assertEqual(list(first_node.client.pool.connections), [('127.0.0.2', second_node.port)])
+
+        second_node.leave_network()
+        time.sleep(0.2)
+        self.assertEqual(first_node.peers, {})
+        first_node.leave_network()
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return condition()
+
+    def test_new_block_is_announced(self):
+        first_node = P2PNode('127.0.0.1', free_port())
+        second_node = P2PNode('127.0.0.2', free_port())
+        second_node.join_network('127.0.0.1', first_node.port)
+
+        chain = first_node.blockchain.chain
+        block = Block(1, chain[-1].hash, time.time(), [])
+        block.mine_block(first_node.blockchain.difficulty)
+        first_node.blockchain.append_block(block)
+        self.assertEqual(first_node.split_peers(), ({'127.0.0.2': second_node.port}, {}))
+        first_node.announce_block()
+        self.assertTrue(self.wait_for(lambda: len(second_node.blockchain.chain) == 2))
+
+        self.assertEqual(second_node.blockchain.chain[-1].hash, block.hash)
+        second_node.leave_network()
+        first_node.leave_network()
+
+    def test_inventory_announced_in_both_directions(self):
+        first_node = P2PNode('127.0.0.1', free_port())
+        second_node = P2PNode('127.0.0.2', free_port())
+        second_node.join_network('127.0.0.1', first_node.port)
+        for node in (first_node, second_node):
+            node.client.pool.timeout = 3
+            # Delay before each fetch stands in for the network round trip, so both announcements cross on the wire
+            request_transactions = node.client.request_transactions
+            async def delayed_request_transactions(*args, request_transactions=request_transactions):
+                await asyncio.sleep(0.2)
+                return await request_transactions(*args)
+            node.client.request_transactions = delayed_request_transactions
+
+        wallet = Wallet()
+        transactions = [Transaction(wallet.get_public_key(), "recipient", 1, timestamp=i) for i in range(2)]
+        for transaction in transactions:
+            transaction.sign_transaction(wallet)
+        threads = [threading.Thread(target=node.add_new_transaction, args=(transaction,))
+                   for node, transaction in zip((first_node, second_node), transactions)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(self.wait_for(lambda: len(first_node.blockchain.mempool) == 2 and len(second_node.blockchain.mempool) == 2, timeout=2))
+        self.assertLess(time.monotonic() - start, 2)
+        second_node.leave_network()
+        first_node.leave_network()
 
 if __name__ == '__main__':
     unittest.main()
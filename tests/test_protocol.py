@@ -0,0 +1,169 @@
+import unittest
+from unittest.mock import patch
+import asyncio
+import json
+import sys
+from io import StringIO
+from Wallet import Wallet
+from Transaction import Transaction
+from Block import Block
+from Protocol import Protocol, FrameReader
+
+def stream_reader(data, chunk_size=7):
+    """ Stream that receives the data in small chunks, like a real connection would """
+    reader = asyncio.StreamReader()
+    for offset in range(0, len(data), chunk_size):
+        reader.feed_data(data[offset:offset + chunk_size])
+    reader.feed_eof()
+    return reader
+
+class TestProtocol(unittest.TestCase):
+    def setUp(self):
+        self.held_output = StringIO()
+        sys.stdout = self.held_output
+
+        self.wallet = Wallet()
+        self.recipient = Wallet()
+        self.transactions = []
+        for amount in [10, 2.5, -1]:
+            transaction = Transaction(self.wallet.get_public_key(), self.recipient.get_public_key().decode('utf-8'), amount)
+            transaction.sign_transaction(self.wallet)
+            self.transactions.append(transaction)
+        self.transactions.append(Transaction(self.wallet.get_public_key(), "DUMMY_RECIPIENT_KEY", 7))
+
+        genesis_block = Block(0, "0", 1.5, [])
+        block = Block(1, genesis_block.hash, 2.5, self.transactions)
+        block.mine_block(1)
+        self.chain_json = [genesis_block.to_json(), block.to_json()]
+
+    def tearDown(self):
+        sys.stdout = sys.__stdout__
+
+    def assert_round_trip(self, message):
+        encoded = Protocol.encode(message, Protocol.BINARY)
+        decoded, protocol = Protocol.decode(encoded)
+        self.assertEqual(protocol, Protocol.BINARY)
+        self.assertEqual(decoded, message)
+        return encoded
+
+    def test_control_messages(self):
+        self.assert_round_trip({'type': 'PEERS_REQ'})
+        self.assert_round_trip({'type': 'PEERS', 'peers': {'127.0.0.1': 5000, '10.0.0.2': 65535}})
+        self.assert_round_trip({'type': 'LEAVE', 'ip_address': '127.0.0.1', 'port': 5000})
+        self.assert_round_trip({'type': 'NEW_PEER', 'ip_address': '127.0.0.1', 'port': 5000})
+
+    def test_transaction_round_trip(self):
+        for transaction in self.transactions:
+            self.assert_round_trip({'type': 'NEW_TRANSACTION', 'transaction': transaction.to_json()})
+
+    def test_transaction_is_still_valid(self):
+        message = {'type': 'NEW_TRANSACTION', 'transaction': self.transactions[0].to_json()}
+        decoded, protocol = Protocol.decode(Protocol.encode(message, Protocol.BINARY))
+        self.assertTrue(Transaction.from_json(decoded['transaction']).is_valid())
+
+    def test_blockchain_round_trip(self):
+        message = {'type': 'BLOCKCHAIN', 'blockchain': self.chain_json}
+        encoded = self.assert_round_trip(message)
+        self.assertLess(len(encoded) * 3, len(Protocol.encode(message, Protocol.JSON)))
+
+    def test_inventory_messages(self):
+        block_hash = self.chain_json[1]['hash']
+        transaction_id = self.transactions[0].get_id()
+        self.assert_round_trip({'type': 'INV', 'ip_address': '127.0.0.1', 'port': 5000, 'blocks': [block_hash], 'transactions': [transaction_id]})
+        self.assert_round_trip({'type': 'GET_BLOCKS', 'locator': [block_hash, '0']})
+        self.assert_round_trip({'type': 'BLOCKS', 'blocks': self.chain_json[1:]})
+        self.assert_round_trip({'type': 'GET_TX', 'ids': [transaction_id]})
+        self.assert_round_trip({'type': 'TRANSACTIONS', 'transactions': [tx.to_json() for tx in self.transactions]})
+
+    def test_sync_messages(self):
+        header = Block.from_json(self.chain_json[1]).get_header()
+        self.assert_round_trip({'type': 'HELLO', 'ip_address': '127.0.0.1', 'port': 5000})
+        self.assert_round_trip({'type': 'CHAIN_TIP', 'height': 2, 'hash': header['hash'], 'work': 2 ** 200})
+        self.assert_round_trip({'type': 'GET_HEADERS', 'locator': [header['hash']]})
+        self.assert_round_trip({'type': 'HEADERS', 'headers': [header]})
+        self.assert_round_trip({'type': 'GET_BODIES', 'hashes': [header['hash']]})
+
+    def test_proof_messages(self):
+        block = Block.from_json(self.chain_json[1])
+        transaction_id = self.transactions[1].get_id()
+        proof = {'transaction_id': transaction_id, 'block_hash': block.hash, 'proof': [list(step) for step in block.get_merkle_proof(transaction_id)]}
+        self.assert_round_trip({'type': 'GET_PROOF', 'ids': [transaction_id]})
+        self.assert_round_trip({'type': 'PROOFS', 'proofs': [proof]})
+
+    def test_compact_fields(self):
+        public_key = self.wallet.get_public_key().decode('utf-8')
+        self.assertEqual(len(Protocol.compress_public_key(public_key)), 33)
+        self.assertIsNone(Protocol.compress_public_key("DUMMY_RECIPIENT_KEY"))
+        self.assertEqual(Protocol.expand_public_key(Protocol.compress_public_key(public_key)), public_key)
+
+    def test_json(self):
+        message = {'type': 'LEAVE', 'ip_address': '127.0.0.1', 'port': 5000}
+        encoded = Protocol.encode(message)
+        self.assertEqual(encoded, json.dumps(message).encode('utf-8'))
+        self.assertEqual(Protocol.decode(encoded), (message, Protocol.JSON))
+
+    def test_negotiate(self):
+        self.assertEqual(Protocol.negotiate({'type': 'PEERS_REQ'}), Protocol.JSON)
+        self.assertEqual(Protocol.negotiate({'type': 'PEERS_REQ', 'protocols': [0, 1]}), Protocol.BINARY)
+        self.assertEqual(Protocol.negotiate({'type': 'PEERS_REQ', 'protocols': [0, 7]}), Protocol.JSON)
+
+    def test_malformed(self):
+        encoded = Protocol.encode({'type': 'BLOCKCHAIN', 'blockchain': self.chain_json}, Protocol.BINARY)
+        with self.assertRaises(ValueError):
+            Protocol.decode(encoded[:-10])
+
+class TestFrameReader(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.large_message = {'type': 'PEERS', 'peers': {f'10.0.{i // 256}.{i % 256}': 5000 + i for i in range(0, 2000)}}
+
+    async def test_large_binary_frames(self):
+        frame = Protocol.encode_frame(self.large_message, Protocol.BINARY)
+        self.assertGreater(len(frame), 8192)
+        reader = FrameReader(stream_reader(frame + frame, chunk_size=1000), Protocol.MAX_FRAME_SIZE)
+
+        self.assertEqual(await reader.read_message(), (self.large_message, Protocol.BINARY))
+        self.assertEqual(await reader.read_message(), (self.large_message, Protocol.BINARY))
+        self.assertIsNone(await reader.read_message())
+
+    async def test_large_legacy_json(self):
+        data = Protocol.encode_frame(self.large_message, Protocol.JSON)
+        self.assertGreater(len(data), 8192)
+        reader = FrameReader(stream_reader(data, chunk_size=5000), Protocol.MAX_FRAME_SIZE)
+
+        self.assertEqual(await reader.read_message(), (self.large_message, Protocol.JSON))
+
+    async def test_legacy_json_brackets_in_strings(self):
+        message = {'type': 'LEAVE', 'ip_address': '{[\\"}]', 'port': 5000}
+        data = Protocol.encode_frame(message, Protocol.JSON)
+        reader = FrameReader(stream_reader(data, chunk_size=3), Protocol.MAX_FRAME_SIZE)
+
+        self.assertEqual(await reader.read_message(), (message, Protocol.JSON))
+
+    async def test_legacy_json_parsed_once(self):
+        data = Protocol.encode_frame(self.large_message, Protocol.JSON)
+        reader = FrameReader(stream_reader(data, chunk_size=100), Protocol.MAX_FRAME_SIZE)
+
+        with patch('Protocol.json.loads', wraps=json.loads) as mock_loads:
+            await reader.read_payload()
+        mock_loads.assert_called_once()
+
+    async def test_frame_too_large(self):
+        frame = Protocol.encode_frame(self.large_message, Protocol.BINARY)
+        reader = FrameReader(stream_reader(frame), 1000)
+        with self.assertRaises(ValueError):
+            await reader.read_message()
+
+    async def test_legacy_json_too_large(self):
+        data = Protocol.encode_frame(self.large_message, Protocol.JSON)
+        reader = FrameReader(stream_reader(data, chunk_size=500), 1000)
+        with self.assertRaises(ValueError):
+            await reader.read_message()
+
+    async def test_truncated_frame(self):
+        frame = Protocol.encode_frame(self.large_message, Protocol.BINARY)
+        reader = FrameReader(stream_reader(frame[:-1]), Protocol.MAX_FRAME_SIZE)
+        with self.assertRaises(ConnectionError):
+            await reader.read_message()
+
+if __name__ == '__main__':
+    unittest.main()
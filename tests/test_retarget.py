@@ -0,0 +1,60 @@
+import unittest
+from Retarget import Retarget
+from Difficulty import Difficulty
+
+class TestRetarget(unittest.TestCase):
+
+    def setUp(self):
+        self.initial = Difficulty.from_zero_bits(8)
+        self.retarget = Retarget(self.initial, block_interval=10, window=2)
+        self.previous_target = Difficulty.from_zero_bits(10).to_hex()
+
+    def timestamps(self, interval):
+        return lambda height: height * interval
+
+    def test_fixed_difficulty(self):
+        retarget = Retarget.of(2)
+        self.assertIs(Retarget.of(retarget), retarget)
+        self.assertEqual(retarget.get_difficulty(20, None, self.timestamps(1)), Difficulty.of(2))
+        self.assertEqual(retarget.get_difficulty(20, self.previous_target, self.timestamps(1)), Difficulty.from_zero_bits(10))
+
+    def test_previous_target_between_retargets(self):
+        self.assertFalse(self.retarget.is_retarget_height(2)) # First window starts after the genesis block
+        self.assertFalse(self.retarget.is_retarget_height(5))
+        self.assertEqual(self.retarget.get_difficulty(5, self.previous_target, self.timestamps(1)), Difficulty.from_zero_bits(10))
+        self.assertEqual(self.retarget.get_difficulty(1, None, self.timestamps(1)), self.initial)
+
+    def test_faster_blocks(self):
+        difficulty = self.retarget.get_difficulty(4, self.previous_target, self.timestamps(5))
+        self.assertEqual(difficulty, Difficulty(Difficulty.from_zero_bits(10).target // 2))
+
+    def test_adjustment_is_limited(self):
+        difficulty = self.retarget.get_difficulty(4, self.previous_target, self.timestamps(0))
+        self.assertEqual(difficulty, Difficulty(Difficulty.from_zero_bits(10).target // 4))
+        difficulty = self.retarget.get_difficulty(4, Difficulty.from_zero_bits(9).to_hex(), self.timestamps(1000))
+        self.assertEqual(difficulty, self.initial) # 4 times easier would be easier than the initial difficulty
+
+    def test_slower_blocks(self):
+        difficulty = self.retarget.get_difficulty(4, self.previous_target, self.timestamps(20))
+        self.assertEqual(difficulty, Difficulty(Difficulty.from_zero_bits(10).target * 2))
+
+    def test_unknown_timestamps(self):
+        self.assertIsNone(self.retarget.get_difficulty(4, self.previous_target, {3: 30}.get))
+
+    def test_median_time(self):
+        retarget = Retarget(1, median_span=3)
+        timestamps = {0: 10, 1: 40, 2: 20, 3: 30}
+        self.assertEqual(retarget.get_median_time(1, timestamps.get), 10)
+        self.assertEqual(retarget.get_median_time(4, timestamps.get), 30) # Median of 40, 20 and 30
+        self.assertIsNone(retarget.get_median_time(5, timestamps.get))
+
+    def test_expected(self):
+        self.assertEqual(self.retarget.expected(None, {}), (self.initial, 0)) # Genesis block
+        timestamps = {0: 0, 1: 5, 2: 10}
+        previous_header = {'index': 3, 'timestamp': 15, 'target': self.previous_target}
+        self.assertEqual(self.retarget.expected(previous_header, timestamps), (Difficulty(Difficulty.from_zero_bits(10).target // 2), 10))
+        self.assertEqual(timestamps[3], 15)
+        self.assertEqual(self.retarget.expected(previous_header, {})[0], None) # Timestamps needed for the retarget are missing
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
+import json
 import sys
 from io import StringIO
+from unittest.mock import patch
 from Wallet import Wallet
 from Transaction import Transaction
 
@@ -67,6 +69,73 @@ class TestTransaction(unittest.TestCase):
         new_transaction = Transaction.from_json(json_data)
         self.assertEqual(self.transaction, new_transaction)
 
+    def test_verify_batch(self):
+        transactions = []
+        for amount in range(0, 6):
+            transaction = Transaction(self.wallet.get_public_key(), self.recipient_public_key, amount)
+            transaction.sign_transaction(self.wallet)
+            transactions.append(transaction)
+        transactions[1].amount = 100 # Signature doesn't match anymore
+        transactions[2].signature = None
+        transactions[3].amount = -3
+        expected = [True, False, False, False, True, True]
+
+        self.assertEqual(Transaction.verify_batch(transactions), expected)
+        with patch.object(Transaction, 'PARALLEL_VERIFICATION_MIN_BATCH', 2):
+            self.assertEqual(Transaction.verify_batch(transactions, workers=2), expected)
+            pool = Transaction.get_verification_pool(2)
+            # Processes are reused by the next batch
+            self.assertEqual(Transaction.verify_batch(transactions, workers=2), expected)
+            self.assertIs(Transaction.get_verification_pool(2), pool)
+        Transaction.shutdown_verification_pool()
+        self.assertIsNot(Transaction.get_verification_pool(2), pool)
+        Transaction.shutdown_verification_pool()
+
+    def test_get_id(self):
+        self.transaction.sign_transaction(self.wallet)
+        self.assertEqual(len(self.transaction.get_id()), 64)
+        self.assertEqual(self.transaction.get_id(), Transaction.from_json(self.transaction.to_json()).get_id())
+        other_transaction = Transaction(self.wallet.get_public_key(), self.recipient_public_key, 11.0, timestamp=self.transaction.timestamp)
+        self.assertNotEqual(self.transaction.get_id(), other_transaction.get_id())
+
+    def test_transaction_data_is_cached(self):
+        transaction_id = self.transaction.get_id()
+        self.assertIsInstance(self.transaction.get_transaction_data(), bytes)
+        self.assertNotIn(b"b'", self.transaction.get_transaction_data()) # Not a repr of the key
+
+        with patch('hashlib.sha256') as mock_sha256:
+            self.assertEqual(self.transaction.get_id(), transaction_id)
+            mock_sha256.assert_not_called()
+
+        self.transaction.sign_transaction(self.wallet)
+        self.assertEqual(self.transaction.get_id(), transaction_id) # Signature isn't part of the signed data
+        self.transaction.amount = 11.0
+        self.assertNotEqual(self.transaction.get_id(), transaction_id)
+        self.assertFalse(self.transaction.is_valid())
+        self.transaction.amount = 10.0
+        self.assertEqual(self.transaction.get_id(), transaction_id)
+        self.assertTrue(self.transaction.is_valid())
+
+    def test_compact_representation(self):
+        received = Transaction.from_json(json.loads(json.dumps(self.transaction.to_json())))
+
+        self.assertFalse(hasattr(received, '__dict__'))
+        self.assertIs(received.sender_public_key_bytes, self.transaction.sender_public_key_bytes)
+        self.assertIs(received.recipient_public_key, self.transaction.recipient_public_key)
+
+    def test_fee(self):
+        paid_transaction = Transaction(self.wallet.get_public_key(), self.recipient_public_key, 10.0, timestamp=self.transaction.timestamp, fee=2)
+        paid_transaction.sign_transaction(self.wallet)
+
+        self.assertTrue(paid_transaction.is_valid())
+        self.assertNotEqual(paid_transaction.get_id(), self.transaction.get_id())
+        self.assertEqual(Transaction.from_json(paid_transaction.to_json()), paid_transaction)
+        paid_transaction.fee = 1 # Fee is signed
+        self.assertFalse(paid_transaction.is_valid())
+        paid_transaction.fee = -1
+        with self.assertRaises(Exception):
+            paid_transaction.is_valid()
+
     def test_str_representation(self):
         expected_str = (f"  Sender: {self.wallet.get_public_key()}\n"
                         f"  Recipient: {self.recipient_public_key}\n"
@@ -54,6 +54,24 @@ class TestWallet(unittest.TestCase):
         is_valid = Wallet.verify_signature(public_key_bytes, fake_transaction_data, signature)
         self.assertFalse(is_valid)
 
+    def test_public_key_cache(self):
+        """Test that parsed public keys are cached between verifications."""
+        Wallet.parse_public_key.cache_clear()
+        signature = self.wallet.sign_transaction("test_transaction")
+        public_key_bytes = self.wallet.get_public_key()
+
+        for i in range(0, 3):
+            self.assertTrue(Wallet.verify_signature(public_key_bytes, "test_transaction", signature))
+
+        cache_info = Wallet.public_key_cache_info()
+        self.assertEqual(cache_info.misses, 1)
+        self.assertEqual(cache_info.hits, 2)
+        self.assertEqual(cache_info.maxsize, Wallet.PUBLIC_KEY_CACHE_SIZE)
+
+    def test_get_public_key_memoized(self):
+        """Test that the PEM export is computed only once."""
+        self.assertIs(self.wallet.get_public_key(), self.wallet.get_public_key())
+
     def test_load_keys(self):
         """Test loading private and public keys from strings."""
         private_key_bytes = self.wallet.get_private_key()